@@ -0,0 +1,107 @@
+from __future__ import print_function, division, absolute_import
+
+import os
+import timeit
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from odin.fuel import MmapDict, SQLiteDict
+
+# 1M keys
+N = 1000000
+NB_LOOKUP = 100000
+keys = ['name%d' % i for i in range(N)]
+values = [(i, i + 12) for i in range(N)]
+lookup = [keys[i] for i in np.random.randint(0, N, size=NB_LOOKUP)]
+
+mmap_path = '/tmp/tmp.mmapdict'
+sqlite_path = '/tmp/tmp.db'
+sqlite_fast_path = '/tmp/tmp_fast.db'
+for path in (mmap_path, sqlite_path, sqlite_fast_path):
+    for ext in ('', '-wal', '-shm'):
+        if os.path.exists(path + ext):
+            os.remove(path + ext)
+
+# ====== writing ====== #
+start = timeit.default_timer()
+db = MmapDict(mmap_path)
+db.put_many(zip(keys, values))
+db.close()
+print('Writing MmapDict            :', timeit.default_timer() - start, 's')
+
+start = timeit.default_timer()
+db = SQLiteDict(sqlite_path)
+db.put_many(zip(keys, values))
+db.close()
+print('Writing SQLiteDict          :', timeit.default_timer() - start, 's')
+
+start = timeit.default_timer()
+db = SQLiteDict(sqlite_fast_path, read_optimized=True)
+db.put_many(zip(keys, values))
+db.close()
+print('Writing SQLiteDict(WAL)     :', timeit.default_timer() - start, 's')
+
+# ====== opening ====== #
+print()
+start = timeit.default_timer()
+mmap_db = MmapDict(mmap_path, read_only=True)
+print('Open MmapDict               :', timeit.default_timer() - start, 's')
+
+start = timeit.default_timer()
+sqlite_db = SQLiteDict(sqlite_path, read_only=True)
+print('Open SQLiteDict             :', timeit.default_timer() - start, 's')
+
+start = timeit.default_timer()
+sqlite_fast_db = SQLiteDict(sqlite_fast_path, read_only=True, read_optimized=True)
+print('Open SQLiteDict(WAL)        :', timeit.default_timer() - start, 's')
+
+# ====== single lookup ====== #
+print()
+for name, db in (('MmapDict', mmap_db),
+                 ('SQLiteDict', sqlite_db),
+                 ('SQLiteDict(WAL)', sqlite_fast_db)):
+    start = timeit.default_timer()
+    for k in lookup:
+        v = db[k]
+    print('%-28s:' % ('Lookup %s' % name), timeit.default_timer() - start, 's')
+
+# ====== batch lookup ====== #
+print()
+for name, db in (('MmapDict', mmap_db),
+                 ('SQLiteDict', sqlite_db),
+                 ('SQLiteDict(WAL)', sqlite_fast_db)):
+    start = timeit.default_timer()
+    for i in range(0, NB_LOOKUP, 1000):
+        v = db.get_many(lookup[i:i + 1000])
+    print('%-28s:' % ('Batch lookup %s' % name), timeit.default_timer() - start, 's')
+
+# ====== concurrent lookup (4 threads) ====== #
+print()
+pool = ThreadPool(4)
+for name, db in (('MmapDict', mmap_db),
+                 ('SQLiteDict(WAL)', sqlite_fast_db)):
+    def job(k):
+        return [db[i] for i in k]
+    start = timeit.default_timer()
+    pool.map(job, [lookup[i::4] for i in range(4)])
+    print('%-28s:' % ('Threads lookup %s' % name), timeit.default_timer() - start, 's')
+pool.close()
+
+print()
+print('Test correctness of stored data')
+print('MmapDict       :', mmap_db.get_many(lookup[:1000]) ==
+      [values[int(k[4:])] for k in lookup[:1000]])
+print('SQLiteDict     :', sqlite_db.get_many(lookup[:1000]) ==
+      [values[int(k[4:])] for k in lookup[:1000]])
+
+# ===========================================================================
+# Clean-up
+# ===========================================================================
+mmap_db.close()
+sqlite_db.close()
+sqlite_fast_db.close()
+for path in (mmap_path, sqlite_path, sqlite_fast_path):
+    for ext in ('', '-wal', '-shm'):
+        if os.path.exists(path + ext):
+            os.remove(path + ext)
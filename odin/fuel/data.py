@@ -5,17 +5,21 @@ from __future__ import print_function, division, absolute_import
 
 import os
 import re
+import mmap
+import zlib
+import struct
 import marshal
 from math import ceil
 from abc import ABCMeta, abstractmethod
-from six import add_metaclass
+from six import add_metaclass, integer_types
 from six.moves import range, zip, zip_longest
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 
 from odin.utils.decorators import autoattr
-from odin.utils import queue, struct, as_tuple, cache_memory, is_string
+from odin.utils import queue, as_tuple, cache_memory, is_string, async
 
 __all__ = [
     'as_data',
@@ -26,9 +30,12 @@ __all__ = [
     'Data',
     'NdarrayData',
     'MmapData',
+    'AttachedMmapData',
     'Hdf5Data',
     'DataIterator',
-    'DataMerge'
+    'DataMerge',
+    'LazyData',
+    'ShardedData'
 ]
 
 # ===========================================================================
@@ -113,16 +120,90 @@ def _validate_operate_axis(axis):
     return axis
 
 
+def _identity(x):
+    return x
+
+
 # x can be percantage or number of samples
 _apply_approx = lambda n, x: int(round(n * x)) if x < 1. + 1e-12 else int(x)
 
 
+def _is_indices(y):
+    ''' True if `y` is a 1-D list or array of integer row indices '''
+    if isinstance(y, (tuple, list)):
+        # bool is subclass of int, but a list of bool is a mask
+        return len(y) > 0 and \
+            all(isinstance(i, (integer_types, np.integer)) and
+                not isinstance(i, (bool, np.bool_)) for i in y)
+    return isinstance(y, np.ndarray) and y.ndim == 1 and y.dtype.kind in 'iu'
+
+
+def _coalesce_indices(indices, n, max_gap=0):
+    ''' Sort and remove duplicated row indices, then group them into
+    contiguous runs, each run can be read by a single slice.
+
+    Return
+    ------
+    unique: sorted unique indices
+    inverse: position of each requested index in `unique`
+    runs: list of (start, end, i, j), rows `start:end` are read from the
+        data, and provide the values for `unique[i:j]`
+    '''
+    indices = np.asarray(indices).ravel().astype('int64')
+    if indices.size > 0:
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.min() < 0 or indices.max() >= n:
+            raise IndexError('Indices out of range for data with %d rows' % n)
+    unique, inverse = np.unique(indices, return_inverse=True)
+    # new run whenever the gap between 2 sorted indices excess `max_gap`
+    bounds = np.nonzero(np.diff(unique) > max_gap + 1)[0] + 1
+    bounds = [0] + bounds.tolist() + [len(unique)]
+    runs = [(int(unique[i]), int(unique[j - 1]) + 1, i, j)
+            for i, j in zip(bounds, bounds[1:]) if j > i]
+    return unique, inverse.ravel(), runs
+
+
+def _gather(data, indices, max_gap=0, ncpu=1):
+    ''' Read the rows of `data` given by `indices` with minimal number of
+    slicing calls, then return them in the requested order '''
+    unique, inverse, runs = _coalesce_indices(indices, data.shape[0], max_gap)
+    out = np.empty((len(unique),) + tuple(data.shape[1:]), dtype=data.dtype)
+
+    def read_run(r):
+        start, end, i, j = r
+        if end - start == j - i: # fully contiguous, read straight to output
+            if hasattr(data, 'read_direct'): # h5py.Dataset
+                data.read_direct(out, np.s_[start:end], np.s_[i:j])
+            else:
+                out[i:j] = data[start:end]
+        else: # contain small gaps, read the whole block then pick the rows
+            out[i:j] = data[start:end][unique[i:j] - start]
+    # ====== read all runs ====== #
+    ncpu = min(int(ncpu), len(runs))
+    if ncpu > 1:
+        pool = ThreadPool(processes=ncpu)
+        pool.map(read_run, runs)
+        pool.close(); pool.join()
+    else:
+        for r in runs:
+            read_run(r)
+    # ====== scatter back to the requested order ====== #
+    if len(inverse) == len(unique) and \
+    np.all(inverse == np.arange(len(inverse))):
+        return out # sorted and no duplication
+    return out[inverse]
+
+
 # ===========================================================================
 # Data
 # ===========================================================================
 @add_metaclass(ABCMeta)
 class Data(object):
 
+    # `ndarray op Data` is deferred to the (lazy) reflected operators of Data,
+    # numpy ufunc (e.g. np.log(data)) still reads the array via `__array__`
+    __array_priority__ = 100
+
     def __init__(self):
         # batch information
         self._batch_size = 256
@@ -134,10 +215,13 @@ class Data(object):
         # main data object that have shape, dtype ...
         self._data = None
 
-        self._transformer = lambda x: x
+        # module-level function, so the default transformer is picklable
+        self._transformer = _identity
 
     # ====== transformer ====== #
     def transform(self, transformer):
+        """ Set the function applied to every returned array (in-place),
+        see `Data.apply` for a deferred element-wise function """
         if callable(transformer):
             self._transformer = transformer
         return self
@@ -259,6 +343,10 @@ class Data(object):
             return [self._transformer(dat[:]) for dat in self._data]
         return self._transformer(self._data[:])
 
+    def __array__(self, dtype=None):
+        array = np.asarray(self[:])
+        return array if dtype is None else array.astype(dtype)
+
     def tolist(self):
         array = self.array
         if isinstance(array, (tuple, list)):
@@ -310,11 +398,41 @@ class Data(object):
 
     # ==================== Slicing methods ==================== #
     def __getitem__(self, y):
+        if _is_indices(y):
+            return self.gather(y)
         if isinstance(self._data, (tuple, list)):
             return [self._transformer(dat.__getitem__(y))
                     for dat in self._data]
         return self._transformer(self._data.__getitem__(y))
 
+    def gather(self, indices, max_gap=0, ncpu=1):
+        """ Batched fancy-indexing along the first dimension.
+        The requested rows are sorted and coalesced into contiguous runs,
+        each run is read by a single slice, then all rows are scattered back
+        to the requested order.
+
+        Parameters
+        ----------
+        indices: list, ndarray
+            row indices in arbitrary order, duplicated and negative
+            indices are accepted.
+        max_gap: int
+            two runs are merged into single read if there are at most
+            `max_gap` unrequested rows between them (trade extra bytes
+            for fewer seek and read calls).
+        ncpu: int
+            number of threads for reading the runs in parallel.
+
+        Return
+        ------
+        ndarray (or list of ndarray if this Data contains list of data)
+        rows in the same order as given `indices`
+        """
+        if isinstance(self._data, (tuple, list)):
+            return [self._transformer(_gather(dat, indices, max_gap, ncpu))
+                    for dat in self._data]
+        return self._transformer(_gather(self._data, indices, max_gap, ncpu))
+
     @autoattr(_status=lambda x: x + 1)
     def __setitem__(self, x, y):
         if isinstance(self._data, (tuple, list)):
@@ -420,6 +538,68 @@ class Data(object):
     def close(self):
         pass
 
+    def shared(self):
+        """ Return a read-only handle of this Data which is safe and cheap
+        to be inherited by forked processes (e.g. Feeder workers) """
+        return self
+
+    # ==================== lazy operators ==================== #
+    def apply(self, func):
+        """ Return a deferred Data of element-wise `func(x)` (e.g. np.log),
+        evaluated blockwise when sliced, iterated or reduced """
+        return LazyData(func, (self,))
+
+    def __add__(self, y):
+        return LazyData(np.add, (self, y))
+
+    def __radd__(self, y):
+        return LazyData(np.add, (y, self))
+
+    def __sub__(self, y):
+        return LazyData(np.subtract, (self, y))
+
+    def __rsub__(self, y):
+        return LazyData(np.subtract, (y, self))
+
+    def __mul__(self, y):
+        return LazyData(np.multiply, (self, y))
+
+    def __rmul__(self, y):
+        return LazyData(np.multiply, (y, self))
+
+    def __div__(self, y):
+        return LazyData(np.divide, (self, y))
+
+    def __rdiv__(self, y):
+        return LazyData(np.divide, (y, self))
+
+    def __truediv__(self, y):
+        return LazyData(np.true_divide, (self, y))
+
+    def __rtruediv__(self, y):
+        return LazyData(np.true_divide, (y, self))
+
+    def __floordiv__(self, y):
+        return LazyData(np.floor_divide, (self, y))
+
+    def __rfloordiv__(self, y):
+        return LazyData(np.floor_divide, (y, self))
+
+    def __pow__(self, y):
+        return LazyData(np.power, (self, y))
+
+    def __rpow__(self, y):
+        return LazyData(np.power, (y, self))
+
+    def __neg__(self):
+        return LazyData(np.negative, (self,))
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return LazyData(np.abs, (self,))
+
     # ==================== high-level operators ==================== #
     @abstractmethod
     def sum(self, axis=0):
@@ -532,7 +712,7 @@ class MutableData(Data):
         ops = lambda x, axis: np.max(x, axis=axis)
         results = self._iterating_operator(ops, axis,
             merge_func=lambda x: np.where(x[0] > x[1], x[0], x[1]),
-            init_val=float('-inf'))[0]
+            init_val=float('-inf'))
 
         if isinstance(self._data, (tuple, list)):
             return [i[0] for i in results]
@@ -584,30 +764,6 @@ class MutableData(Data):
         raise NotImplementedError
 
     # ==================== low-level operator ==================== #
-    def __add__(self, y):
-        return self.array.__add__(y)
-
-    def __sub__(self, y):
-        return self.array.__sub__(y)
-
-    def __mul__(self, y):
-        return self.array.__mul__(y)
-
-    def __div__(self, y):
-        return self.array.__div__(y)
-
-    def __floordiv__(self, y):
-        return self.array.__floordiv__(y)
-
-    def __pow__(self, y):
-        return self.array.__pow__(y)
-
-    def __neg__(self):
-        return self.array.__neg__()
-
-    def __pos__(self):
-        return self.array.__pos__()
-
     def __iadd__(self, y):
         raise NotImplementedError
 
@@ -737,6 +893,72 @@ class NdarrayData(Data):
 # ===========================================================================
 MAX_OPEN_MMAP = 120
 
+# access pattern -> (mmap.madvise option, os.posix_fadvise option)
+ACCESS_PATTERN = {
+    'normal': ('MADV_NORMAL', 'POSIX_FADV_NORMAL'),
+    'sequential': ('MADV_SEQUENTIAL', 'POSIX_FADV_SEQUENTIAL'),
+    'random': ('MADV_RANDOM', 'POSIX_FADV_RANDOM'),
+    'willneed': ('MADV_WILLNEED', 'POSIX_FADV_WILLNEED'),
+    'dontneed': ('MADV_DONTNEED', 'POSIX_FADV_DONTNEED'),
+}
+
+
+# path -> (file size, read-only numpy.memmap), shared by all read-only
+# handles in this process and inherited (without copying) by forked workers,
+# at most MAX_OPEN_MMAP least recently attached files are cached, the entry
+# is evicted when the file is closed (the returned handles stay valid)
+_SHARED_MMAP = OrderedDict()
+
+
+def _prefault(x):
+    ''' touch one byte in every page of given contiguous array '''
+    x = x.reshape(-1).view(np.uint8)
+    return int(np.sum(x[::mmap.PAGESIZE], dtype='int64'))
+
+
+# state of each checksum chunk
+_CRC_UNVERIFIED = 0 # changed since the last verification
+_CRC_VERIFIED = 1
+_CRC_UNKNOWN = 2 # written without checksum, e.g. old file
+# |'ODINCRC1'|rows_per_chunk|nb_chunks|crc32 (uint32) ...|state (uint8) ...|
+_CHECKSUM_MAGIC = 'ODINCRC1'
+_CHECKSUM_HEADER = struct.Struct('<QQ')
+
+
+def _rows_of_index(x, n):
+    ''' the range of rows [start, end) modified by `data[x] = y` '''
+    if isinstance(x, tuple):
+        x = x[0] if len(x) > 0 else slice(None)
+    if isinstance(x, (int, np.integer)):
+        x = int(x) + n if x < 0 else int(x)
+        return x, x + 1
+    if isinstance(x, slice):
+        start, stop, step = x.indices(n)
+        if step < 0:
+            start, stop = stop + 1, start + 1
+        return start, max(start, stop)
+    try:
+        x = np.asarray(x)
+        if x.dtype == np.bool_:
+            x = np.nonzero(x)[0]
+        if x.size == 0:
+            return 0, 0
+        x = np.where(x < 0, x + n, x)
+        return int(x.min()), int(x.max()) + 1
+    except Exception:
+        return 0, n
+
+
+def _merge_ranges(ranges):
+    ''' merge overlapped or adjacent (start, end) ranges '''
+    merged = []
+    for start, end in sorted(ranges):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
 
 def _aligned_memmap_offset(dtype):
     header_size = len(MmapData.HEADER) + 8 + MmapData.MAXIMUM_HEADER_SIZE
@@ -745,7 +967,203 @@ def _aligned_memmap_offset(dtype):
     return int(n * type_size)
 
 
-class MmapData(Data):
+class _MmapAccess(object):
+    """ Access pattern hints, warming and checksum verification of a memory
+    mapped file, shared by `MmapData` and `AttachedMmapData` """
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def name(self):
+        return os.path.basename(self._path)
+
+    # ==================== Access pattern ==================== #
+    def _rows_range(self, start, end):
+        n = self._data.shape[0]
+        start = 0 if start is None else min(max(int(start), 0), n)
+        end = n if end is None else min(max(int(end), 0), n)
+        return start, end
+
+    def advise(self, pattern, start=None, end=None):
+        """ Give the kernel a hint about how the rows in [start, end) will
+        be accessed, using `mmap.madvise` where available, otherwise,
+        fallback to `os.posix_fadvise` on the file, or do nothing.
+
+        Parameters
+        ----------
+        pattern: str
+            'normal', 'sequential' (aggressive readahead for epoch scans),
+            'random' (no readahead for shuffled access), 'willneed'
+            (start reading the pages in the background), 'dontneed'
+            (the pages can be dropped from the page cache)
+        start: int, None
+            first row, None means 0
+        end: int, None
+            ending row (exclusive), None means the last row
+        """
+        pattern = str(pattern).lower()
+        if pattern not in ACCESS_PATTERN:
+            raise ValueError("Only support access pattern: %s; but given: '%s'"
+                             % (', '.join(sorted(ACCESS_PATTERN.keys())), pattern))
+        madv, fadv = ACCESS_PATTERN[pattern]
+        start, end = self._rows_range(start, end)
+        m = getattr(self._data, '_mmap', None)
+        if end <= start or m is None:
+            return self
+        # ====== byte range of the rows ====== #
+        row_bytes = self._data.itemsize * int(np.prod(self._data.shape[1:]))
+        offset = self._data.offset + start * row_bytes
+        length = (end - start) * row_bytes
+        if hasattr(m, 'madvise') and hasattr(mmap, madv):
+            # numpy maps the file from the closest allocation granularity
+            begin = (self._data.offset % mmap.ALLOCATIONGRANULARITY +
+                     start * row_bytes)
+            aligned = begin - begin % mmap.PAGESIZE
+            m.madvise(getattr(mmap, madv), aligned, length + begin - aligned)
+        elif hasattr(os, 'posix_fadvise') and hasattr(os, fadv):
+            f = getattr(self, '_file', None)
+            if f is not None:
+                os.posix_fadvise(f.fileno(), offset, length, getattr(os, fadv))
+            else: # attached handle keeps no file descriptor
+                with open(self._path, 'rb') as f:
+                    os.posix_fadvise(f.fileno(), offset, length,
+                                     getattr(os, fadv))
+        return self
+
+    def warm(self, start=None, end=None):
+        """ Pre-fault the pages of rows [start, end) in a background thread,
+        so the following reading of these rows does not block on disk.
+
+        Return
+        ------
+        async task, call `.get()` to wait for the warming to finish
+        """
+        start, end = self._rows_range(start, end)
+        self.advise('willneed', start, end)
+        task = async(_prefault)(self._data[start:end])
+        self._warm_tasks = [t for t in self._warm_tasks if not t.finished]
+        self._warm_tasks.append(task)
+        return task
+
+    def _wait_warm_tasks(self):
+        # the mmap cannot be closed while a thread is reading it
+        for t in self._warm_tasks:
+            try:
+                t.get()
+            except Exception:
+                pass
+        self._warm_tasks = []
+
+    # ==================== Checksum ==================== #
+    @property
+    def checksum_path(self):
+        return self._path + MmapData.CHECKSUM_EXT
+
+    def _load_checksum(self):
+        row_bytes = self._data.itemsize * int(np.prod(self._data.shape[1:]))
+        self._crc_rows = max(MmapData.CHECKSUM_SIZE // max(row_bytes, 1), 1)
+        self._crc = np.zeros((0,), dtype='uint32')
+        self._crc_state = np.zeros((0,), dtype='uint8')
+        self._crc_dirty = set()
+        try:
+            with open(self.checksum_path, 'rb') as f:
+                if f.read(len(_CHECKSUM_MAGIC)) == _CHECKSUM_MAGIC:
+                    rows, n = _CHECKSUM_HEADER.unpack(
+                        f.read(_CHECKSUM_HEADER.size))
+                    crc = np.frombuffer(f.read(4 * n), dtype='uint32')
+                    state = np.frombuffer(f.read(n), dtype='uint8')
+                    if len(crc) == n and len(state) == n:
+                        self._crc_rows = int(rows)
+                        self._crc = crc.copy()
+                        self._crc_state = state.copy()
+        except (IOError, OSError, struct.error):
+            pass
+        self._resize_checksum()
+
+    def _resize_checksum(self):
+        # new chunks (e.g. file modified by old version) have no checksum
+        n = int(ceil(self._data.shape[0] / self._crc_rows))
+        if n > len(self._crc):
+            self._crc = np.concatenate(
+                [self._crc, np.zeros((n - len(self._crc),), dtype='uint32')])
+            self._crc_state = np.concatenate(
+                [self._crc_state, np.full((n - len(self._crc_state),),
+                                          _CRC_UNKNOWN, dtype='uint8')])
+
+    def _save_checksum(self):
+        # error is ignored (e.g. read-only file system)
+        tmp = self.checksum_path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(_CHECKSUM_MAGIC)
+                f.write(_CHECKSUM_HEADER.pack(self._crc_rows, len(self._crc)))
+                f.write(self._crc.astype('<u4').tobytes())
+                f.write(self._crc_state.tobytes())
+            os.rename(tmp, self.checksum_path)
+        except (IOError, OSError):
+            pass
+
+    def _chunk_crc(self, i):
+        start = i * self._crc_rows
+        x = np.ascontiguousarray(self._data[start:start + self._crc_rows])
+        return zlib.crc32(x) & 0xffffffff
+
+    def verify(self, full=False, ncpu=1):
+        """ Verify the rows on disk against the checksums recorded when they
+        were written, only the chunks changed since the last verification
+        are read, unless `full=True`.
+        The chunks written without checksum (e.g. by old version) are
+        accepted, and their checksums are recorded for the next time
+        (the checksum file is never written by read-only handle).
+
+        Parameters
+        ----------
+        full: bool
+            if True, verify all chunks
+        ncpu: int
+            number of threads for reading the chunks in parallel
+
+        Return
+        ------
+        list of (start, end), the corrupted rows in range [start, end)
+        """
+        if not self.read_only:
+            self.flush()
+        self._resize_checksum()
+        n = self._data.shape[0]
+        if full:
+            chunks = list(range(len(self._crc)))
+        else:
+            chunks = np.nonzero(self._crc_state != _CRC_VERIFIED)[0].tolist()
+        if len(chunks) == 0:
+            return []
+        # ====== read the chunks in parallel ====== #
+        ncpu = min(max(int(ncpu), 1), len(chunks))
+        if ncpu > 1:
+            pool = ThreadPool(processes=ncpu)
+            crcs = pool.map(self._chunk_crc, chunks)
+            pool.close(); pool.join()
+        else:
+            crcs = [self._chunk_crc(i) for i in chunks]
+        # ====== compare ====== #
+        corrupted = []
+        for i, crc in zip(chunks, crcs):
+            if self._crc_state[i] == _CRC_UNKNOWN or crc == self._crc[i]:
+                self._crc[i] = crc
+                self._crc_state[i] = _CRC_VERIFIED
+            else:
+                self._crc_state[i] = _CRC_UNVERIFIED
+                corrupted.append((i * self._crc_rows,
+                                  min((i + 1) * self._crc_rows, n)))
+        # read-only handle keeps the states in memory only
+        if not self.read_only:
+            self._save_checksum()
+        return _merge_ranges(corrupted)
+
+
+class MmapData(_MmapAccess, Data):
 
     """Create a memory-map to an array stored in a *binary* file on disk.
 
@@ -771,10 +1189,15 @@ class MmapData(Data):
     Note
     ----
     This class always read MmapData with mode=r+
+    The CRC32 of every chunk of rows (`CHECKSUM_SIZE` bytes) is recorded in
+    the sidecar file `path + CHECKSUM_EXT`, the checksums of changed chunks
+    are updated on `flush`, see `MmapData.verify`.
     """
     _INSTANCES = OrderedDict()
     HEADER = 'mmapdata'
     MAXIMUM_HEADER_SIZE = 486
+    CHECKSUM_EXT = '.crc'
+    CHECKSUM_SIZE = 4 * 1024 * 1024 # in bytes
 
     @staticmethod
     def read_header(path, mode, return_file):
@@ -799,6 +1222,33 @@ class MmapData(Data):
         f.close()
         return dtype, shape
 
+    @staticmethod
+    def attach(path):
+        """ Attach a read-only handle to the MmapData file at given `path`.
+        The mapping is opened with mode='r' without keeping any file
+        descriptor, and it is cached per file, so all handles (including the
+        ones inherited by forked processes) share a single mapping, the
+        header is only parsed again when the file size changed.
+
+        Return
+        ------
+        AttachedMmapData wraps the shared read-only `numpy.memmap`
+        """
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        cache = _SHARED_MMAP.pop(path, None)
+        if cache is not None and cache[0] == size:
+            array = cache[1]
+        else:
+            dtype, shape = MmapData.read_header(path, mode='r',
+                                                return_file=False)
+            array = np.memmap(path, dtype=dtype, shape=tuple(shape), mode='r',
+                              offset=_aligned_memmap_offset(dtype))
+        _SHARED_MMAP[path] = (size, array)
+        while len(_SHARED_MMAP) > MAX_OPEN_MMAP:
+            _SHARED_MMAP.popitem(last=False)
+        return AttachedMmapData(path, array)
+
     def __new__(clazz, *args, **kwargs):
         path = kwargs.get('path', None)
         if path is None:
@@ -831,7 +1281,8 @@ class MmapData(Data):
                 shape = (shape,)
             shape = tuple([0 if i is None or i < 0 else i for i in shape])
         # read exist file
-        if os.path.exists(path):
+        is_new = not os.path.exists(path)
+        if not is_new:
             dtype, shape, f = MmapData.read_header(path, mode=mode,
                                                    return_file=True)
         # create new file
@@ -859,11 +1310,18 @@ class MmapData(Data):
         self._data = np.memmap(f, dtype=dtype, shape=shape, mode=mode,
                                offset=_aligned_memmap_offset(dtype))
         self._path = path
+        self._warm_tasks = []
+        # ====== checksum ====== #
+        self._load_checksum()
+        if is_new:
+            self._mark_dirty()
 
     def close(self):
+        _SHARED_MMAP.pop(self.path, None)
         # Check if exist global instance
         if self.path in MmapData._INSTANCES:
             del MmapData._INSTANCES[self.path]
+            self._wait_warm_tasks()
             # flush in read-write mode
             if not self.read_only:
                 self.flush()
@@ -873,14 +1331,6 @@ class MmapData(Data):
             self._file.close()
 
     # ==================== properties ==================== #
-    @property
-    def path(self):
-        return self._path
-
-    @property
-    def name(self):
-        return os.path.basename(self.path)
-
     def __str__(self):
         return '<MMAP dataset "%s": shape %s, type "<%s">' % \
         (self.name, self.shape, self.dtype)
@@ -945,64 +1395,84 @@ class MmapData(Data):
         std = std if std is not None else self.std(axis)
         self._data -= mean
         self._data /= std
+        self._mark_dirty()
         return self
 
     # ==================== Special operators ==================== #
-    def __add__(self, y):
-        return self._data.__add__(y)
-
-    def __sub__(self, y):
-        return self._data.__sub__(y)
-
-    def __mul__(self, y):
-        return self._data.__mul__(y)
-
-    def __div__(self, y):
-        return self._data.__div__(y)
-
-    def __floordiv__(self, y):
-        return self._data.__floordiv__(y)
-
-    def __pow__(self, y):
-        return self._data.__pow__(y)
-
     @autoattr(_status=lambda x: x + 1)
     def __iadd__(self, y):
         self._data.__iadd__(y)
+        self._mark_dirty()
         return self
 
     @autoattr(_status=lambda x: x + 1)
     def __isub__(self, y):
         self._data.__isub__(y)
+        self._mark_dirty()
         return self
 
     @autoattr(_status=lambda x: x + 1)
     def __imul__(self, y):
         self._data.__imul__(y)
+        self._mark_dirty()
         return self
 
     @autoattr(_status=lambda x: x + 1)
     def __idiv__(self, y):
         self._data.__idiv__(y)
+        self._mark_dirty()
         return self
 
     @autoattr(_status=lambda x: x + 1)
     def __ifloordiv__(self, y):
         self._data.__ifloordiv__(y)
+        self._mark_dirty()
         return self
 
     @autoattr(_status=lambda x: x + 1)
     def __ipow__(self, y):
+        self._mark_dirty()
         return self._data.__ipow__(y)
 
-    def __neg__(self):
-        self._data.__neg__()
+    # ==================== manipulation ==================== #
+    @autoattr(_status=lambda x: x + 1)
+    def __setitem__(self, x, y):
+        self._data.__setitem__(x, y)
+        self._mark_dirty(*_rows_of_index(x, self._data.shape[0]))
+
+    def append(self, *arrays):
+        n = self._data.shape[0]
+        super(MmapData, self).append(*arrays)
+        # the first row is overwritten if it is the temporary row
+        self._mark_dirty(max(n - 1, 0), self._data.shape[0])
         return self
 
-    def __pos__(self):
-        self._data.__pos__()
+    def prepend(self, *arrays):
+        super(MmapData, self).prepend(*arrays)
+        self._mark_dirty(0, sum(a.shape[0] for a in arrays
+                                if hasattr(a, 'shape')))
         return self
 
+    # ==================== Checksum ==================== #
+    def _mark_dirty(self, start=0, end=None):
+        ''' the checksum of the chunks contain rows [start, end) will be
+        updated on `flush` '''
+        end = self._data.shape[0] if end is None else end
+        if end > start:
+            self._crc_dirty.update(range(start // self._crc_rows,
+                                         (end - 1) // self._crc_rows + 1))
+
+    def _update_checksum(self):
+        if len(self._crc_dirty) == 0:
+            return
+        self._resize_checksum()
+        for i in sorted(self._crc_dirty):
+            if i < len(self._crc):
+                self._crc[i] = self._chunk_crc(i)
+                self._crc_state[i] = _CRC_UNVERIFIED
+        self._crc_dirty = set()
+        self._save_checksum()
+
     # ==================== Save ==================== #
     def resize(self, shape):
         if self.read_only:
@@ -1032,16 +1502,53 @@ class MmapData(Data):
         f.write(meta)
         f.flush()
         # extend the memmap
+        self._wait_warm_tasks()
         mmap._mmap.close()
         del self._data
+        old_size = mmap.shape[0]
         self._data = np.memmap(self._path, dtype=dtype, shape=shape,
                                mode='r+', offset=_aligned_memmap_offset(dtype))
+        self._mark_dirty(old_size, shape[0])
         return self
 
     def flush(self):
         if self.read_only:
             return
         self._data.flush()
+        self._update_checksum()
+
+    def shared(self):
+        """ Return a read-only handle to this file, see `MmapData.attach` """
+        self.flush()
+        data = MmapData.attach(self.path)
+        data._transformer = self._transformer
+        return data
+
+
+class AttachedMmapData(_MmapAccess, NdarrayData):
+    """ Read-only handle of a MmapData file returned by `MmapData.attach`
+    and `MmapData.shared`, the rows are read from the `numpy.memmap` shared
+    by all handles of the file (also inherited by forked processes), and
+    `advise`, `warm` and `verify` act on this shared mapping. """
+
+    def __init__(self, path, array):
+        super(AttachedMmapData, self).__init__(array)
+        self._path = path
+        self.read_only = True
+        self._warm_tasks = []
+
+    def resize(self, shape):
+        raise RuntimeError('Cannot resize read-only AttachedMmapData.')
+
+    def verify(self, full=False, ncpu=1):
+        # the checksums are only loaded when needed
+        if not hasattr(self, '_crc'):
+            self._load_checksum()
+        return super(AttachedMmapData, self).verify(full=full, ncpu=ncpu)
+
+    def __str__(self):
+        return '<Attached MMAP dataset "%s": shape %s, type "<%s">' % \
+        (self.name, self.shape, self.dtype)
 
 
 # ===========================================================================
@@ -1073,6 +1580,22 @@ def get_all_hdf_dataset(hdf, fileter_func=None, path='/'):
 
 
 _HDF5 = {}
+# path -> process ID which opened the cached h5py.File
+_HDF5_OWNER = {}
+# h5py.File inherited from parent process, we keep the references because
+# closing them in the forked process could write to the parent's file.
+_HDF5_INHERITED = []
+
+
+def _h5py_file(path, mode):
+    # file locking prevents opening (read-only) a file which is opened
+    # for writing by the parent process
+    if mode == 'r':
+        try:
+            return h5py.File(path, mode=mode, locking=False)
+        except TypeError: # old h5py does not support `locking`
+            pass
+    return h5py.File(path, mode=mode)
 
 
 def open_hdf5(path, read_only=False):
@@ -1103,14 +1626,20 @@ def open_hdf5(path, read_only=False):
     '''
     key = os.path.abspath(path)
     mode = 'r' if read_only else 'a'
+    pid = os.getpid()
+    # h5py handles are not fork-safe, never reuse the parent's handle
+    if key in _HDF5 and _HDF5_OWNER.get(key, pid) != pid:
+        _HDF5_INHERITED.append(_HDF5.pop(key))
 
     if key in _HDF5:
         f = _HDF5[key]
         if 'Closed' in str(f):
-            f = h5py.File(path, mode=mode)
+            f = _h5py_file(path, mode=mode)
+            _HDF5[key] = f
     else:
-        f = h5py.File(path, mode=mode)
+        f = _h5py_file(path, mode=mode)
         _HDF5[key] = f
+    _HDF5_OWNER[key] = pid
     return f
 
 
@@ -1126,6 +1655,14 @@ def close_all_hdf5():
 
 class Hdf5Data(Data):
 
+    """
+    Note
+    ----
+    h5py handles are not fork-safe, if this Data is used in a forked process
+    (e.g. Feeder workers), the hdf5 file is automatically reopened in
+    read-only mode for that process.
+    """
+
     def __init__(self, dataset, hdf=None, dtype=None, shape=None):
         super(Hdf5Data, self).__init__()
 
@@ -1156,6 +1693,26 @@ class Hdf5Data(Data):
                                  ''.format(shape, self._data.shape))
             self._hdf = hdf
 
+    # ==================== fork-safe dataset ==================== #
+    @property
+    def _data(self):
+        dataset = self.__dataset
+        if dataset is not None and self.__pid != os.getpid():
+            hdf = open_hdf5(self.__path, read_only=True)
+            dataset = hdf[self.__name]
+            self._hdf = hdf
+            self.__dataset = dataset
+            self.__pid = os.getpid()
+        return dataset
+
+    @_data.setter
+    def _data(self, dataset):
+        self.__dataset = dataset
+        self.__pid = os.getpid()
+        if dataset is not None:
+            self.__path = os.path.abspath(dataset.file.filename)
+            self.__name = dataset.name
+
     # ==================== properties ==================== #
     @property
     def path(self):
@@ -1243,24 +1800,6 @@ class Hdf5Data(Data):
         return self
 
     # ==================== low-level operator ==================== #
-    def __add__(self, y):
-        return self._data.__add__(y)
-
-    def __sub__(self, y):
-        return self._data.__sub__(y)
-
-    def __mul__(self, y):
-        return self._data.__mul__(y)
-
-    def __div__(self, y):
-        return self._data.__div__(y)
-
-    def __floordiv__(self, y):
-        return self._data.__floordiv__(y)
-
-    def __pow__(self, y):
-        return self._data.__pow__(y)
-
     @autoattr(_status=lambda x: x + 1)
     def __iadd__(self, y):
         self._iterate_update(y, 'add')
@@ -1291,14 +1830,6 @@ class Hdf5Data(Data):
         self._iterate_update(y, 'pow')
         return self
 
-    def __neg__(self):
-        self._data.__neg__()
-        return self
-
-    def __pos__(self):
-        self._data.__pos__()
-        return self
-
     # ==================== Save ==================== #
     def resize(self, shape):
         if self._hdf.mode == 'r':
@@ -1335,17 +1866,40 @@ class Hdf5Data(Data):
 # ===========================================================================
 # data iterator
 # ===========================================================================
-def _approximate_continuos_by_discrete(distribution):
-    '''original distribution: [ 0.47619048  0.38095238  0.14285714]
-       best approximated: [ 5.  4.  2.]
-    '''
-    if len(distribution) == 1:
-        return distribution
-
-    inv_distribution = 1 - distribution
-    x = np.round(1 / inv_distribution)
-    x = np.where(distribution == 0, 0, x)
-    return x.astype(int)
+def _source_indices(start, end, n, rng, block=1):
+    """ `n` row indices drawn from the range [start, end), the range is
+    repeated (and re-shuffled for each pass) if over-sampling.
+    The order of the blocks of `block` contiguous rows is shuffled """
+    length = end - start
+    if n <= 0 or length <= 0:
+        return np.empty(shape=(0,), dtype='int64')
+    indices = []
+    for i in range(int(ceil(n / length))):
+        x = np.arange(start, end, dtype='int64')
+        if rng is not None and block > 1:
+            x = [x[j:j + block] for j in range(0, length, block)]
+            x = np.concatenate([x[j] for j in rng.permutation(len(x))])
+        elif rng is not None:
+            x = rng.permutation(x)
+        indices.append(x)
+    return np.concatenate(indices)[:n]
+
+
+def _source_labels(n, sequential, rng):
+    """ Source ID of every row in the iteration.
+    In mixed mode, the rows of each source are spread evenly, hence, every
+    batch follows the target proportions (differ at most 1 row per source)
+    """
+    k = len(n)
+    if sum(n) == 0:
+        return np.empty(shape=(0,), dtype='int32')
+    if sequential:
+        order = np.arange(k) if rng is None else rng.permutation(k)
+        return np.concatenate([np.full(n[i], i, dtype='int32') for i in order])
+    labels = np.concatenate([np.full(j, i, dtype='int32')
+                             for i, j in enumerate(n)])
+    position = np.concatenate([(np.arange(j) + 0.5) / j for j in n if j > 0])
+    return labels[np.argsort(position, kind='mergesort')]
 
 
 class DataIterator(MutableData):
@@ -1371,6 +1925,7 @@ class DataIterator(MutableData):
         # ====== defaults parameters ====== #
         self._data = data
         self._sequential = False
+        self._reuse_batch = False
         self._distribution = [1.] * len(data)
 
     # ==================== properties ==================== #
@@ -1423,6 +1978,7 @@ class DataIterator(MutableData):
         # ====== batch configuration ====== #
         s.append('Batch: %d' % self._batch_size)
         s.append('Sequential: %r' % self._sequential)
+        s.append('Reuse batch: %r' % self._reuse_batch)
         s.append('Distibution: %s' % str(self._distribution))
         s.append('Seed: %s' % str(self._seed))
         s.append('Range: [%.2f, %.2f]' % (self._start, self._end))
@@ -1432,7 +1988,7 @@ class DataIterator(MutableData):
         return self.__str__()
 
     # ==================== batch configuration ==================== #
-    def set_mode(self, distribution=None, sequential=None):
+    def set_mode(self, distribution=None, sequential=None, reuse_batch=None):
         '''
         Parameters
         ----------
@@ -1443,10 +1999,15 @@ class DataIterator(MutableData):
             float: the same percentage for all Data
         sequential : bool
             if True, read each Data one-by-one, otherwise, mix all Data
+        reuse_batch : bool
+            if True, all batches are written into the same preallocated
+            array, the returned batch is only valid until the next iteration
 
         '''
         if sequential is not None:
             self._sequential = sequential
+        if reuse_batch is not None:
+            self._reuse_batch = bool(reuse_batch)
         if distribution is not None:
             # upsampling or downsampling
             if isinstance(distribution, str):
@@ -1476,102 +2037,53 @@ class DataIterator(MutableData):
     # ==================== main logic of batch iterator ==================== #
     def _iter(self):
         seed = self._seed; self._seed = None
-        if seed is not None:
-            rng = np.random.RandomState(seed)
-        else: # deterministic RandomState
-            rng = struct()
-            rng.randint = lambda x: None
-            rng.permutation = lambda x: slice(None, None)
-        # ====== easy access many private variables ====== #
-        sequential = self._sequential
-        start, end = self._start, self._end
+        rng = None if seed is None else np.random.RandomState(seed)
+        shuffle = rng is not None and self._shuffle_level > 0
         batch_size = self._batch_size
-        distribution = np.asarray(self._distribution)
-        # shuffle order of data (good for sequential mode)
-        idx = rng.permutation(len(self._data))
-        data = self._data[idx] if isinstance(idx, slice) else [self._data[i] for i in idx]
-        distribution = distribution[idx]
-        shape = [i.shape[0] for i in data]
-        # ====== prepare distribution information ====== #
-        # number of sample should be traversed
-        n = np.asarray([i * (_apply_approx(j, end) - _apply_approx(j, start))
-                        for i, j in zip(distribution, shape)])
-        n = np.round(n).astype(int)
-        # normalize the distribution (base on new sample n of each data)
-        distribution = n / n.sum()
-        distribution = _approximate_continuos_by_discrete(distribution)
-        # somehow heuristic, rescale distribution to get more benifit from cache
-        if distribution.sum() <= len(data):
-            distribution = distribution * 3
-        # distribution now the actual batch size of each data
-        distribution = (batch_size * distribution).astype(int)
-        assert distribution.sum() % batch_size == 0, 'wrong distribution size!'
-        # predefined (start,end) pair of each batch (e.g (0,256), (256,512))
-        idx = list(range(0, batch_size + distribution.sum(), batch_size))
-        idx = list(zip(idx, idx[1:]))
+        data = self._data
+        # ====== number of sample should be traversed ====== #
+        ranges = [(_apply_approx(d.shape[0], self._start),
+                   _apply_approx(d.shape[0], self._end)) for d in data]
+        n = [int(round(i * (e - s)))
+             for i, (s, e) in zip(self._distribution, ranges)]
+        # ====== row indices and source of each row ====== #
+        # shuffle_level=0 only shuffles the order of the batches of rows
+        # of each source, the order of sources is kept
+        indices = [_source_indices(s, e, i, rng,
+                                   block=1 if shuffle else batch_size)
+                   for (s, e), i in zip(ranges, n)]
+        labels = _source_labels(n, self._sequential,
+                                rng if shuffle else None)
+        pointer = [0] * len(data)
+        batch = None
         # Dummy return to initialize everything
         yield None
-        #####################################
-        # 1. optimized parallel code.
-        if not sequential:
-            # first iterators
-            it = [iter(dat.set_batch(bs, seed=rng.randint(10e8),
-                                     start=start, end=end,
-                                     shuffle_level=self._shuffle_level))
-                  for bs, dat in zip(distribution, data)]
-            # iterator
-            while sum(n) > 0:
-                batch = []
-                for i, x in enumerate(it):
-                    if n[i] <= 0:
-                        continue
-                    try:
-                        x = x.next()[:n[i]]
-                        n[i] -= x.shape[0]
-                        batch.append(x)
-                    except StopIteration: # one iterator stopped
-                        it[i] = iter(data[i].set_batch(distribution[i],
-                            seed=rng.randint(10e8), start=start, end=end,
-                            shuffle_level=self._shuffle_level))
-                        x = it[i].next()[:n[i]]
-                        n[i] -= x.shape[0]
-                        batch.append(x)
-                # got final batch
-                batch = np.vstack(batch)
-                # no idea why random permutation is much faster than shuffle
-                if self._shuffle_level > 0:
-                    batch = batch[rng.permutation(batch.shape[0])]
-                # return the iterations
-                for i, j in idx[:int(ceil(batch.shape[0] / batch_size))]:
-                    yield self._transformer(batch[i:j])
-        #####################################
-        # 2. optimized sequential code.
-        else:
-            # first iterators
-            batch_size = distribution.sum()
-            it = [iter(dat.set_batch(batch_size, seed=rng.randint(10e8),
-                                     start=start, end=end,
-                                     shuffle_level=self._shuffle_level))
-                  for dat in data]
-            current_data = 0
-            # iterator
-            while sum(n) > 0:
-                if n[current_data] <= 0:
-                    current_data += 1
-                try:
-                    x = it[current_data].next()[:n[current_data]]
-                    n[current_data] -= x.shape[0]
-                except StopIteration: # one iterator stopped
-                    it[current_data] = iter(data[current_data].set_batch(batch_size, seed=rng.randint(10e8),
-                                        start=start, end=end,
-                                        shuffle_level=self._shuffle_level))
-                    x = it[current_data].next()[:n[current_data]]
-                    n[current_data] -= x.shape[0]
-                # shuffle x
-                if self._shuffle_level > 0:
-                    x = x[rng.permutation(x.shape[0])]
-                for i, j in idx[:int(ceil(x.shape[0] / self._batch_size))]:
-                    yield self._transformer(x[i:j])
+        for start in range(0, len(labels), batch_size):
+            lab = labels[start:start + batch_size]
+            if shuffle:
+                lab = lab[rng.permutation(lab.shape[0])]
+            # number of rows from each source in this batch
+            counts = np.bincount(lab, minlength=len(data))
+            x = [(i, data[i].gather(indices[i][pointer[i]:pointer[i] + c]))
+                 for i, c in enumerate(counts) if c > 0]
+            for i, c in enumerate(counts):
+                pointer[i] += c
+            # ====== write to preallocated batch ====== #
+            shape = (lab.shape[0],) + x[0][1].shape[1:]
+            dtype = np.result_type(*[j.dtype for i, j in x])
+            if self._reuse_batch:
+                if batch is None or batch.shape[1:] != shape[1:] or \
+                batch.dtype != dtype:
+                    batch = np.empty((batch_size,) + shape[1:], dtype=dtype)
+                out = batch[:shape[0]]
+            else:
+                out = np.empty(shape, dtype=dtype)
+            if len(x) == 1:
+                out[:] = x[0][1]
+            else:
+                for i, j in x:
+                    out[lab == i] = j
+            yield self._transformer(out)
 
     # ==================== Slicing methods ==================== #
     def __getitem__(self, y):
@@ -1656,6 +2168,13 @@ class DataMerge(MutableData):
         x = self._merge_func(data)
         return self._transformer(x)
 
+    def gather(self, indices, max_gap=0, ncpu=1):
+        n = self._data[0].shape[0]
+        data = [i.gather(indices, max_gap=max_gap, ncpu=ncpu)
+                if len(i.shape) > 0 and i.shape[0] == n else i
+                for i in self._data]
+        return self._transformer(self._merge_func(data))
+
     # ==================== iteration ==================== #
     def _iter(self):
         batch_size = self._batch_size
@@ -1693,3 +2212,575 @@ class DataMerge(MutableData):
             if self._shuffle_level > 0 and rng is not None:
                 data = data[rng.permutation(data.shape[0])]
             yield self._transformer(data)
+
+
+# ===========================================================================
+# LazyData
+# ===========================================================================
+class _LazyArray(object):
+    """ Array-like object evaluates the expression for the requested rows """
+
+    def __init__(self, func, operands):
+        self.func = func
+        self.operands = operands
+        ref = [i for i in operands if isinstance(i, Data)][0]
+        self.nrows = len(ref)
+        self.ndim = len(ref.shape)
+        if any(len(i) != self.nrows for i in operands if isinstance(i, Data)):
+            raise ValueError('All Data in the expression must have the same '
+                             'length, but given: {}'.format(
+                                 [len(i) for i in operands if isinstance(i, Data)]))
+        self._info = None
+
+    def _is_aligned(self, x):
+        # ndarray has the same number of rows as the Data is sliced together
+        # with the Data, otherwise, it is broadcasted (e.g. mean, std)
+        return isinstance(x, Data) or (isinstance(x, np.ndarray) and
+            x.ndim == self.ndim and x.shape[0] == self.nrows)
+
+    def __getitem__(self, y):
+        return self.func(*[i[y] if self._is_aligned(i) else i
+                           for i in self.operands])
+
+    def _row_info(self):
+        if self._info is None:
+            if self.nrows > 0:
+                x = self[0:1]
+                self._info = (x.shape[1:], x.dtype)
+            else:
+                x = [i.dtype if hasattr(i, 'dtype') else i
+                     for i in self.operands]
+                self._info = ((), np.result_type(*x))
+        return self._info
+
+    @property
+    def shape(self):
+        return (self.nrows,) + tuple(self._row_info()[0])
+
+    @property
+    def dtype(self):
+        return self._row_info()[1]
+
+    def __str__(self):
+        return '<LazyData "%s": shape %s, type "<%s">' % \
+        (getattr(self.func, '__name__', str(self.func)), self.shape, self.dtype)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class LazyData(MutableData):
+
+    """ Deferred element-wise expression of Data, returned by the arithmetic
+    operators of Data (e.g. `(ds['X'] - mean) / std`).
+    Nothing is computed until the expression is sliced, iterated or reduced,
+    then it is evaluated blockwise, so memory is bounded by the batch size
+    rather than the size of the Data.
+
+    Parameters
+    ----------
+    func : callable
+        element-wise function (e.g. numpy.add), called with the evaluated
+        operands
+    operands : list
+        Data, scalar or numpy.ndarray. An ndarray with the same number of
+        dimensions and rows as the Data is sliced together with the Data,
+        otherwise it is broadcasted.
+    """
+
+    def __init__(self, func, operands):
+        super(LazyData, self).__init__()
+        if not callable(func):
+            raise ValueError('`func` must be callable.')
+        operands = tuple(operands)
+        if not any(isinstance(i, Data) for i in operands):
+            raise ValueError('At least one operand must be instance of Data.')
+        self._func = func
+        self._operands = operands
+        self._data = _LazyArray(func, operands)
+
+    # result of reduction must be re-computed when any operand changed
+    @property
+    def _status(self):
+        return tuple(i._status for i in self._operands if isinstance(i, Data))
+
+    @_status.setter
+    def _status(self, value):
+        pass
+
+    @property
+    def name(self):
+        names = [i.name for i in self._operands if hasattr(i, 'name')]
+        return '%s(%s)' % (getattr(self._func, '__name__', 'lazy'),
+                           ','.join(names))
+
+    def __str__(self):
+        return self._data.__str__()
+
+    def __repr__(self):
+        return self.__str__()
+
+
+# ===========================================================================
+# ShardedData
+# ===========================================================================
+# (pid, ncpu) -> ThreadPool, a pool inherited by forked process is broken
+_SHARD_POOL = {}
+
+
+def _shard_pool(ncpu):
+    pid = os.getpid()
+    if any(key[0] != pid for key in _SHARD_POOL):
+        _SHARD_POOL.clear()
+    key = (pid, ncpu)
+    if key not in _SHARD_POOL:
+        _SHARD_POOL[key] = ThreadPool(processes=ncpu)
+    return _SHARD_POOL[key]
+
+
+class _ShardedArray(object):
+    """ Array-like object maps the global rows to the rows of each shard
+    using the extent table of ShardedData, each extent is a contiguous
+    block of rows: (shard, shard_start, length), and its global start
+    is the total length of all previous extents """
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    @property
+    def shape(self):
+        return (int(self._owner._starts[-1]),) + self._owner._row_shape
+
+    @property
+    def dtype(self):
+        return self._owner._dtype
+
+    def _locate(self, start, end):
+        """ return list of (shard, shard_start, shard_end, out_start) covers
+        the global rows in range [start, end) """
+        starts = self._owner._starts
+        extents = self._owner._extents
+        pieces = []
+        i = max(int(np.searchsorted(starts, start, side='right')) - 1, 0)
+        while i < len(extents) and starts[i] < end:
+            shard, shard_start, length = extents[i]
+            a = max(start, starts[i]) - starts[i]
+            b = min(end, starts[i + 1]) - starts[i]
+            if b > a:
+                pieces.append((shard, shard_start + a, shard_start + b,
+                               starts[i] + a - start))
+            i += 1
+        return pieces
+
+    def _map(self, func, pieces):
+        # only use threads if the pieces are located on different shards
+        ncpu = self._owner._ncpu
+        if ncpu > 1 and len(set(p[0] for p in pieces)) > 1:
+            _shard_pool(ncpu).map(func, pieces)
+        else:
+            for p in pieces:
+                func(p)
+
+    def _read(self, start, end):
+        owner = self._owner
+        out = np.empty((end - start,) + owner._row_shape, dtype=owner._dtype)
+
+        def read(p):
+            shard, a, b, pos = p
+            out[pos:pos + b - a] = owner._shard(shard)._data[a:b]
+        self._map(read, self._locate(start, end))
+        return out
+
+    def _write(self, start, end, value):
+        owner = self._owner
+        value = np.asarray(value, dtype=owner._dtype)
+        if value.ndim < 1 + len(owner._row_shape):
+            value = np.broadcast_to(value, (end - start,) + owner._row_shape)
+
+        def write(p):
+            shard, a, b, pos = p
+            data = owner._shard(shard)
+            data._data[a:b] = value[pos:pos + b - a]
+            data._mark_dirty(a, b)
+        self._map(write, self._locate(start, end))
+
+    def take(self, indices):
+        """ Read arbitrary rows, the rows are grouped by shard and each
+        shard is read in parallel """
+        owner = self._owner
+        n = self.shape[0]
+        indices = np.asarray(indices)
+        if indices.dtype == np.bool_:
+            indices = np.nonzero(indices)[0]
+        indices = indices.astype('int64').ravel()
+        indices = np.where(indices < 0, indices + n, indices)
+        if len(indices) > 0 and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError('Index out of range [0, %d)' % n)
+        extents = np.asarray(owner._extents, dtype='int64').reshape(-1, 3)
+        ext = np.searchsorted(owner._starts, indices, side='right') - 1
+        shards = extents[ext, 0] if len(indices) > 0 else indices
+        rows = extents[ext, 1] + indices - owner._starts[ext] \
+            if len(indices) > 0 else indices
+        out = np.empty((len(indices),) + owner._row_shape, dtype=owner._dtype)
+
+        def read(p):
+            shard, pos = p
+            r = rows[pos]
+            order = np.argsort(r, kind='mergesort')
+            out[pos[order]] = owner._shard(shard)._data[r[order]]
+        self._map(read, [(s, np.nonzero(shards == s)[0])
+                         for s in np.unique(shards)])
+        return out
+
+    def __getitem__(self, y):
+        n = self.shape[0]
+        if isinstance(y, tuple):
+            x = self[y[0]]
+            if isinstance(y[0], (int, np.integer)):
+                return x[y[1:]]
+            return x[(slice(None),) + y[1:]]
+        if isinstance(y, (int, np.integer)):
+            y = int(y) + n if y < 0 else int(y)
+            if y < 0 or y >= n:
+                raise IndexError('Index %d out of range [0, %d)' % (y, n))
+            return self._read(y, y + 1)[0]
+        if isinstance(y, slice):
+            start, stop, step = y.indices(n)
+            if step == 1:
+                return self._read(start, max(start, stop))
+            return self.take(np.arange(start, stop, step))
+        return self.take(y)
+
+    def __setitem__(self, y, value):
+        n = self.shape[0]
+        if isinstance(y, (int, np.integer)):
+            y = int(y) + n if y < 0 else int(y)
+            if y < 0 or y >= n:
+                raise IndexError('Index %d out of range [0, %d)' % (y, n))
+            return self._write(y, y + 1, np.asarray(value)[None])
+        if isinstance(y, slice):
+            start, stop, step = y.indices(n)
+            if step == 1:
+                return self._write(start, max(start, stop), value)
+        raise NotImplementedError('ShardedData only support assign value to '
+                                  'integer index or contiguous slice.')
+
+    def __str__(self):
+        return '<Sharded dataset "%s": shape %s, type "<%s">, %d shards' % \
+        (self._owner.name, self.shape, self.dtype, len(self._owner._shards))
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ShardedData(MutableData):
+
+    """ Single logical Data which rows are stored in multiple MmapData
+    shards, the shards can be located in different directories (or disks),
+    so a dataset could grow beyond a single disk, and reading a block of
+    rows spanning multiple shards is done in parallel.
+
+    The small descriptor file at `path` stores the dtype, the shape of each
+    row, the path of every shard and the extent table which maps the global
+    row index to (shard, row in the shard). The shards inside the directory
+    of the descriptor are stored by relative path, and a shard found next
+    to the descriptor (e.g. extracted from an archive) is always preferred,
+    so a copy of the directory is self-contained.
+
+    Parameters
+    ----------
+    path : str
+        path to the descriptor file
+    shard_paths : list of str
+        directories for storing the shards, only used when the descriptor
+        is created (by default, the directory of `path`)
+    dtype : data-type
+        data type of the rows, only used when the descriptor is created
+    shape : tuple
+        shape of the data, the first dimension is ignored, only used when
+        the descriptor is created
+    read_only : bool
+        open the shards with mode='r'
+    policy : 'balance', 'round_robin'
+        how new rows are distributed to the shards when appending,
+        'balance' always writes to the smallest shard, 'round_robin'
+        rotates between the shards
+    ncpu : int
+        number of threads for reading or writing multiple shards in
+        parallel, by default, the number of shards
+    """
+    HEADER = 'shardata'
+    SHARD_EXT = '.shard'
+    # maximum size of each extent (in bytes), a big array is split into
+    # multiple extents and distributed to different shards
+    EXTENT_SIZE = 32 * 1024 * 1024
+
+    @staticmethod
+    def read_header(path):
+        """ return: dtype, row_shape, shards, extents """
+        with open(path, 'r') as f:
+            if f.read(len(ShardedData.HEADER)) != ShardedData.HEADER:
+                raise Exception('Invalid header for ShardedData.')
+            try:
+                size = int(f.read(8))
+                info = marshal.loads(f.read(size))
+            except Exception as e:
+                raise Exception('Error reading sharded data file: %s' % str(e))
+        return (info['dtype'], tuple(info['shape']), list(info['shards']),
+                [tuple(i) for i in info['extents']])
+
+    def __init__(self, path, shard_paths=None, dtype='float32', shape=None,
+                 read_only=False, policy='balance', ncpu=None):
+        super(ShardedData, self).__init__()
+        path = os.path.abspath(path)
+        if policy not in ('balance', 'round_robin'):
+            raise ValueError("`policy` must be 'balance' or 'round_robin', "
+                             "but given: %s" % str(policy))
+        self._path = path
+        self.read_only = read_only
+        self.policy = policy
+        # ====== read exist descriptor ====== #
+        if os.path.exists(path):
+            dtype, row_shape, shards, extents = ShardedData.read_header(path)
+            shards = [os.path.join(os.path.dirname(path), p) for p in shards]
+        # ====== create new descriptor ====== #
+        else:
+            if read_only:
+                raise ValueError('Cannot create new ShardedData in read_only '
+                                 'mode, file not found: %s' % path)
+            if dtype is None or shape is None:
+                raise Exception("First created this ShardedData, `dtype` and "
+                                "`shape` must NOT be None.")
+            if not isinstance(shape, (tuple, list, np.ndarray)):
+                shape = (shape,)
+            row_shape = tuple(int(i) for i in shape[1:])
+            if shard_paths is None:
+                shard_paths = [os.path.dirname(path)]
+            shard_paths = as_tuple(shard_paths)
+            for p in shard_paths:
+                if not os.path.isdir(p):
+                    raise ValueError('Shard directory not found: %s' % p)
+            shards = [os.path.join(os.path.abspath(p), os.path.basename(path) +
+                                   ShardedData.SHARD_EXT + str(i))
+                      for i, p in enumerate(shard_paths)]
+            extents = []
+        self._dtype = np.dtype(dtype)
+        self._row_shape = row_shape
+        self._shards = shards
+        self._shard_data = [None] * len(shards)
+        self._extents = [list(i) for i in extents]
+        self._ncpu = len(shards) if ncpu is None else max(int(ncpu), 1)
+        self._update_extents()
+        self._data = _ShardedArray(self)
+        if not os.path.exists(path):
+            self._write_header()
+
+    def _update_extents(self):
+        self._starts = np.cumsum([0] + [i[2] for i in self._extents]
+                                 ).astype('int64')
+        self._shard_rows = [0] * len(self._shards)
+        for shard, start, length in self._extents:
+            self._shard_rows[shard] = max(self._shard_rows[shard],
+                                          start + length)
+        self._next_shard = len(self._extents) % len(self._shards)
+
+    def _write_header(self):
+        if self.read_only:
+            return
+        info = marshal.dumps({'dtype': str(self._dtype),
+                              'shape': list(self._row_shape),
+                              'shards': [self._relative_path(p)
+                                         for p in self._shards],
+                              'extents': [list(i) for i in self._extents]})
+        # write to temporary file then rename, the descriptor is never
+        # corrupted if the process is killed
+        tmp = self._path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(ShardedData.HEADER)
+            f.write('%8d' % len(info))
+            f.write(info)
+        os.rename(tmp, self._path)
+
+    def _relative_path(self, path):
+        root = os.path.dirname(self._path)
+        relpath = os.path.relpath(path, root)
+        return path if relpath.split(os.sep)[0] == os.pardir else relpath
+
+    def _shard_path(self, i):
+        path = self._shards[i]
+        local = os.path.join(os.path.dirname(self._path),
+                             os.path.basename(path))
+        return local if os.path.exists(local) else path
+
+    def _shard(self, i, nb_rows=0):
+        """ Return the MmapData of given shard, the shard file is created
+        if `nb_rows` > 0 and it does not exist """
+        data = self._shard_data[i]
+        if data is None:
+            path = self._shard_path(i)
+            if os.path.exists(path):
+                data = MmapData(path, read_only=self.read_only)
+            elif nb_rows > 0:
+                data = MmapData(path, dtype=self._dtype,
+                                shape=(nb_rows,) + self._row_shape)
+            else:
+                raise ValueError('Shard file not found: %s' % path)
+            self._shard_data[i] = data
+        return data
+
+    # ==================== properties ==================== #
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def name(self):
+        return os.path.basename(self._path)
+
+    @property
+    def shards(self):
+        """ List of (shard_path, number_of_rows) """
+        return [(self._shard_path(i), n)
+                for i, n in enumerate(self._shard_rows)]
+
+    def __str__(self):
+        return self._data.__str__()
+
+    def __repr__(self):
+        return self.__str__()
+
+    # ==================== manipulation ==================== #
+    def gather(self, indices, max_gap=0, ncpu=None):
+        return super(ShardedData, self).gather(
+            indices, max_gap, self._ncpu if ncpu is None else ncpu)
+
+    def _select_shard(self):
+        if self.policy == 'round_robin':
+            shard = self._next_shard
+            self._next_shard = (shard + 1) % len(self._shards)
+            return shard
+        return int(np.argmin(self._shard_rows))
+
+    @autoattr(_status=lambda x: x + 1)
+    def append(self, *arrays):
+        if self.read_only:
+            raise RuntimeError('Cannot append to read_only ShardedData.')
+        row_bytes = max(int(np.prod(self._row_shape)) * self._dtype.itemsize, 1)
+        extent_rows = max(ShardedData.EXTENT_SIZE // row_bytes, 1)
+        # ====== plan the extents ====== #
+        pieces = []
+        for a in arrays:
+            if not hasattr(a, 'shape'):
+                continue
+            if tuple(a.shape[1:]) != self._row_shape:
+                raise ValueError('Appended array must have shape (?,) + %s, '
+                                 'but given: %s' % (self._row_shape, a.shape))
+            for start in range(0, a.shape[0], extent_rows):
+                end = min(start + extent_rows, a.shape[0])
+                shard = self._select_shard()
+                pos = self._shard_rows[shard]
+                self._shard_rows[shard] += end - start
+                pieces.append((shard, pos, pos + end - start, a, start))
+                # merge with the last extent if they are contiguous
+                last = self._extents[-1] if len(self._extents) > 0 else None
+                if last is not None and last[0] == shard and \
+                last[1] + last[2] == pos:
+                    last[2] += end - start
+                else:
+                    self._extents.append([shard, pos, end - start])
+        if len(pieces) == 0:
+            return self
+        # ====== resize each shard only once ====== #
+        for shard in set(p[0] for p in pieces):
+            nb_rows = self._shard_rows[shard]
+            data = self._shard(shard, nb_rows=nb_rows)
+            data.resize((nb_rows,) + self._row_shape)
+
+        # ====== write the pieces in parallel ====== #
+        def write(p):
+            shard, a, b, x, start = p
+            data = self._shard_data[shard]
+            data._data[a:b] = x[start:start + b - a]
+            data._mark_dirty(a, b)
+        self._data._map(write, pieces)
+        self._update_extents()
+        return self
+
+    def prepend(self, *arrays):
+        return Data.prepend(self, *arrays)
+
+    @autoattr(_status=lambda x: x + 1)
+    def __setitem__(self, x, y):
+        if self.read_only:
+            raise RuntimeError('Cannot modify read_only ShardedData.')
+        self._data.__setitem__(x, y)
+
+    def resize(self, shape):
+        if self.read_only:
+            return self
+        if not isinstance(shape, (tuple, list)):
+            shape = (shape,)
+        n = self._data.shape[0]
+        if shape[0] < n:
+            raise ValueError('Only support extend ShardedData, and do not '
+                             'shrink the data')
+        if shape[0] > n:
+            self.append(np.zeros((shape[0] - n,) + self._row_shape,
+                                 dtype=self._dtype))
+        return self
+
+    def flush(self):
+        if self.read_only:
+            return
+        for data in self._shard_data:
+            if data is not None:
+                data.flush()
+        self._write_header()
+
+    def close(self):
+        self.flush()
+        for data in self._shard_data:
+            if data is not None:
+                data.close()
+        self._shard_data = [None] * len(self._shards)
+
+    def verify(self, full=False, ncpu=None):
+        """ Verify the checksums of all shards, see `MmapData.verify`
+
+        Return
+        ------
+        list of (start, end), the corrupted (global) rows in range [start, end)
+        """
+        ncpu = self._ncpu if ncpu is None else ncpu
+        corrupted = []
+        for shard, path in enumerate(self._shards):
+            if self._shard_rows[shard] == 0:
+                continue
+            ranges = self._shard(shard).verify(full=full, ncpu=ncpu)
+            # map the rows of the shard to the global rows
+            for (s, start, length), g in zip(self._extents, self._starts):
+                g = int(g)
+                if s != shard:
+                    continue
+                for a, b in ranges:
+                    a, b = max(a, start), min(b, start + length)
+                    if b > a:
+                        corrupted.append((g + a - start, g + b - start))
+        return _merge_ranges(corrupted)
+
+    def shared(self):
+        """ Flush the descriptor, then the pickled handle only contains
+        the path, so it is cheap to be sent to other processes """
+        self.flush()
+        return self
+
+    # ==================== pickling ==================== #
+    def __getstate__(self):
+        self.flush()
+        return (self._path, self.read_only, self.policy, self._ncpu,
+                self._transformer)
+
+    def __setstate__(self, states):
+        path, read_only, policy, ncpu, transformer = states
+        self.__init__(path, read_only=read_only, policy=policy, ncpu=ncpu)
+        self._transformer = transformer
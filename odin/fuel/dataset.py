@@ -1,16 +1,22 @@
 from __future__ import print_function, division, absolute_import
 
 import os
+import re
+import zlib
+import struct
 import shutil
-from collections import OrderedDict
+import threading
+from multiprocessing import Pool, cpu_count
+from collections import OrderedDict, deque
 from six.moves import zip, range, cPickle
 
 import numpy as np
 
-from .data import MmapData, Hdf5Data, open_hdf5, get_all_hdf_dataset, MAX_OPEN_MMAP, Data
-from .utils import MmapDict, SQLiteDict
+from .data import (MmapData, Hdf5Data, ShardedData, open_hdf5,
+                   get_all_hdf_dataset, MAX_OPEN_MMAP, Data)
+from .utils import MmapDict, SQLiteDict, TableDict
 
-from odin.utils import get_file, Progbar, is_string
+from odin.utils import get_file, Progbar, is_string, as_tuple
 from odin.utils.decorators import singleton
 
 
@@ -34,6 +40,13 @@ def _parse_data_descriptor(path, read_only):
     """ Return mapping: name -> (dtype, shape, Data, path) """
     if not os.path.isfile(path):
         return None
+    # ====== check if a file is ShardedData descriptor ====== #
+    try:
+        dtype, row_shape, shards, extents = ShardedData.read_header(path)
+        data = ShardedData(path, read_only=read_only)
+        return [(os.path.basename(path), (dtype, data.shape, data, path))]
+    except Exception:
+        pass
     # ====== check if a file is Data ====== #
     try:
         dtype, shape = MmapData.read_header(path, mode='r', return_file=False)
@@ -76,6 +89,250 @@ def _parse_data_descriptor(path, read_only):
     return [(name, ('unknown', 'unknown', None, path))]
 
 
+class _LazyEntry(object):
+    """ Placeholder for the Data recorded in the manifest, the content is
+    only loaded at the first access
+
+    kind: 'hdf5', 'pickle', 'memdict', 'sqlite' or 'sharded'
+    extra: name of hdf5 dataset, or name of SQLite table
+    """
+
+    def __init__(self, kind, path, extra=None):
+        self.kind = kind
+        self.path = path
+        self.extra = extra
+
+    def load(self, read_only):
+        if self.kind == 'hdf5':
+            return Hdf5Data(dataset=self.extra,
+                            hdf=open_hdf5(self.path, read_only=read_only))
+        elif self.kind == 'pickle':
+            with open(self.path, 'rb') as f:
+                return cPickle.load(f)
+        elif self.kind == 'memdict':
+            return MmapDict(self.path, read_only=read_only)
+        elif self.kind == 'sqlite':
+            return SQLiteDict(self.path, read_only=read_only).as_table(self.extra)
+        elif self.kind == 'sharded':
+            return ShardedData(self.path, read_only=read_only)
+        raise ValueError("Unknown lazy entry of type: %s" % self.kind)
+
+
+def _entry_kind(dtype, shape, data):
+    """ Return (kind, extra) of a Data for the manifest """
+    if isinstance(data, _LazyEntry):
+        return data.kind, data.extra
+    elif is_string(dtype) and dtype == 'unknown':
+        return 'unknown', None
+    elif data is None or isinstance(data, MmapData):
+        return 'memmap', None
+    elif isinstance(data, ShardedData):
+        return 'sharded', None
+    elif isinstance(data, Hdf5Data):
+        return 'hdf5', data.name
+    elif isinstance(data, TableDict):
+        return 'sqlite', data.name
+    elif isinstance(data, MmapDict):
+        return 'memdict', None
+    return 'pickle', None
+
+
+# shard files of ShardedData (e.g. "X.shard0") and checksum files of
+# MmapData (e.g. "X.crc") are not parsed as separated Data
+_AUXILIARY_FILE = re.compile(r'(%s\d+|%s)$' % (
+    re.escape(ShardedData.SHARD_EXT), re.escape(MmapData.CHECKSUM_EXT)))
+
+
+# ===========================================================================
+# Parallel archive
+# ===========================================================================
+# |'ODINARCH'|chunk|chunk|...|pickled table of contents|toc_position|'ODINARCH'|
+# table of contents: list of (file_name, size, mtime, chunks), each chunk is
+# (position, stored_length, raw_length, is_compressed)
+_ARCHIVE_MAGIC = 'ODINARCH'
+_ARCHIVE_FOOTER = struct.Struct('<Q')
+ARCHIVE_EXT = '.odar'
+
+
+def _same_mtime(t1, t2):
+    # the restored modification time could lose sub-microsecond precision
+    return abs(t1 - t2) < 1e-3
+
+
+def _compress_chunk(args):
+    path, offset, length, level = args
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        raw = f.read(length)
+    if level > 0:
+        data = zlib.compress(raw, level)
+        if len(data) < len(raw):
+            return True, data, len(raw)
+    return False, raw, len(raw)
+
+
+def _decompress_chunk(args):
+    path, position, length, is_compressed = args
+    with open(path, 'rb') as f:
+        f.seek(position)
+        data = f.read(length)
+    return zlib.decompress(data) if is_compressed else data
+
+
+def _ordered_map(pool, func, tasks, window):
+    """ Same as `pool.imap(func, tasks)`, but at most `window` tasks are
+    submitted and not yet consumed, so the results (e.g. compressed chunks)
+    cached in memory are bounded if the consumer is slower than the pool """
+    if pool is None:
+        for t in tasks:
+            yield func(t)
+        return
+    pending = deque()
+    for t in tasks:
+        pending.append(pool.apply_async(func, (t,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+
+def _read_archive_toc(path):
+    with open(path, 'rb') as f:
+        if f.read(len(_ARCHIVE_MAGIC)) != _ARCHIVE_MAGIC:
+            raise ValueError('"%s" is not an odin archive.' % path)
+        f.seek(-(len(_ARCHIVE_MAGIC) + _ARCHIVE_FOOTER.size), os.SEEK_END)
+        toc_position = _ARCHIVE_FOOTER.unpack(f.read(_ARCHIVE_FOOTER.size))[0]
+        if f.read(len(_ARCHIVE_MAGIC)) != _ARCHIVE_MAGIC:
+            raise ValueError('Archive "%s" is incomplete.' % path)
+        f.seek(toc_position)
+        return cPickle.loads(f.read())
+
+
+def _write_archive(path, files, ncpu, chunk_size, level, memmap_level,
+                   memmap_files):
+    """ Compress each chunk of the `files` independently by a pool of
+    `ncpu` processes, the chunks are written in order of the files'
+    size (small files first, so they are available first while
+    extracting) """
+    files = sorted(files, key=lambda f: os.path.getsize(f))
+    tasks = []
+    for f in files:
+        lv = memmap_level if f in memmap_files else level
+        size = os.path.getsize(f)
+        for offset in range(0, max(size, 1), chunk_size):
+            tasks.append((f, offset, min(chunk_size, size - offset), lv))
+    toc = OrderedDict((f, (os.path.basename(f), os.path.getsize(f),
+                           os.path.getmtime(f), [])) for f in files)
+    pool = Pool(ncpu) if ncpu > 1 else None
+    # at most 2 chunks per process are in-flight
+    results = _ordered_map(pool, _compress_chunk, tasks, window=2 * ncpu)
+    prog = Progbar(target=len(tasks), name="[Dataset] Archiving",
+                   print_report=True, print_summary=True)
+    try:
+        with open(path, 'wb') as archive:
+            archive.write(_ARCHIVE_MAGIC)
+            position = len(_ARCHIVE_MAGIC)
+            for (f, offset, length, lv), (is_compressed, data, raw_length) in \
+            zip(tasks, results):
+                archive.write(data)
+                toc[f][-1].append((position, len(data), raw_length, is_compressed))
+                position += len(data)
+                prog['File'] = os.path.basename(f)
+                prog.add(1)
+            archive.write(cPickle.dumps(list(toc.values()),
+                                        protocol=cPickle.HIGHEST_PROTOCOL))
+            archive.write(_ARCHIVE_FOOTER.pack(position))
+            archive.write(_ARCHIVE_MAGIC)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return path
+
+
+class _ArchiveExtractor(object):
+    """ Extract the odin archive in background thread, file by file in
+    the order of the archive, each file is decompressed in parallel
+    (chunk by chunk), then atomically renamed to its final name.
+    `wait(name)` blocks until the given file is extracted """
+
+    def __init__(self, path, extract_path, ncpu):
+        self.path = path
+        self.extract_path = extract_path
+        self.ncpu = ncpu
+        self.toc = _read_archive_toc(path)
+        self._events = OrderedDict((name, threading.Event())
+                                   for name, _, _, _ in self.toc)
+        self._error = None
+        self._thread = None
+        # already extracted files (and maybe modified afterward) are kept,
+        # a file is only renamed to its name after completely extracted
+        for name, size, mtime, chunks in self.toc:
+            if os.path.isfile(os.path.join(extract_path, name)):
+                self._events[name].set()
+
+    @property
+    def pending(self):
+        return [name for name, e in self._events.iteritems() if not e.is_set()]
+
+    @property
+    def finished(self):
+        return len(self.pending) == 0
+
+    def extract(self, name, pool=None):
+        for fname, size, mtime, chunks in self.toc:
+            if fname != name:
+                continue
+            fpath = os.path.join(self.extract_path, fname)
+            tmp_path = fpath + '.tmp'
+            tasks = [(self.path, position, length, is_compressed)
+                     for position, length, _, is_compressed in chunks]
+            results = _ordered_map(pool if len(tasks) > 1 else None,
+                                   _decompress_chunk, tasks,
+                                   window=2 * self.ncpu)
+            with open(tmp_path, 'wb') as f:
+                for data in results:
+                    f.write(data)
+            os.rename(tmp_path, fpath)
+            os.utime(fpath, (mtime, mtime))
+            self._events[fname].set()
+
+    def _run(self):
+        pool = Pool(self.ncpu) if self.ncpu > 1 else None
+        try:
+            for name in self.pending:
+                self.extract(name, pool)
+        except Exception as e:
+            self._error = e
+            for event in self._events.itervalues():
+                event.set()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def start(self):
+        if self._thread is None and not self.finished:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def wait(self, name=None):
+        """ Wait until the file with given `name` extracted, or all files
+        if `name` is None """
+        if name is None:
+            events = self._events.values()
+        else:
+            name = os.path.basename(name)
+            events = [self._events[name]] if name in self._events else []
+        for e in events:
+            e.wait()
+        if self._error is not None:
+            raise RuntimeError("Error extracting archive %s: %s" %
+                               (self.path, str(self._error)))
+
+
 class Dataset(object):
     """ This Dataset can automatically parse memmap (created by MmapData),
     MmapDict, pickled dictionary and hdf5 files and keep tracking the changes.
@@ -88,9 +345,20 @@ class Dataset(object):
     for developer: _data_map contains: name -> (dtype, shape, Data or pathtoData)
     readme included with the dataset should contain license information
     All the file with `.db` extension will be treat as SQLite data
+    `shard_paths` is the list of directories (could be on different disks)
+    for storing the shards of new ShardedData,
+    for example: ds[('X', 'sharded')] = numpy.ones((8, 12))
+    A manifest (".manifest" file) is written on `flush` and `close`, it
+    records the type, dtype, shape and modified time of each file, hence,
+    the unchanged files are not parsed again, and their content is only
+    loaded at the first access.
     """
 
     __INSTANCES = {}
+    # the manifest records type, dtype, shape and modified time of all
+    # files, hence, the Dataset is opened without parsing unchanged files
+    MANIFEST = '.manifest'
+    MANIFEST_VERSION = 1
 
     def __new__(clazz, *args, **kwargs):
         path = kwargs.get('path', None)
@@ -108,11 +376,15 @@ class Dataset(object):
         Dataset.__INSTANCES[path] = new_instance
         return new_instance
 
-    def __init__(self, path, read_only=False, override=False):
+    def __init__(self, path, read_only=False, override=False, ncpu=None,
+                 shard_paths=None):
         path = os.path.abspath(path)
         self.read_only = read_only
+        self._shard_paths = None if shard_paths is None else \
+            [os.path.abspath(p) for p in as_tuple(shard_paths)]
         self._readme_info = ['README:', '------', ' No information!']
         self._readme_path = None
+        self._extractor = None
         # parse all data from path
         if path is not None:
             if override and os.path.exists(path) and os.path.isdir(path):
@@ -121,6 +393,8 @@ class Dataset(object):
             if os.path.isfile(path) and '.zip' in os.path.basename(path):
                 self._load_archive(path,
                     extract_path=path.replace(os.path.basename(path), ''))
+            elif os.path.isfile(path) and path[-len(ARCHIVE_EXT):] == ARCHIVE_EXT:
+                self._load_odin_archive(path, ncpu=ncpu)
             else:
                 self._set_path(path)
         else:
@@ -139,8 +413,21 @@ class Dataset(object):
             raise ValueError('Dataset path must be a folder.')
 
         # # ====== load all Data ====== #
-        files = os.listdir(path)
+        manifest = self._read_manifest()
+        # files are being extracted from archive
+        extractor = getattr(self, '_extractor', None)
+        pending = [] if extractor is None else extractor.pending
+        files = [f for f in os.listdir(path)
+                 if f not in pending and f[-4:] != '.tmp'] + pending
+        files = [f for f in files if _AUXILIARY_FILE.search(f) is None]
         for fname in files:
+            # hidden bookkeeping files (e.g. the manifest, the progress of
+            # FeatureProcessor) are not Data
+            if fname[:1] == '.':
+                continue
+            if fname in pending and \
+            (fname not in manifest or 'readme' == fname[:6].lower()):
+                extractor.wait(fname)
             # found README
             if 'readme' == fname[:6].lower():
                 readme_path = os.path.join(path, fname)
@@ -150,8 +437,12 @@ class Dataset(object):
                     readme.append(' For more information: ' + readme_path)
                     self._readme_info = ['README:', '------'] + readme
                     self._readme_path = readme_path
-            # parse data
-            data = _parse_data_descriptor(os.path.join(path, fname), self.read_only)
+            # parse data, only if the file changed since the manifest written
+            data = self._load_from_manifest(manifest, path, fname,
+                                            check=fname not in pending)
+            if data is None:
+                data = _parse_data_descriptor(os.path.join(path, fname),
+                                              self.read_only)
             if data is None: continue
             for key, d in data:
                 if key in self._data_map:
@@ -160,7 +451,111 @@ class Dataset(object):
                 else:
                     self._data_map[key] = d
 
+    # ==================== manifest ==================== #
+    @property
+    def manifest_path(self):
+        return os.path.join(self._path, Dataset.MANIFEST)
+
+    def _read_manifest(self):
+        """ Return: mapping file_name -> (mtime, size, entries) """
+        try:
+            with open(self.manifest_path, 'rb') as f:
+                manifest = cPickle.load(f)
+            if manifest.get('version', None) != Dataset.MANIFEST_VERSION:
+                return {}
+            return manifest['files']
+        except Exception:
+            return {}
+
+    def _load_from_manifest(self, manifest, path, fname, check=True):
+        """ Return the entries of the file from the manifest (same format
+        as `_parse_data_descriptor`), or None if the file has changed """
+        if fname not in manifest:
+            return None
+        fpath = os.path.join(path, fname)
+        mtime, size, entries = manifest[fname]
+        if check:
+            try:
+                stat = os.stat(fpath)
+            except OSError:
+                return None
+            if not os.path.isfile(fpath) or \
+            not _same_mtime(stat.st_mtime, mtime) or stat.st_size != size:
+                return None
+        data = []
+        for key, kind, dtype, shape, extra in entries:
+            # memmap descriptor is already lazy loaded
+            d = None if kind in ('memmap', 'unknown') else \
+                _LazyEntry(kind, fpath, extra)
+            data.append((key, (dtype, shape, d, fpath)))
+        return data
+
+    def _manifest_entries(self):
+        """ Return: mapping file_name -> list of entries """
+        files = OrderedDict()
+        for key, (dtype, shape, data, path) in self._data_map.iteritems():
+            if path is None or \
+            os.path.dirname(os.path.abspath(path)) != self._path:
+                continue
+            # the handle is shared and closed by other code (e.g. the indices
+            # of FeatureProcessor), the file is parsed again at next opening
+            if getattr(data, 'is_closed', False):
+                continue
+            kind, extra = _entry_kind(dtype, shape, data)
+            if isinstance(data, (MmapData, ShardedData)):
+                dtype, shape = data.dtype, data.shape
+            elif hasattr(data, '__len__') and \
+            kind in ('pickle', 'memdict', 'sqlite'):
+                shape = len(data)
+            files.setdefault(os.path.basename(path), []).append(
+                (key, kind, str(dtype), shape, extra))
+        return files
+
+    def _write_manifest(self, entries=None):
+        """ Write the manifest, all the files must be flushed before this
+        step, error is ignored (e.g. read-only file system) """
+        if entries is None:
+            entries = self._manifest_entries()
+        try:
+            files = {}
+            for fname, file_entries in entries.iteritems():
+                stat = os.stat(os.path.join(self._path, fname))
+                files[fname] = (stat.st_mtime, stat.st_size, file_entries)
+            tmp_path = self.manifest_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                cPickle.dump({'version': Dataset.MANIFEST_VERSION,
+                              'files': files}, f,
+                             protocol=cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, self.manifest_path)
+        except (IOError, OSError):
+            pass
+
     # ==================== archive loading ==================== #
+    def _load_odin_archive(self, path, ncpu=None):
+        """ The manifest and small files are extracted first, the Dataset
+        is usable while the remaining files are extracted in background,
+        accessing a Data blocks until its file is extracted """
+        extract_path = path[:-len(ARCHIVE_EXT)]
+        if not os.path.exists(extract_path):
+            os.mkdir(extract_path)
+        elif not os.path.isdir(extract_path):
+            raise ValueError('Extract path must be path folder, but path'
+                             '={} is a file'.format(extract_path))
+        ncpu = cpu_count() if ncpu is None else max(int(ncpu), 1)
+        extractor = _ArchiveExtractor(path, extract_path, ncpu)
+        if Dataset.MANIFEST in extractor.pending:
+            extractor.extract(Dataset.MANIFEST)
+        self._extractor = extractor.start()
+        self._set_path(extract_path)
+
+    def wait_extracted(self, key=None):
+        """ Block until the file of given Data `key` (or all files if None)
+        is extracted from the archive """
+        if self._extractor is not None:
+            self._extractor.wait(None if key is None else
+                                 self._data_map[key][-1])
+        return self
+
     def _load_archive(self, path, extract_path):
         from zipfile import ZipFile, ZIP_DEFLATED
         try:
@@ -174,7 +569,7 @@ class Dataset(object):
                                         os.path.basename(path).replace('.zip', ''))
             # found the extracted dir, use it
             if os.path.isdir(extract_path) and \
-               set(os.listdir(extract_path)) == set(allfile):
+               set(os.listdir(extract_path)) - set([Dataset.MANIFEST]) == set(allfile):
                 self._set_path(extract_path)
                 return
             # decompress everything
@@ -214,6 +609,9 @@ class Dataset(object):
         for name, (dtype, shape, data, path) in self._data_map.iteritems():
             try:
                 size_bytes += os.path.getsize(path) # in bytes
+                if isinstance(data, ShardedData):
+                    size_bytes += sum(os.path.getsize(p)
+                                      for p, n in data.shards if n > 0)
             except:
                 pass
         return size_bytes / 1024. / 1024.
@@ -234,12 +632,133 @@ class Dataset(object):
         """
         return self._data_map.values()
 
-    def archive(self):
+    # ==================== access pattern ==================== #
+    def advise(self, pattern, keys=None):
+        """ Give the access pattern hint to all memmap Data in this Dataset
+        (or only the Data with given `keys`), see `MmapData.advise`
+
+        Parameters
+        ----------
+        pattern: str
+            'normal', 'sequential', 'random', 'willneed', 'dontneed'
+        keys: None, str, list of str
+            if None, apply the hint for all memmap Data
+        """
+        keys = self.keys() if keys is None else as_tuple(keys)
+        for key in keys:
+            dtype, shape, data, path = self._data_map[key]
+            # memmap descriptor which has not been opened
+            if data is None and dtype != 'unknown' and shape != 'unknown':
+                data = self[key]
+            if isinstance(data, MmapData):
+                data.advise(pattern)
+        return self
+
+    def warm(self, key, start=None, end=None):
+        """ Pre-fault the rows [start, end) of given memmap Data in a
+        background thread, return the async task, see `MmapData.warm` """
+        data = self[key]
+        if not isinstance(data, MmapData):
+            raise ValueError('Only support warming MmapData, but "%s" is: %s' %
+                             (key, type(data)))
+        return data.warm(start, end)
+
+    def verify(self, keys=None, full=False, ncpu=None):
+        """ Verify the checksums of memmap and sharded Data, only the chunks
+        changed since the last verification are read, unless `full=True`,
+        see `MmapData.verify`
+
+        Parameters
+        ----------
+        keys: None, str, list of str
+            if None, verify all memmap and sharded Data
+        full: bool
+            if True, verify all chunks
+        ncpu: int, None
+            number of threads for reading the chunks, None for all CPUs
+
+        Return
+        ------
+        OrderedDict: name -> list of (start, end), the corrupted rows in
+        range [start, end), empty list if the Data is intact
+        """
+        keys = self.keys() if keys is None else as_tuple(keys)
+        ncpu = cpu_count() if ncpu is None else max(int(ncpu), 1)
+        report = OrderedDict()
+        for key in keys:
+            dtype, shape, data, path = self._data_map[key]
+            if _entry_kind(dtype, shape, data)[0] not in ('memmap', 'sharded'):
+                continue
+            report[key] = self[key].verify(full=full, ncpu=ncpu)
+        return report
+
+    def _shard_files(self):
+        """ shard files of all sharded Data """
+        files = []
+        for key, (dtype, shape, data, path) in self._data_map.items():
+            if _entry_kind(dtype, shape, data)[0] == 'sharded':
+                files += [p for p, n in self[key].shards]
+        return set(f for f in files if os.path.exists(f))
+
+    def _checksum_files(self):
+        """ checksum files of all memmap Data and shards """
+        files = [path + MmapData.CHECKSUM_EXT
+                 for key, (dtype, shape, data, path) in self._data_map.iteritems()
+                 if _entry_kind(dtype, shape, data)[0] == 'memmap']
+        files += [f + MmapData.CHECKSUM_EXT for f in self._shard_files()]
+        return set(f for f in files if os.path.exists(f))
+
+    def archive(self, fmt='zip', ncpu=None, chunk_size=32,
+                level=6, memmap_level=1):
+        """
+        Parameters
+        ----------
+        fmt: 'zip', 'odar'
+            'zip' archives all files sequentially; 'odar' splits the files
+            into chunks compressed independently by a pool of processes,
+            the archive is extracted in parallel and streamed when opened
+            by `Dataset(path_to_odar)`.
+        ncpu: int, None
+            number of processes for 'odar', None for all CPUs.
+        chunk_size: int
+            size of each chunk in MegaBytes for 'odar'.
+        level: int (0 - 9)
+            zlib compression level for 'odar', 0 is stored.
+        memmap_level: int (0 - 9)
+            compression level of MmapData files for 'odar', lightly
+            compressed by default since float features hardly compress.
+
+        Return
+        ------
+        path to the archive
+        """
+        fmt = str(fmt).lower()
+        if fmt == ARCHIVE_EXT[1:]:
+            self.flush() # also write the manifest
+            files = set([_[-1] for _ in self._data_map.itervalues()])
+            files |= self._shard_files() | self._checksum_files()
+            if os.path.exists(self.manifest_path):
+                files.add(self.manifest_path)
+            memmap_files = set(path
+                for key, (dtype, shape, data, path) in self._data_map.iteritems()
+                if _entry_kind(dtype, shape, data)[0] == 'memmap')
+            memmap_files |= self._shard_files()
+            ncpu = cpu_count() if ncpu is None else max(int(ncpu), 1)
+            return _write_archive(
+                self.archive_path[:-len('.zip')] + ARCHIVE_EXT, files,
+                ncpu=ncpu, chunk_size=int(chunk_size * 1024 * 1024),
+                level=int(level), memmap_level=int(memmap_level),
+                memmap_files=memmap_files)
+        elif fmt != 'zip':
+            raise ValueError("Only support archive format: 'zip' or '%s'" %
+                             ARCHIVE_EXT[1:])
         from zipfile import ZipFile, ZIP_DEFLATED
         path = self.archive_path
         zfile = ZipFile(path, mode='w', compression=ZIP_DEFLATED)
 
+        self.flush()
         files = set([_[-1] for _ in self._data_map.itervalues()])
+        files |= self._shard_files() | self._checksum_files()
 
         prog = Progbar(target=len(files), name="[Dataset] Archiving",
                        print_report=True, print_summary=True)
@@ -254,27 +773,35 @@ class Dataset(object):
 
     def flush(self):
         for dtype, shape, data, path in self._data_map.itervalues():
+            # not loaded data has nothing to flush
+            if isinstance(data, _LazyEntry):
+                continue
             if hasattr(data, 'flush'):
                 data.flush()
             elif data is not None: # Flush pickling data
                 with open(path, 'wb') as f:
                     cPickle.dump(data, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        self._write_manifest()
 
     def close(self, name=None):
         # ====== close all Data ====== #
         if name is None: # close all files
+            if self._extractor is not None:
+                self._extractor.wait()
+            entries = self._manifest_entries()
             for name, (dtype, shape, data, path) in self._data_map.items():
                 if hasattr(data, 'close'):
                     data.close()
                 del data
                 del self._data_map[name]
+            self._write_manifest(entries)
             # Check if exist global instance
             if self.path in Dataset.__INSTANCES:
                 del Dataset.__INSTANCES[self.path]
         # ====== close a particular file ====== #
         elif name in self._data_map:
             (dtype, shape, data, path) = self._data_map[name]
-            if dtype == 'sqlite':
+            if is_string(dtype) and dtype == 'sqlite':
                 data.sqlite.close()
             elif hasattr(data, 'close'):
                 data.close()
@@ -299,9 +826,24 @@ class Dataset(object):
             if key not in self._data_map:
                 raise KeyError('%s not found in this dataset' % key)
             dtype, shape, data, path = self._data_map[key]
+            # the file is being extracted from archive
+            if self._extractor is not None and \
+            (data is None or isinstance(data, _LazyEntry)):
+                self._extractor.wait(path)
+                # the shards are extracted separately
+                if _entry_kind(dtype, shape, data)[0] == 'sharded':
+                    prefix = os.path.basename(path) + ShardedData.SHARD_EXT
+                    for name in self._extractor.pending:
+                        if name[:len(prefix)] == prefix:
+                            self._extractor.wait(name)
+            # recorded in the manifest, load it for the first time
+            if isinstance(data, _LazyEntry):
+                data = data.load(self.read_only)
+                self._data_map[key] = (dtype, shape, data, path)
+                return data
             # return type is just a descriptor, create MmapData for it
             if data is None and \
-            dtype is not 'unknown' and shape is not 'unknown':
+            dtype != 'unknown' and shape != 'unknown':
                 data = MmapData(path, read_only=self.read_only)
                 self._data_map[key] = (data.dtype, data.shape, data, path)
                 self._validate_memmap_max_open(key)
@@ -314,20 +856,22 @@ class Dataset(object):
         ----------
         key : str or tuple
             if tuple is specified, it contain the key and the datatype
-            which must be "memmap", "hdf5"
+            which must be "memmap", "hdf5" or "sharded"
             for example: ds[('X', 'hdf5')] = numpy.ones((8, 12))
         """
         if not is_string(key) and not isinstance(key, (tuple, list)):
             raise ValueError('"key" is the name for Data and must be String or '
-                             'tuple specified the name and datatype (memmap, hdf5).')
+                             'tuple specified the name and datatype (memmap, hdf5, '
+                             'sharded).')
         # ====== check datatype ====== #
         datatype = 'memmap' # default datatype
         if isinstance(key, (tuple, list)):
             key, datatype = key
             datatype = datatype.lower()
-            if datatype not in ('memmap', 'hdf5'):
-                raise ValueError('datatype can only be "memmap" or "hdf5", but '
-                                 'the given data type is "%s"' % datatype)
+            if datatype not in ('memmap', 'hdf5', 'sharded'):
+                raise ValueError('datatype can only be "memmap", "hdf5" or '
+                                 '"sharded", but the given data type is "%s"'
+                                 % datatype)
         # ====== do nothing ====== #
         if key in self._data_map:
             return
@@ -347,6 +891,12 @@ class Dataset(object):
             dtype, shape = value.dtype, value.shape
             if datatype == 'memmap':
                 data = MmapData(path, dtype=dtype, shape=shape)
+            elif datatype == 'sharded':
+                data = ShardedData(path, shard_paths=self._shard_paths,
+                                   dtype=dtype, shape=shape)
+                data.append(value)
+                self._data_map[key] = (data.dtype, data.shape, data, path)
+                return
             else:
                 path = os.path.join(self.path, self._default_hdf5)
                 f = open_hdf5(path)
@@ -367,6 +917,23 @@ class Dataset(object):
                                    len(value) if hasattr(value, '__len__') else 0,
                                    value, path)
 
+    def __delitem__(self, key):
+        """ Close the Data and remove its file, only support the Data
+        stored in its own file (i.e. memmap, MmapDict and pickled object) """
+        if self.read_only:
+            raise RuntimeError('Cannot remove "%s" from read-only Dataset.' % key)
+        if key not in self._data_map:
+            raise KeyError('%s not found in this dataset' % key)
+        dtype, shape, data, path = self._data_map[key]
+        kind = _entry_kind(dtype, shape, data)[0]
+        if kind not in ('memmap', 'memdict', 'pickle'):
+            raise ValueError('Cannot remove "%s", the Data of type "%s" does '
+                             'not have its own file.' % (key, kind))
+        self.close(name=key)
+        for path in (path, path + MmapData.CHECKSUM_EXT):
+            if os.path.exists(path):
+                os.remove(path)
+
     def __iter__(self):
         for name, (dtype, shape, data) in self._data_map.iteritems():
             if isinstance(data, (Data, dict, MmapDict)):
@@ -416,6 +983,8 @@ class Dataset(object):
         return self.path
 
     def __setstate__(self, path):
+        self._extractor = None
+        self._shard_paths = None
         self._set_path(path)
 
 
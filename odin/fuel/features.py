@@ -12,13 +12,14 @@ import wave
 import time
 import shutil
 import warnings
+import threading
 from numbers import Number
 from multiprocessing import Pool, cpu_count, Process, Queue
-from six import add_metaclass, string_types
-from six.moves import zip, zip_longest, range, cPickle
+from six import add_metaclass, string_types, reraise
+from six.moves import zip, zip_longest, range, cPickle, queue
 from abc import ABCMeta, abstractmethod, abstractproperty
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import numpy as np
 
 from odin.ml import MiniBatchPCA
@@ -29,7 +30,7 @@ from odin.utils import (Progbar, as_tuple, get_all_files, ctext,
                         add_notification, keydefaultdict)
 from .dataset import Dataset
 from .recipes import FeederRecipe
-from .utils import MmapDict, SQLiteDict
+from .utils import MmapDict, MmapDictSegment, SQLiteDict
 
 _default_module = re.compile('__.*__')
 
@@ -49,15 +50,115 @@ def _append_energy_and_deltas(s, energy, delta_order):
         return None
     if energy is not None:
         s = np.hstack((s, energy[:, None]))
-    # compute delta
+    # compute delta along the time axis
     if delta_order > 0:
-        deltas = speech.compute_delta(s.T, order=delta_order)
-        # tranpose back to [Time, Dim]
-        s = np.hstack([s] + [i.T for i in deltas])
+        s = speech.stack_deltas(s, order=delta_order)
     return s
 
 
+def _nb_frames(nb_samples, sr, win, hop, center):
+    """ number of frames returned by `speech.speech_features` """
+    win_length = int(win * sr)
+    n_fft = 2 ** int(np.ceil(np.log2(win_length)))
+    hop_length = int(hop * sr) if hop is not None else n_fft // 4
+    if center:
+        nb_samples += 2 * int(n_fft // 2)
+    if nb_samples < n_fft:
+        return 0
+    return 1 + (nb_samples - n_fft) // hop_length
+
+
 # ==================== general ==================== #
+class _AsyncWriter(object):
+    """ Call `func(*args)` sequentially in a background thread, hence,
+    writing to disk is overlapped with collecting the results from
+    the workers. The first error raised by `func` is re-raised by the
+    next `put` or by `join`.
+
+    maxsize: maximum number of pending calls, `put` is blocked if the
+    writer is slower than the workers (bound the memory)
+    """
+
+    def __init__(self, func, maxsize=2):
+        self._func = func
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            args = self._queue.get()
+            if args is None:
+                break
+            # keep draining the queue, so `put` is never blocked forever
+            if self._error is not None:
+                continue
+            try:
+                self._func(*args)
+            except Exception:
+                self._error = sys.exc_info()
+
+    def _raise(self):
+        if self._error is not None:
+            reraise(*self._error)
+
+    def put(self, *args):
+        self._raise()
+        self._queue.put(args)
+
+    def join(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._raise()
+
+
+def _add_statistics(total, stats):
+    """ Add the statistics of one result, feature_name -> (sum1, sum2,
+    count, scatter), to the `total` of the same form (lists) """
+    for name, (s1, s2, n, scatter) in stats.iteritems():
+        if name not in total:
+            total[name] = [0, 0, 0, None]
+        s = total[name]
+        s[0] += s1
+        s[1] += s2
+        s[2] += n
+        if scatter is not None: # for PCA
+            s[3] = scatter if s[3] is None else s[3] + scatter
+
+
+def _checked_segments(indices, rows, nb_samples):
+    """ Return (samples, checked): the position of `nb_samples` random
+    segments in `indices` (list of (name, start, end)), and the sorted
+    position of all segments must be checked, which are the samples and
+    the segments overlapped with any of `rows` (list of (start, end)),
+    or all segments if `rows` is None """
+    samples = np.random.choice(np.arange(len(indices)),
+                               size=min(nb_samples, len(indices)),
+                               replace=False).tolist()
+    if rows is None:
+        return samples, list(range(len(indices)))
+    starts = np.array([i[1] for i in indices], dtype='int64')
+    ends = np.array([i[2] for i in indices], dtype='int64')
+    checked = set(samples)
+    for start, end in rows:
+        checked.update(np.nonzero((starts < end) & (ends > start))[0].tolist())
+    return samples, sorted(checked)
+
+
+class _Region(object):
+    """ Rows [start, start + length) of a feature which are written
+    directly to the preallocated MmapData by the worker """
+
+    def __init__(self, start, length):
+        self.start = int(start)
+        self.length = int(length)
+
+    def __len__(self):
+        return self.length
+
+
 @add_metaclass(ABCMeta)
 class FeatureProcessor(object):
 
@@ -79,6 +180,14 @@ class FeatureProcessor(object):
     _excluded_pca: list
         All feature properties with name given in this list will
         be excluded during pca calculation.
+
+    Two-phase mode `run(direct_write=True)`: the `plan` of all jobs gives
+    the number of rows of each segment, all features are preallocated, and
+    the workers write the features directly at the planned offsets.
+
+    Incremental mode `run(incremental=True)`: the finished jobs (identified
+    by `source` and `segment_names`) are recorded in the ".progress" file
+    of the output dataset, and are skipped by the next run.
     """
 
     def __init__(self, output_path, datatype='memmap',
@@ -107,6 +216,9 @@ class FeatureProcessor(object):
         # list of features name
         self._external_indices = []
         self._excluded_pca = []
+        # direct write: segment_name -> (start, nb_rows); name -> MmapData
+        self._plan = {}
+        self._direct = {}
 
     # ==================== Abstract properties ==================== #
     @property
@@ -152,9 +264,337 @@ class FeatureProcessor(object):
         return self._excluded_pca
 
     def _map_multiple_works(self, jobs):
-        for j in jobs:
-            for result in self.map(j):
-                yield result
+        """ `jobs` is list of (job_id, job), the last result of each job is
+        marked as done, and carries the statistics of the whole job (hence,
+        the scatter matrices for PCA are only sent once per job) """
+        # the "dict" features are written directly by the workers
+        segments = {name: MmapDictSegment(
+            os.path.join(os.path.abspath(self.output_path), name))
+            for name, dtype, _ in self.features_properties
+            if 'dict' in str(dtype).lower()}
+        for job_id, j in jobs:
+            results = self.map(j)
+            if results is None: # error ignored
+                continue
+            last = None
+            job_stats = {}
+            for result in results:
+                if result is None:
+                    continue
+                if last is not None:
+                    yield last + ({}, job_id, False)
+                name, job_count, data, stats = self._map_result(result,
+                                                                segments)
+                _add_statistics(job_stats, stats)
+                last = (name, job_count, data)
+            if last is not None:
+                yield last + (job_stats, job_id, True)
+
+    def _map_result(self, result, segments):
+        name, job_count, data = result
+        if not isinstance(data, (tuple, list)):
+            data = (data,)
+        data = list(data)
+        # the statistics and the casting are done by the workers,
+        # only the partial sums are returned for reducing:
+        # feature_name -> (sum1, sum2, count, scatter)
+        stats = {}
+        for i, ((feat_name, feat_type, feat_stat), d) in enumerate(
+                zip(self.features_properties, data)):
+            if feat_name in segments:
+                segments[feat_name][name] = d
+                data[i] = None
+            elif d is not None and len(d) > 0:
+                # the statistics of the saved (casted) features, hence,
+                # they can be recomputed from the dataset
+                d = d.astype(feat_type)
+                if self.save_stats and feat_stat:
+                    s = self._compute_statistics(feat_name, feat_stat, d)
+                    stats[feat_name] = (s[0], s[1], len(d),
+                                        s[2] if len(s) > 2 else None)
+                data[i] = d
+        if len(self._direct) > 0:
+            data = self._write_direct(name, data)
+        # the records must be on disk before the result is reduced
+        for seg in segments.itervalues():
+            seg.flush()
+        return name, job_count, data, stats
+
+    # ==================== Direct write ==================== #
+    def plan(self, job):
+        """ Phase one of `run(direct_write=True)`, this method is called
+        in parallel for all jobs before processing.
+
+        Return
+        ------
+        list of (segment_name, nb_rows) in the same order as returned by
+        `map(job)`, all features (except "dict" features and features with
+        external indices) of a segment must have `nb_rows` rows.
+        None if the length cannot be known before processing, the job is
+        then processed normally.
+        """
+        return None
+
+    def _plan_multiple_works(self, jobs):
+        for i, job in jobs:
+            yield i, self.plan(job)
+
+    def _direct_features(self):
+        return [(name, dtype) for name, dtype, _ in self.features_properties
+                if 'dict' not in str(dtype).lower() and
+                name not in self.external_indices]
+
+    def _write_direct(self, name, data):
+        """ Write the features to the planned region, return the data with
+        the written features replaced by `_Region` """
+        if name not in self._plan:
+            return data
+        start, nb_rows = self._plan[name]
+        props = self.features_properties
+        if any(len(d) != nb_rows for (feat_name, _, _), d in zip(props, data)
+               if feat_name in self._direct):
+            return data # wrong plan, the segment is processed normally
+        for i, (feat_name, _, _) in enumerate(props):
+            if feat_name in self._direct and i < len(data):
+                self._direct[feat_name]._data[start:start + nb_rows] = data[i]
+                data[i] = _Region(start, nb_rows)
+        return data
+
+    def _prepare_direct_write(self, dataset, jobs, ncpu, offset):
+        """ Plan the offsets of all segments, process the first job to get
+        the shape of the features, then preallocate all the features.
+        `jobs` is list of (job_id, job), the regions are planned from row
+        `offset` of the existing features.
+
+        Return
+        ------
+        remaining jobs, results of the first job, first row of the features
+        after the planned regions (None if all jobs are processed normally)
+        """
+        if self.datatype != 'memmap':
+            raise ValueError('`direct_write` only support datatype="memmap".')
+        features = self._direct_features()
+        # ====== plan all jobs in parallel ====== #
+        plans = dict(MPI(jobs=jobs,
+                         map_func=self._plan_multiple_works,
+                         ncpu=ncpu, buffer_size=1,
+                         maximum_queue_size=ncpu * 3, chunk_scheduler=True))
+        planned_jobs = [i for i, _ in jobs if plans.get(i, None) is not None]
+        plan = OrderedDict()
+        total = 0
+        for i in planned_jobs:
+            for name, nb_rows in plans[i]:
+                if name not in plan:
+                    plan[name] = (total, int(nb_rows))
+                    total += int(nb_rows)
+        if len(features) == 0 or total == 0:
+            return jobs, [], None
+        # ====== all features must have the same length ====== #
+        lengths = set(len(dataset[name]) if name in dataset else None
+                      for name, _ in features)
+        if len(lengths) != 1:
+            warnings.warn('Features have different lengths, all jobs are '
+                          'processed normally.')
+            return jobs, [], None
+        base = None if lengths.pop() is None else offset
+        # ====== the first job gives the shape of features ====== #
+        first = planned_jobs[0]
+        probe = list(self._map_multiple_works(
+            [(i, j) for i, j in jobs if i == first]))
+        jobs = [(i, j) for i, j in jobs if i != first]
+        props = self.features_properties
+        features = dict(features)
+        if len(probe) == 0 or plan.get(probe[0][0], (-1, 0))[0] != 0 or \
+        any(len(d) != plan[probe[0][0]][1]
+            for (feat_name, _, _), d in zip(props, probe[0][2])
+            if feat_name in features):
+            warnings.warn('The plan of the first job is wrong, all jobs are '
+                          'processed normally.')
+            return jobs, probe, None
+        # ====== preallocate ====== #
+        for i, (feat_name, feat_type, _) in enumerate(props):
+            if feat_name not in features:
+                continue
+            if base is None: # new feature
+                dataset[(feat_name, 'memmap')] = probe[0][2][i]
+            x = dataset[feat_name]
+            # the rows after `offset` are reused
+            x.resize((max(len(x), total + (0 if base is None else base)),) +
+                     x.shape[1:])
+            self._direct[feat_name] = x
+        base = 0 if base is None else base
+        self._plan = {name: (base + start, nb_rows)
+                      for name, (start, nb_rows) in plan.iteritems()}
+        probe = [r[:2] + (self._write_direct(r[0], r[2]),) + r[3:]
+                 for r in probe]
+        return jobs, probe, base + total
+
+    # ==================== Statistics ==================== #
+    def _pca_able(self, feat_name, feat_stat, shape):
+        return self.pca and feat_stat and \
+            feat_name not in self.excluded_pca and \
+            (len(shape) == 2 and shape[-1] > 1)
+
+    def _compute_statistics(self, feat_name, feat_stat, d):
+        """ Return (sum1, sum2) of the features, and the scatter matrix
+        if PCA is fitted on the features, the statistics of different
+        segments are summed, hence, they are computed by the workers. """
+        stats = (np.sum(d, axis=0, dtype='float64'),
+                 np.sum(np.power(d, 2, dtype='float64'), axis=0))
+        if self._pca_able(feat_name, feat_stat, d.shape):
+            stats += (MiniBatchPCA.compute_statistics(d)[2],)
+        return stats
+
+    # ==================== Incremental ==================== #
+    def source(self, job):
+        """ Return the path to the source file of given job, the job is
+        processed again by `run(incremental=True)` if the file is modified
+        after the last run. None if the job does not have a source file.
+        """
+        return None
+
+    def segment_names(self, job):
+        """ Return the names of all segments of given job (None if unknown
+        before processing), the job is identified by these names if it
+        does not have a source file. `run(incremental=True)` also uses them
+        to detect jobs indexed in a dataset which has no recorded progress.
+        """
+        return None
+
+    @property
+    def progress_path(self):
+        return os.path.join(self.output_path, '.progress')
+
+    def _indices_name(self, feat_name):
+        if feat_name in self.external_indices:
+            return 'indices_%s' % feat_name
+        return 'indices'
+
+    def _job_key(self, job):
+        """ Return (key, mtime) identifying the job in the progress """
+        path = self.source(job)
+        if path is not None:
+            return path, (os.path.getmtime(path)
+                          if os.path.exists(path) else None)
+        names = self.segment_names(job)
+        if names is not None:
+            return tuple(names), None
+        return None, None
+
+    def _load_progress(self):
+        if not os.path.exists(self.progress_path):
+            return None
+        with open(self.progress_path, 'rb') as f:
+            return cPickle.load(f)
+
+    def _save_progress(self, progress):
+        # the progress is replaced at once, never partially written
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            cPickle.dump(progress, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.progress_path)
+
+    def _existing_rows(self, dataset, incremental):
+        """ Return mapping: indices_name -> first row for the new features,
+        the features sharing one indices are extended to the same length.
+        If `incremental`, the rows after the last indexed row (i.e. written
+        or preallocated by an interrupted run) are overwritten, otherwise,
+        the new rows are appended. """
+        features = [(name, self._indices_name(name))
+                    for name, dtype, _ in self.features_properties
+                    if 'dict' not in str(dtype).lower() and name in dataset]
+        rows = defaultdict(int)
+        for name, ids_name in features:
+            rows[ids_name] = max(rows[ids_name], len(dataset[name]))
+        for name, ids_name in features:
+            x = dataset[name]
+            if len(x) < rows[ids_name]:
+                x.resize((rows[ids_name],) + x.shape[1:])
+        if incremental:
+            for ids_name in list(rows.keys()):
+                if ids_name in dataset:
+                    rows[ids_name] = max([end for start, end in
+                                          dataset[ids_name].itervalues()] + [0])
+        return rows
+
+    def _update_statistics(self, dataset, ranges, stats, sign):
+        """ Add (sign=1) or remove (sign=-1) the statistics of the rows given
+        by `ranges`: segment_name -> {indices_name: (start, end)} """
+        sum1, sum2, count, pca_stats = stats
+        for feat_name, dtype, stats_able in self.features_properties:
+            if not (self.save_stats and stats_able) or feat_name not in dataset:
+                continue
+            ids_name = self._indices_name(feat_name)
+            x = dataset[feat_name]
+            for rows in ranges.itervalues():
+                if ids_name not in rows or rows[ids_name][1] <= rows[ids_name][0]:
+                    continue
+                start, end = rows[ids_name]
+                s = self._compute_statistics(feat_name, stats_able, x[start:end])
+                sum1[feat_name] += sign * s[0]
+                sum2[feat_name] += sign * s[1]
+                count[feat_name] += sign * (end - start)
+                if len(s) > 2:
+                    p = pca_stats[feat_name]
+                    p[0] += sign * (end - start)
+                    p[1] += sign * s[0]
+                    p[2] += sign * s[2]
+
+    def _indexed_segments(self, dataset):
+        """ Return mapping: segment_name -> {full_name: {indices_name: (start, end)}},
+        the full name of a segment cut by `maxlen` is "name:start:end" """
+        segments = defaultdict(lambda: defaultdict(dict))
+        for ids_name in set(self._indices_name(name)
+                            for name, dtype, _ in self.features_properties
+                            if 'dict' not in str(dtype).lower()):
+            if ids_name not in dataset:
+                continue
+            for name, rows in dataset[ids_name].iteritems():
+                segments[name.split(':')[0]][name][ids_name] = rows
+        return segments
+
+    def _schedule_incremental(self, dataset, sources, stats, legacy):
+        """ Return the list of (job_id, job) which are not processed or
+        modified since the last run, the number of skipped segments, and
+        the old ranges of the modified jobs.
+        The statistics of the modified jobs are removed, their old rows
+        are left unindexed.
+
+        `sources` is the progress: job_key -> (mtime, ranges), if `legacy`,
+        the dataset has no recorded progress, the jobs whose segments are
+        all indexed are recorded, and their statistics are recomputed from
+        the saved features.
+        """
+        jobs = []
+        skipped = 0
+        replaced = {}
+        indexed = self._indexed_segments(dataset) if legacy else {}
+        for i, job in enumerate(self.jobs):
+            key, mtime = self._job_key(job)
+            if key is None: # cannot be tracked, always processed
+                jobs.append((i, job))
+                continue
+            names = self.segment_names(job)
+            if key in sources:
+                old_mtime, ranges = sources[key]
+                if old_mtime == mtime:
+                    skipped += 1 if names is None else len(names)
+                    continue
+                self._update_statistics(dataset, ranges, stats, sign=-1)
+                replaced[key] = ranges
+                del sources[key]
+            elif legacy:
+                if names is not None and len(names) > 0 and \
+                all(name in indexed for name in names):
+                    ranges = {}
+                    for name in names:
+                        ranges.update(indexed[name])
+                    self._update_statistics(dataset, ranges, stats, sign=1)
+                    sources[key] = (mtime, ranges)
+                    skipped += len(names)
+                    continue
+            jobs.append((i, job))
+        return jobs, skipped, replaced
 
     @abstractmethod
     def map(self, job):
@@ -162,13 +602,29 @@ class FeatureProcessor(object):
         pass
 
     @abstractmethod
-    def _validate(self, ds, path, nb_samples, logger):
+    def _validate(self, ds, path, nb_samples, logger, rows):
         """
         ds: Dataset (in read_only mode, auto opened and closed)
+        rows: list of (start, end), the content of the segments overlapped
+            with these rows must be checked (see `_checked_segments`),
+            None for checking all segments
         """
         pass
 
-    def validate(self, path, nb_samples=8):
+    def validate(self, path, nb_samples=8, full=False):
+        """
+        Parameters
+        ----------
+        path: str
+            path to the folder for storing the reports
+        nb_samples: int
+            number of random segments which are checked and saved
+        full: bool
+            if True, all checksums are verified and the content of every
+            segment is checked, otherwise, only the chunks changed since
+            the last verification are verified, and only the content of
+            corrupted rows and the sampled segments are checked
+        """
         def logger(title, check):
             print(ctext('   *', 'cyan'),
                   ctext(title, 'yellow'),
@@ -185,10 +641,35 @@ class FeatureProcessor(object):
         else:
             shutil.rmtree(path)
             os.mkdir(path)
-        self._validate(ds, path, nb_samples, logger)
+        # ====== checksums, only changed chunks are read ====== #
+        rows = []
+        for name, corrupted in ds.verify(full=full, ncpu=self.ncpu).iteritems():
+            logger('Checksum "%s"' % name, len(corrupted) == 0)
+            for start, end in corrupted:
+                print(ctext('     corrupted rows:', 'red'), '[%d, %d)' % (start, end))
+            rows += corrupted
+        self._validate(ds, path, nb_samples, logger, None if full else rows)
         ds.close()
 
-    def run(self):
+    def run(self, direct_write=False, incremental=False):
+        """
+        Parameters
+        ----------
+        direct_write: bool
+            if True, the output length of all jobs is planned first
+            (see `FeatureProcessor.plan`), all features are preallocated
+            and the workers write the features directly to their planned
+            offsets, hence, the features are not transferred to and copied
+            by the main process (only support datatype="memmap").
+            The rows of a skipped segment (e.g. contains NaN) are left
+            empty, and a segment with wrong plan is processed normally.
+        incremental: bool
+            if True, the jobs finished by previous runs are skipped, and the
+            jobs whose source file is modified (see `FeatureProcessor.source`)
+            are processed again, hence, an interrupted run is resumed and
+            new files are added to an existing dataset. The progress and the
+            statistics of finished jobs are saved at every flush of the cache.
+        """
         if not hasattr(self, 'jobs'):
             raise Exception('the Processor must has "jobs" attribute, which is '
                             'the list of all jobs.')
@@ -209,48 +690,151 @@ class FeatureProcessor(object):
                           for name, dtype, stats_able in self.features_properties}
         sum1 = defaultdict(int)
         sum2 = defaultdict(int)
-        # init PCA
+        count = defaultdict(int)
+        # init PCA, fitted at the end with the merged (n_samples, sum, scatter)
+        # computed by the workers
         pca = defaultdict(lambda *args, **kwargs:
             MiniBatchPCA(n_components=None, whiten=self.pca_whiten,
                          copy=True, batch_size=None) if self.pca else None)
-        # load old statistics and PCA if found
-        for name, is_stats in statistic_able.iteritems():
-            if is_stats:
-                if name + '_sum1' in dataset:
-                    sum1[name] = dataset[name + '_sum1'][:]
-                if name + '_sum2' in dataset:
-                    sum2[name] = dataset[name + '_sum2'][:]
-                if name + '_pca' in dataset:
-                    pca[name] = dataset[name + '_pca']
+        pca_stats = defaultdict(lambda: [0, 0., 0.])
+        # load the progress, or old statistics and PCA if found
+        progress = self._load_progress() if incremental else None
+        if progress is not None:
+            sum1.update(progress['sum1'])
+            sum2.update(progress['sum2'])
+            count.update(progress['count'])
+            for name, stats in progress['pca_stats'].iteritems():
+                pca_stats[name] = list(stats)
+        else:
+            for name, is_stats in statistic_able.iteritems():
+                if is_stats:
+                    # incremental: recomputed from the indexed features
+                    # copied, the old statistics are replaced at the end
+                    if name + '_sum1' in dataset and not incremental:
+                        sum1[name] = np.array(dataset[name + '_sum1'][:])
+                        count[name] = len(dataset[name])
+                    if name + '_sum2' in dataset and not incremental:
+                        sum2[name] = np.array(dataset[name + '_sum2'][:])
+                    if name + '_pca' in dataset and not incremental:
+                        pca[name] = dataset[name + '_pca']
+            # the progress does not match the data anymore
+            if not incremental and os.path.exists(self.progress_path):
+                os.remove(self.progress_path)
+        # ====== segments of the dict left by an interrupted run ====== #
+        for name, dtype, _ in self.features_properties:
+            if 'dict' in str(dtype).lower():
+                # the records of the finished jobs are kept, the others are
+                # written again by this run (merged after the old records)
+                if incremental:
+                    databases[name].merge_segments()
+                else:
+                    for path in databases[name].segments:
+                        os.remove(path)
         # all data are cached for periodically flushed
         cache = defaultdict(list)
         if self.ncache <= 1:
             cache_limit = max(2, int(0.12 * njobs))
         else:
             cache_limit = int(self.ncache)
-        # ref_vars[start]
-        ref_vars = {'start': defaultdict(int), 'processed_count': 0}
+        # ref_vars[start], new features are written after the existing rows
+        ref_vars = {'start': self._existing_rows(dataset, incremental),
+                    'processed_count': 0}
+        # feature_name -> next row written by `flush_feature`
+        write_rows = {}
+
+        # the statistics and indices of a job are only saved when it is
+        # finished: job_id -> ({feature_name: [sum1, sum2, count, scatter]},
+        #                      {segment_name: {indices_name: (start, end)}})
+        job_states = defaultdict(lambda: ({}, defaultdict(dict)))
+        finished = []
+        # ====== select jobs ====== #
+        sources = {} if progress is None else progress['sources']
+        if incremental:
+            jobs, skipped, replaced = self._schedule_incremental(dataset,
+                sources, (sum1, sum2, count, pca_stats),
+                legacy=progress is None)
+            job_keys = {i: self._job_key(job) for i, job in jobs}
+        else:
+            jobs, skipped, replaced = list(enumerate(self.jobs)), 0, {}
 
         # ====== helper ====== #
         def flush_feature(name, cache_data):
             if len(cache_data) > 0:
                 cache_data = np.concatenate(cache_data, 0)
-                # NOTE: if nb_samples < nb_features, fitting PCA
-                # will course error
-                if self.pca and statistic_able[name] and \
-                name not in self.excluded_pca and \
-                (cache_data.ndim >= 2 and cache_data.shape[-1] > 1):
-                    pca[name].partial_fit(cache_data)
+                start = write_rows[name]
+                write_rows[name] += len(cache_data)
                 # flush data
-                if name in dataset:
-                    dataset[name].append(cache_data)
-                else:
+                if name not in dataset:
                     dataset[(name, datatype)] = cache_data
+                elif start == len(dataset[name]):
+                    dataset[name].append(cache_data)
+                else: # overwrite the unused rows
+                    x = dataset[name]
+                    if write_rows[name] > len(x):
+                        x.resize((write_rows[name],) + x.shape[1:])
+                    x[start:write_rows[name]] = cache_data
+
+        def finish_job(job_id, job_stats, job_ranges):
+            # the rows written by the workers, their checksums are updated
+            # at the next flush
+            for feat_name, x in self._direct.iteritems():
+                ids_name = self._indices_name(feat_name)
+                for rows in job_ranges.itervalues():
+                    if ids_name in rows:
+                        x._mark_dirty(*rows[ids_name])
+            for name, (s1, s2, n, scatter) in job_stats.iteritems():
+                sum1[name] += s1
+                sum2[name] += s2
+                count[name] += n
+                if scatter is not None:
+                    p = pca_stats[name]
+                    p[0] += n
+                    p[1] += s1
+                    p[2] += scatter
+            for name, rows in job_ranges.iteritems():
+                for ids_name, (start, end) in rows.iteritems():
+                    databases[ids_name][name] = (start, end)
+            if not incremental:
+                return
+            key, mtime = job_keys[job_id]
+            if key is None:
+                return
+            # segments of the old version which are not produced anymore
+            for name, rows in replaced.pop(key, {}).iteritems():
+                if name not in job_ranges:
+                    for ids_name in rows:
+                        if name in databases[ids_name]:
+                            del databases[ids_name][name]
+            sources[key] = (mtime, dict(job_ranges))
+
+        def save_progress():
+            # features and indices must be on disk before the progress
+            for name, dtype, _ in self.features_properties:
+                if 'dict' not in str(dtype).lower() and name in dataset:
+                    dataset[name].flush()
+            for db in databases.itervalues():
+                db.flush()
+            self._save_progress({'sources': sources,
+                                 'sum1': dict(sum1), 'sum2': dict(sum2),
+                                 'count': dict(count),
+                                 'pca_stats': dict(pca_stats)})
+
+        # all disk writes are done by a writer thread
+        def write_cache(cache_items, finished_items):
+            for name, cache_data in cache_items:
+                flush_feature(name, cache_data)
+            # the features of finished jobs are written, save their indices
+            for job_id, (job_stats, job_ranges) in finished_items:
+                finish_job(job_id, job_stats, job_ranges)
+            if incremental:
+                save_progress()
+        writer = _AsyncWriter(write_cache)
 
         # ====== repeated for each result returned ====== #
         def wrapped_reduce(result):
-            name, job_count, data = result
+            name, job_count, data, stats, job_id, done = result
             ref_vars['processed_count'] += 1
+            job_stats, job_ranges = job_states[job_id]
             # check data
             if not isinstance(data, (tuple, list)):
                 data = (data,)
@@ -259,56 +843,85 @@ class FeatureProcessor(object):
             for prop, d in zip(self.features_properties, data):
                 # feature-type-name, dtype, stats-able
                 feat_name, feat_type, feat_stat = prop
-                # specal case: dict type
+                # specal case: dict type, already written by the workers
                 if 'dict' in str(feat_type).lower():
-                    databases[feat_name][name] = \
-                        (d.tolist() if isinstance(d, np.ndarray) else d)
                     del d
                     continue
                 # auto-create new indices
-                if feat_name in self.external_indices:
-                    ids_name = 'indices_%s' % feat_name
+                ids_name = self._indices_name(feat_name)
+                # written directly to the planned offset by the worker
+                if isinstance(d, _Region):
+                    if ids_name not in saved_indices:
+                        job_ranges[name][ids_name] = (d.start, d.start + len(d))
+                        saved_indices.append(ids_name)
                 else:
-                    ids_name = 'indices'
-                # do not save and increase the count of one indices multiple time
-                if ids_name not in saved_indices:
-                    databases[ids_name][name] = (ref_vars['start'][ids_name],
-                                                 ref_vars['start'][ids_name] + len(d))
-                    ref_vars['start'][ids_name] += len(d)
-                    saved_indices.append(ids_name)
-                # cache data, only if we have more than 0 sample
-                if len(d) > 0:
-                    cache[feat_name].append(d.astype(feat_type))
-                    if self.save_stats and feat_stat: # save stats
-                        sum1[feat_name] += np.sum(d, axis=0, dtype='float64')
-                        sum2[feat_name] += np.sum(np.power(d, 2), axis=0, dtype='float64')
+                    # do not save and increase the count of one indices
+                    # multiple time
+                    if ids_name not in saved_indices:
+                        job_ranges[name][ids_name] = (
+                            ref_vars['start'][ids_name],
+                            ref_vars['start'][ids_name] + len(d))
+                        ref_vars['start'][ids_name] += len(d)
+                        saved_indices.append(ids_name)
+                    # cache data, only if we have more than 0 sample,
+                    # already casted to `feat_type` by the workers
+                    if len(d) > 0:
+                        cache[feat_name].append(d)
                 del d
+            # the statistics of the whole job are given by its last result
+            _add_statistics(job_stats, stats)
+            if done:
+                finished.append((job_id, job_states.pop(job_id)))
             # ====== flush cache ====== #
             if ref_vars['processed_count'] % cache_limit == 0: # 12 + 8
-                for i, j in cache.iteritems():
-                    flush_feature(i, j)
+                writer.put(list(cache.items()), list(finished))
                 cache.clear()
+                del finished[:]
             # ====== update progress ====== #
             return name, job_count
+        # ====== direct write, plan and preallocate ====== #
+        probe = []
+        if direct_write:
+            jobs, probe, start = self._prepare_direct_write(dataset, jobs, ncpu,
+                offset=ref_vars['start']['indices'])
+            # the normally processed results are written after the regions
+            if start is not None:
+                ref_vars['start']['indices'] = start
+        for name, dtype, _ in self.features_properties:
+            write_rows[name] = ref_vars['start'][self._indices_name(name)]
         # ====== processing ====== #
-        mpi = MPI(jobs=self.jobs,
+        mpi = MPI(jobs=jobs,
                   map_func=self._map_multiple_works,
                   reduce_func=wrapped_reduce,
                   ncpu=ncpu,
-                  buffer_size=min(8, max(len(self.jobs) // ncpu, 1)),
+                  buffer_size=min(8, max(len(jobs) // ncpu, 1)),
                   maximum_queue_size=ncpu * 3,
                   chunk_scheduler=True)
         prog = Progbar(target=njobs, name=self.__class__.__name__,
                        interval=0.1, print_report=True, print_summary=True)
+        if skipped > 0:
+            prog.add_notification('Skipped %d processed segments' % skipped)
+            prog.add(skipped)
+        for name, job_count in (wrapped_reduce(r) for r in probe):
+            prog['File'] = '%-20s' % name
+            prog.add(job_count)
         for name, job_count in mpi:
             prog['File'] = '%-20s' % name
             prog.add(job_count)
         # ====== end, flush the last time ====== #
-        for i, j in cache.iteritems():
-            flush_feature(i, j)
+        writer.put(list(cache.items()),
+                   list(finished) + list(job_states.items()))
+        writer.join()
         cache = None
+        self._plan, self._direct = {}, {}
         dataset.flush()
         prog.add_notification("Flushed all data to disk")
+        # ====== merge the dict written by the workers ====== #
+        for name, dtype, _ in self.features_properties:
+            if 'dict' in str(dtype).lower():
+                databases[name].merge_segments()
+                prog.add_notification('Merged segments of MmapDict "%s"' %
+                                      ctext(name, 'yellow'))
         # ====== saving indices ====== #
         for name, db in databases.iteritems():
             db.flush(save_indices=True)
@@ -317,8 +930,8 @@ class FeatureProcessor(object):
                                   ctext(name, 'yellow'))
 
         # ====== save mean and std ====== #
-        def save_mean_std(sum1, sum2, pca, name, dataset):
-            N = dataset[name].shape[0]
+        def save_mean_std(sum1, sum2, count, pca, name, dataset):
+            N = count if count > 0 else dataset[name].shape[0]
             mean = sum1 / N
             std = np.sqrt(sum2 / N - mean**2)
             if self.substitute_nan is not None:
@@ -327,12 +940,15 @@ class FeatureProcessor(object):
             else:
                 assert not np.any(np.isnan(mean)), 'Mean contains NaN, name: %s' % name
                 assert not np.any(np.isnan(std)), 'Std contains NaN, name: %s' % name
-            dataset[name + '_sum1'] = sum1
-            dataset[name + '_sum2'] = sum2
-            dataset[name + '_mean'] = mean
-            dataset[name + '_std'] = std
+            stats = [('_sum1', sum1), ('_sum2', sum2),
+                     ('_mean', mean), ('_std', std)]
             if pca is not None and pca.is_fitted:
-                dataset[name + '_pca'] = pca
+                stats.append(('_pca', pca))
+            for key, value in stats:
+                # the statistics saved by previous run are replaced
+                if name + key in dataset:
+                    del dataset[name + key]
+                dataset[name + key] = value
         # save all stats
         if self.save_stats:
             for n, d, s in self.features_properties:
@@ -341,9 +957,13 @@ class FeatureProcessor(object):
                     s1, s2 = sum1[n], sum2[n],
                     if self.pca and n not in self.excluded_pca:
                         pca_ = pca[n]
+                        # merge the statistics of all workers
+                        if pca_stats[n][0] > 0:
+                            prog.add_notification('Fitting PCA of: %s' % n)
+                            pca_.merge(pca_stats[n])
                     else:
                         pca_ = None
-                    save_mean_std(s1, s2, pca_, n, dataset)
+                    save_mean_std(s1, s2, count[n], pca_, n, dataset)
         # ====== dataset flush() ====== #
         dataset.flush()
         dataset.close()
@@ -510,18 +1130,12 @@ def _load_audio(path_or_ds, segments,
             s = path_or_ds['raw'][st:en]
             N = len(s)
             sr_orig = path_or_ds['sr'][name]
-        # start processing
-        if 0. <= start < 1. and 0. < end <= 1.: # percentage
-            start = int(start * N)
-            end = int(np.ceil(end * N))
-        else: # given the duration in second
-            start = int(float(start) * sr_orig)
-            end = int(N if end <= 0 else float(end) * sr_orig)
-        # check maxlen
-        if maxlen is not None and (end - start > maxlen * sr_orig):
+        for name_, start_, end_, split in _cut_segment(name, start, end, N,
+                                                       sr_orig, maxlen,
+                                                       vad_split):
+            data = s[start_:end_, channel] if s.ndim > 1 else s[start_:end_]
             # using VAD information to split the audio
-            if vad_split:
-                data = s[start:end, channel] if s.ndim > 1 else s[start:end]
+            if split:
                 data = signal.vad_split_audio(data, sr=sr_orig,
                     maximum_duration=maxlen, minimum_duration=minimum_duration,
                     frame_length=frame_length, nb_mixtures=nb_mixtures,
@@ -533,21 +1147,56 @@ def _load_audio(path_or_ds, segments,
                     yield (name + ":%s:%s" % (st_, en_),
                            d,
                            sr_orig)
-            # just cut into small segments
             else:
-                maxlen = int(maxlen * sr_orig)
-                _ = list(range(start, end, maxlen)) + [end]
-                for st, en in zip(_, _[1:]):
-                    st_ = ('%f' % (st / sr_orig)).rstrip('0').rstrip('.')
-                    en_ = ('%f' % (en / sr_orig)).rstrip('0').rstrip('.')
-                    yield (name + ":%s:%s" % (st_, en_),
-                           s[st:en, channel] if s.ndim > 1 else s[st:en],
-                           sr_orig)
-        # return normally
-        else:
-            yield (name,
-                   s[start:end, channel] if s.ndim > 1 else s[start:end],
-                   sr_orig)
+                yield name_, data, sr_orig
+
+
+def _cut_segment(name, start, end, N, sr, maxlen, vad_split):
+    """ Return list of (name, start, end, split) the samples of given
+    segment of an audio with `N` samples, the segment longer than `maxlen`
+    is cut into small segments, or must be split using VAD (`split=True`) """
+    if 0. <= start < 1. and 0. < end <= 1.: # percentage
+        start = int(start * N)
+        end = int(np.ceil(end * N))
+    else: # given the duration in second
+        start = int(float(start) * sr)
+        end = int(N if end <= 0 else float(end) * sr)
+    # return normally
+    if maxlen is None or end - start <= maxlen * sr:
+        return [(name, start, end, False)]
+    if vad_split:
+        return [(name, start, end, True)]
+    # just cut into small segments
+    length = int(maxlen * sr)
+    cuts = list(range(start, end, length)) + [end]
+    segments = []
+    for st, en in zip(cuts, cuts[1:]):
+        st_ = ('%f' % (st / sr)).rstrip('0').rstrip('.')
+        en_ = ('%f' % (en / sr)).rstrip('0').rstrip('.')
+        segments.append((name + ":%s:%s" % (st_, en_), st, en, False))
+    return segments
+
+
+def _audio_length(path, sr, sr_info={}, sr_new=None):
+    """ Return the number of samples and the sample rate of the audio
+    loaded by `_load_audio`, without decoding and resampling it """
+    N, sr_orig = speech.read_length(path)
+    if sr_orig is not None and sr is not None and sr_orig != sr:
+        raise RuntimeError('Given sample rate (%d Hz) is different from '
+                           'audio file sample rate (%d Hz).' % (sr, sr_orig))
+    if sr_orig is None:
+        sr_orig = sr
+    if sr_orig is None:
+        sr_orig = sr_info.get(path, None)
+    if sr_orig is None or N < 25:
+        raise RuntimeError("Cannot load audio file: '%s'" % path)
+    # same length as returned by `speech.resample`
+    if sr_new is not None and int(sr_new) > int(sr_orig):
+        raise RuntimeError('Do not support upsampling audio.')
+    elif sr_new is not None and int(sr_new) != int(sr_orig):
+        N = int(N * float(sr_new) / sr_orig)
+        sr_orig = sr_new
+    return N, sr_orig
 
 
 class WaveProcessor(FeatureProcessor):
@@ -628,6 +1277,14 @@ class WaveProcessor(FeatureProcessor):
                                      ('dtype', 'dict', False)]
         self.ignore_error = bool(ignore_error)
 
+    def source(self, job):
+        audio_path, segments = job[0] if len(job) == 1 else job
+        return audio_path if is_string(audio_path) else None
+
+    def segment_names(self, job):
+        audio_path, segments = job[0] if len(job) == 1 else job
+        return [name for name, start, end, channel in segments]
+
     def map(self, job):
         audio_path, segments = job[0] if len(job) == 1 else job
         nb_jobs = len(segments)
@@ -651,7 +1308,7 @@ class WaveProcessor(FeatureProcessor):
             else:
                 raise RuntimeError(msg)
 
-    def _validate(self, ds, path, nb_samples, logger):
+    def _validate(self, ds, path, nb_samples, logger, rows):
         import matplotlib
         matplotlib.use('Agg')
         from matplotlib import pyplot as plt
@@ -661,29 +1318,27 @@ class WaveProcessor(FeatureProcessor):
         indices = sorted([(name, start, end)
                          for name, (start, end) in ds['indices'].iteritems()],
                          key=lambda x: x[1])
-        prog = Progbar(target=len(indices) // 2, interval=0.1)
         for prev, now in zip(indices, indices[1:]):
-            prog.add(1)
             assert prev[2] == now[1] # non-zero length
             assert prev[2] - prev[1] > 0 # non-zero length
             assert now[2] - now[1] > 0 # non-zero length
         assert now[-1] == len(ds['raw']) # length match length of raw
-        print(); logger("Checked all indices", True)
+        logger("Checked all indices", True)
+        # ====== only corrupted and sampled segments are read ====== #
+        samples, checked = _checked_segments(indices, rows, nb_samples)
+        checked = [indices[i] for i in checked]
         # ====== check sample rate ====== #
-        for name, _, _ in Progbar(indices, interval=0.1,
-                                  print_report=True,
-                                  report_func=lambda x: [('Name', x[0])],
-                                  count_func=lambda x: 1):
+        for name, _, _ in checked:
             sr = ds['sr'][name]
             dtype = ds['dtype'][name]
             assert sr > 0 and dtype
-        logger("Checked all sample rate and data type", True)
+        logger("Checked sample rate and data type of %d segments" %
+               len(checked), True)
         # ====== checking raw signal ====== #
-        samples = np.random.choice(
-            np.arange(len(indices)), size=nb_samples, replace=False)
+        samples = set(indices[i][0] for i in samples)
         saved_samples = {}
         figure_path = os.path.join(path, 'raw.pdf')
-        for i, (name, start, end) in enumerate(Progbar(indices, interval=0.1,
+        for i, (name, start, end) in enumerate(Progbar(checked, interval=0.1,
                                                 count_func=lambda x: 1,
                                                 report_func=lambda x: [('Name', x[0])],
                                                 print_report=True)):
@@ -691,7 +1346,7 @@ class WaveProcessor(FeatureProcessor):
             assert not np.any(np.isnan(raw)) # No NaN value
             assert not np.all(np.isclose(raw, 0.)) # not all value closed to zeros
             # saving audio
-            if i in samples:
+            if name in samples:
                 _ = os.path.join(path, 'tmp%d.wav' % i)
                 raw = raw[:].astype('float32')
                 raw = (raw - raw.mean()) / raw.std()
@@ -705,10 +1360,9 @@ class WaveProcessor(FeatureProcessor):
                                              best_algorithm=False))
                     plt.title(name)
         plot_save(figure_path, dpi=80, log=False)
-        logger("Checked all raw signal", True)
+        logger("Checked raw signal of %d segments" % len(checked), True)
         for name, save_path in saved_samples.iteritems():
             logger('Saved "%s" at path: %s' % (name, save_path), True)
-        logger("Checked all raw signal", True)
         logger("Saved figure at path: %s" % figure_path, True)
         logger("All reports at folder: %s" % path, True)
 
@@ -801,6 +1455,10 @@ class SpeechProcessor(FeatureProcessor):
         if True, convert all power spectrogram to DB
     backend: 'odin', 'sptk'
         support backend for calculating the spectra
+    feature_cache: str, `speech.FeatureCache`, or None
+        path to a content-addressed cache of the intermediate stages
+        (STFT, mel-spectrogram, VAD, pitch), re-running with different
+        settings only recomputes the stages whose parameters changed
     pca: bool
         save trained PCA for each features
     pca_whiten : bool
@@ -867,7 +1525,7 @@ class SpeechProcessor(FeatureProcessor):
                 vad_smooth=3, vad_minlen=0.1,
                 cqt_bins=96, preemphasis=None,
                 center=True, power=2, log=True, backend='odin',
-                pca=True, pca_whiten=False,
+                feature_cache=None, pca=True, pca_whiten=False,
                 audio_ext=None,
                 maxlen=None, vad_split=False, vad_split_args={},
                 save_raw=False, save_stats=True, substitute_nan=None,
@@ -944,9 +1602,49 @@ class SpeechProcessor(FeatureProcessor):
         self.power = power
         self.log = log
         self.backend = backend
+        if feature_cache is not None and \
+        not isinstance(feature_cache, speech.FeatureCache):
+            feature_cache = speech.FeatureCache(feature_cache)
+        self.feature_cache = feature_cache
         self.ignore_error = bool(ignore_error)
 
     # ==================== Abstract properties ==================== #
+    def plan(self, job):
+        # the raw signal does not have the same length as the frames
+        if self.save_raw:
+            return None
+        audio_path, segments = job[0] if len(job) == 1 else job
+        try:
+            # the audio is only loaded if it must be split using VAD
+            if is_string(audio_path) and \
+            (self.maxlen is None or not self.vad_split):
+                N, sr_orig = _audio_length(audio_path, self.sr, self.sr_info,
+                                           self.sr_new)
+                lengths = [(name_, max(min(end_, N) - start_, 0), sr_orig)
+                           for name, start, end, channel in segments
+                           for name_, start_, end_, _ in _cut_segment(
+                               name, start, end, N, sr_orig, self.maxlen,
+                               self.vad_split)]
+            else:
+                lengths = [(name, data.size, sr_orig)
+                           for name, data, sr_orig in _load_audio(audio_path,
+                               segments, self.sr, self.sr_info, self.sr_new,
+                               self.best_resample, self.maxlen, self.vad_split,
+                               self.vad_split_args)]
+            return [(name, _nb_frames(n, sr_orig, self.win, self.hop,
+                                      self.center))
+                    for name, n, sr_orig in lengths]
+        except Exception: # the error is reported by `map`
+            return None
+
+    def source(self, job):
+        audio_path, segments = job[0] if len(job) == 1 else job
+        return audio_path if is_string(audio_path) else None
+
+    def segment_names(self, job):
+        audio_path, segments = job[0] if len(job) == 1 else job
+        return [name for name, start, end, channel in segments]
+
     def map(self, job):
         '''
         Return
@@ -957,27 +1655,32 @@ class SpeechProcessor(FeatureProcessor):
         nb_jobs = len(segments)
         try:
             ret = []
-            for name, data, sr_orig in _load_audio(audio_path, segments,
+            loaded = list(_load_audio(audio_path, segments,
                                 self.sr, self.sr_info, self.sr_new, self.best_resample,
-                                self.maxlen, self.vad_split, self.vad_split_args):
-                with warnings.catch_warnings():
-                    warnings.filterwarnings("ignore", category=UserWarning)
-                    features = speech.speech_features(data.ravel(), sr=sr_orig,
-                        win=self.win, hop=self.hop, window=self.window,
-                        nb_melfilters=self.nb_melfilters, nb_ceps=self.nb_ceps,
-                        get_spec=self.get_spec, get_qspec=self.get_qspec,
-                        get_phase=self.get_phase,
-                        get_pitch=self.get_pitch, get_f0=self.get_f0,
-                        get_vad=self.get_vad, get_energy=self.get_energy,
-                        get_delta=self.get_delta,
-                        pitch_threshold=self.pitch_threshold,
-                        pitch_fmax=self.pitch_fmax,
-                        pitch_algo=self.pitch_algo,
-                        vad_smooth=self.vad_smooth, vad_minlen=self.vad_minlen,
-                        cqt_bins=self.cqt_bins, fmin=self.fmin, fmax=self.fmax,
-                        sr_new=None, preemphasis=self.preemphasis,
-                        center=self.center, power=self.power, log=self.log,
-                        return_raw=self.save_raw, backend=self.backend)
+                                self.maxlen, self.vad_split, self.vad_split_args))
+            # all segments of the file are processed in one batch
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", category=UserWarning)
+                all_features = speech.speech_features_batch(
+                    [data.ravel() for name, data, sr_orig in loaded],
+                    sr=[sr_orig for name, data, sr_orig in loaded],
+                    win=self.win, hop=self.hop, window=self.window,
+                    nb_melfilters=self.nb_melfilters, nb_ceps=self.nb_ceps,
+                    get_spec=self.get_spec, get_qspec=self.get_qspec,
+                    get_phase=self.get_phase,
+                    get_pitch=self.get_pitch, get_f0=self.get_f0,
+                    get_vad=self.get_vad, get_energy=self.get_energy,
+                    get_delta=self.get_delta,
+                    pitch_threshold=self.pitch_threshold,
+                    pitch_fmax=self.pitch_fmax,
+                    pitch_algo=self.pitch_algo,
+                    vad_smooth=self.vad_smooth, vad_minlen=self.vad_minlen,
+                    cqt_bins=self.cqt_bins, fmin=self.fmin, fmax=self.fmax,
+                    sr_new=None, preemphasis=self.preemphasis,
+                    center=self.center, power=self.power, log=self.log,
+                    return_raw=self.save_raw, backend=self.backend,
+                    cache=self.feature_cache)
+            for (name, data, sr_orig), features in zip(loaded, all_features):
                 if features is not None:
                     saved_features = []
                     found_NaN = False
@@ -1009,7 +1712,7 @@ class SpeechProcessor(FeatureProcessor):
             else:
                 raise RuntimeError(msg)
 
-    def _validate(self, ds, path, nb_samples, logger):
+    def _validate(self, ds, path, nb_samples, logger, rows):
         print(ds)
         import matplotlib
         matplotlib.use('Agg')
@@ -1032,10 +1735,11 @@ class SpeechProcessor(FeatureProcessor):
         assert now[-1] == len(ds['raw']) # length match length of raw
         logger("Checked all indices", True)
         # ====== check sample rate ====== #
-        for name, _, _ in indices:
-            sr = ds['sr'][name]
+        samples, checked = _checked_segments(indices, rows, nb_samples)
+        for i in checked:
+            sr = ds['sr'][indices[i][0]]
             assert sr > 0
-        logger("Checked all sample rate and data type", True)
+        logger("Checked sample rate of %d segments" % len(checked), True)
         logger("All reports at folder: %s" % path, True)
 
 
@@ -35,7 +35,7 @@ from odin.utils import (segment_list, one_hot, flatten_list, is_string,
                         get_process_status, SharedCounter, as_tuple)
 from odin.utils.mpi import MPI
 
-from .data import MutableData, as_data
+from .data import MutableData, MmapData, Hdf5Data, open_hdf5, as_data
 from .dataset import Dataset
 from .recipes import FeederList, FeederRecipe
 
@@ -128,11 +128,33 @@ _apply_approx = lambda n, x: int(round(n * x)) if x < 1. + 1e-12 else int(x)
 
 
 def _dump_data_info(data):
-    raise NotImplementedError
+    """ Only the location of memmap and hdf5 Data is pickled, the
+    unpickled Feeder attaches read-only handles to them """
+    info = []
+    for d in data:
+        if isinstance(d, MmapData):
+            d.flush()
+            info.append(('memmap', d.path, d._transformer))
+        elif isinstance(d, Hdf5Data):
+            d.flush()
+            info.append(('hdf5', (d.path, d.name), d._transformer))
+        else:
+            info.append(('data', d, None))
+    return info
 
 
 def _load_data_info(info):
-    raise NotImplementedError
+    data = []
+    for dtype, d, transformer in info:
+        if dtype == 'memmap':
+            d = MmapData.attach(d)
+        elif dtype == 'hdf5':
+            path, name = d
+            d = Hdf5Data(name, hdf=open_hdf5(path, read_only=True))
+        if transformer is not None:
+            d.transform(transformer)
+        data.append(d)
+    return tuple(data)
 
 
 class Feeder(MutableData):
@@ -260,6 +282,9 @@ class Feeder(MutableData):
                 self.maximum_queue_size)
 
     def __setstate__(self, states):
+        super(Feeder, self).__init__()
+        self._batch_filter = lambda x: x
+        self._batch_mode = 'batch'
         (data, self._indices, self._outtype,
          self._recipes, self.ncpu, self.buffer_size,
          self.maximum_queue_size) = states
@@ -360,6 +385,7 @@ class Feeder(MutableData):
         end = _apply_approx(n, self._end)
         indices = self._indices[start:end]
         outtype = self._outtype
+        pattern = 'sequential' if self._seed is None else 'random'
         # ====== shuffle the indices ====== #
         rng = None
         shuffle_level = self._shuffle_level
@@ -373,18 +399,31 @@ class Feeder(MutableData):
         batch_size = self._batch_size
         batch_filter = self._batch_filter
         process_func = self._recipes.process
+        # read-only handles, attached once and inherited by all workers
+        data = [d.shared() for d in self._data]
+        # ====== access pattern hints ====== #
+        # shuffled indices jump all over the file, readahead is wasted,
+        # the hints are given to the shared handles which are read
+        for d in data:
+            if hasattr(d, 'advise'):
+                d.advise(pattern)
 
         # ====== create wrapped functions ====== #
         def map_func(jobs):
             batch = []
+            # let the kernel read ahead the rows of all jobs in this buffer
+            for d in data:
+                if hasattr(d, 'advise'):
+                    for name, start, end in jobs:
+                        d.advise('willneed', int(start), int(end))
             for name, start, end in jobs:
                 start = int(start)
                 end = int(end)
                 # data can be list of Data, or just 1 Data
                 if outtype is not None:
-                    x = [np.array(d[start:end], dtype=t) for d, t in zip(self._data, outtype)]
+                    x = [np.array(d[start:end], dtype=t) for d, t in zip(data, outtype)]
                 else:
-                    x = [np.array(d[start:end]) for d in self._data]
+                    x = [np.array(d[start:end]) for d in data]
                 x = process_func(name, x, [])
                 if x is not None:
                     # not care about return kwargs (only: name, X, y)
@@ -15,7 +15,7 @@ import numpy as np
 from odin.utils import (segment_list, one_hot, is_string, axis_normalize,
                         is_number, UnitTimer, get_system_status, batching,
                         get_process_status, SharedCounter, as_tuple)
-from odin.preprocessing.signal import segment_axis, compute_delta
+from odin.preprocessing.signal import segment_axis, stack_deltas
 from odin.utils.decorators import functionable
 
 from .data import Data, MutableData
@@ -421,10 +421,9 @@ class ComputeDelta(FeederRecipe):
         if self.delta > 0:
             data_idx = axis_normalize(self.data_idx, ndim=len(X))
             X = [x if i not in data_idx else
-                 np.concatenate(
-                     ([x] if self.keep_original else []) +
-                     compute_delta(x, order=self.delta, axis=self.axis),
-                     axis=self.axis)
+                 stack_deltas(x, order=self.delta, axis=self.axis,
+                              stack_axis=self.axis,
+                              keep_original=self.keep_original)
                  for i, x in enumerate(X)]
         return name, X, y
 
@@ -806,9 +805,14 @@ class VADindex(FeederRecipe):
         # ====== processing ====== #
         indices_new = {}
         n = 0
-        for name, segments in self.vad.iteritems():
-            # not found find in original indices
-            if name not in indices: continue
+        names = list(indices.keys())
+        if hasattr(self.vad, 'get_many'): # batch lookup for MmapDict, SQLiteDict
+            all_segments = self.vad.get_many(names, missing='default')
+        else:
+            all_segments = [self.vad.get(name, None) for name in names]
+        for name, segments in zip(names, all_segments):
+            # not found the name in vad
+            if segments is None: continue
             # found the name, and update its indices
             n_file = 0
             for start, end in segments:
@@ -2,13 +2,15 @@ from __future__ import print_function, division, absolute_import
 
 import os
 import mmap
+import struct
 import marshal
+import hashlib
 import sqlite3
+import threading
 from six.moves import cPickle
 from itertools import chain
 from contextlib import contextmanager
 from collections import OrderedDict, Iterator, defaultdict
-import io
 
 import numpy as np
 
@@ -16,33 +18,387 @@ from odin.config import get_rng
 from odin.utils import async, is_string, ctext
 
 
+# ===========================================================================
+# Helpers
+# ===========================================================================
+_MISSING_POLICY = ('raise', 'default', 'skip')
+# marker of not found value, since None could be stored
+_MISSING = object()
+# ====== typed value codec ====== #
+# |magic|header length|"dtype|shape"|padding|raw buffer|, marshal never
+# starts with '\x00'
+_ARRAY_MAGIC = '\x00ODA'
+_ARRAY_HEADER = struct.Struct('<I')
+_ARRAY_ALIGN = 16
+
+
+def _encode_value(value):
+    """ numpy.ndarray of primitive dtype is stored as raw buffer with
+    a small header, the data start is aligned to 16 bytes; other values
+    (and object or structured arrays) are marshalled """
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject or value.dtype.fields is not None:
+            return marshal.dumps(value.tolist())
+        header = '%s|%s' % (value.dtype.str, ','.join(str(i) for i in value.shape))
+        n = len(_ARRAY_MAGIC) + _ARRAY_HEADER.size + len(header)
+        padding = '\x00' * ((_ARRAY_ALIGN - n % _ARRAY_ALIGN) % _ARRAY_ALIGN)
+        return (_ARRAY_MAGIC + _ARRAY_HEADER.pack(len(header)) + header +
+                padding + np.ascontiguousarray(value).tostring())
+    return marshal.dumps(value)
+
+
+def _decode_value(buffer, start=0, size=None):
+    """ Decode the value stored in `buffer[start:start + size]`, arrays are
+    returned as read-only `numpy.frombuffer` view of the `buffer`
+    (zero-copy) """
+    if size is None:
+        size = len(buffer) - start
+    if buffer[start:start + len(_ARRAY_MAGIC)] != _ARRAY_MAGIC:
+        return marshal.loads(buffer[start:start + size])
+    # ====== read the header ====== #
+    offset = start + len(_ARRAY_MAGIC)
+    n = _ARRAY_HEADER.unpack(buffer[offset:offset + _ARRAY_HEADER.size])[0]
+    offset += _ARRAY_HEADER.size
+    dtype, shape = buffer[offset:offset + n].split('|')
+    dtype = np.dtype(dtype)
+    shape = tuple(int(i) for i in shape.split(',') if len(i) > 0)
+    offset += n
+    offset += (_ARRAY_ALIGN - (offset - start) % _ARRAY_ALIGN) % _ARRAY_ALIGN
+    # ====== zero-copy view ====== #
+    count = int(np.prod(shape)) if len(shape) > 0 else 1
+    if count == 0:
+        return np.empty(shape=shape, dtype=dtype)
+    value = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+    value.flags.writeable = False
+    return value.reshape(shape)
+
+
+
+class _LRUCache(object):
+    """ Bounded least-recently-used cache for reading, the total size
+    of cached values (in bytes) never exceed `max_bytes` """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._data = OrderedDict() # key -> (value, nbytes)
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enable(self):
+        return self.max_bytes > 0
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._data),
+                'nbytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return default
+            # re-insert as the most recently used
+            self._data[key] = item
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes):
+        nbytes = int(nbytes)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._data[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, n) = self._data.popitem(last=False)
+                self.nbytes -= n
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+
+def _check_missing_policy(missing):
+    missing = str(missing).lower()
+    if missing not in _MISSING_POLICY:
+        raise ValueError("`missing` policy must be one of: %s, but given: %s"
+                         % (', '.join(_MISSING_POLICY), missing))
+    return missing
+
+
+def _apply_missing_policy(keys, results, found, missing, default):
+    """ Return the list of `results` in the order of `keys`, handle the
+    keys not `found` by `missing` policy """
+    if all(found):
+        return results
+    if missing == 'raise':
+        not_found = [k for k, f in zip(keys, found) if not f]
+        raise KeyError("Cannot find %d keys in the dictionary, e.g. %s" %
+                       (len(not_found), ', '.join(not_found[:8])))
+    elif missing == 'default':
+        return [r if f else default for r, f in zip(results, found)]
+    return [r for r, f in zip(results, found) if f]
+
+
 # ===========================================================================
 # MmapDict
 # ===========================================================================
+_INDEX_HEADER = 'mmapidx1'
+# capacity, number of keys, number of used slots (keys and deleted slots)
+_INDEX_INFO = struct.Struct('<QQQ')
+# hash, key position, value position, key length, value length
+_INDEX_SLOT = struct.Struct('<QQQII')
+_INDEX_DTYPE = np.dtype([('hash', '<u8'), ('kpos', '<u8'), ('vpos', '<u8'),
+                         ('klen', '<u4'), ('vlen', '<u4')])
+_EMPTY_SLOT = 0
+_DELETED_SLOT = 1
+# the table is reallocated with double capacity if used slots excess this
+_MAX_LOAD_FACTOR = 0.7
+_MIN_CAPACITY = 1024
+
+
+def _hash_key(key):
+    """ Stable 64-bit hash (the same across processes and sessions),
+    0 and 1 are reserved for empty and deleted slots """
+    h = struct.unpack('<Q', hashlib.md5(key).digest()[:8])[0]
+    return h if h > _DELETED_SLOT else h + 2
+
+
+def _build_table(records, capacity):
+    """ Place the `records` (structured array with `_INDEX_DTYPE`) into a new
+    linear probing table of given `capacity` without probing one by one """
+    table = np.zeros(shape=(capacity,), dtype=_INDEX_DTYPE)
+    n = len(records)
+    if n == 0:
+        return table
+    home = (records['hash'] % np.uint64(capacity)).astype('int64')
+    order = np.argsort(home, kind='mergesort')
+    records = records[order]
+    home = home[order]
+    # records sorted by home slot, each record takes the first slot after
+    # its home and the slot of the previous record
+    arange = np.arange(n, dtype='int64')
+    position = np.maximum.accumulate(home - arange) + arange
+    wrapped = position >= capacity
+    table[position[~wrapped]] = records[~wrapped]
+    # records overflow the end of table take the first free slots
+    if np.any(wrapped):
+        free = np.nonzero(table['hash'] == _EMPTY_SLOT)[0]
+        table[free[:np.sum(wrapped)]] = records[wrapped]
+    return table
+
+
+class _HashIndex(object):
+    """ Open addressing (linear probing) hash table stored inside the
+    MmapDict file, map: key -> (position, size) of the encoded value.
+    Lookups probe the memory-mapped table directly, nothing is loaded
+    when opening.
+
+    ==> |'mmapidx1'|capacity|nb_keys|nb_used|slot_0|slot_1|...|
+
+    each slot is (hash, key_position, value_position, key_length,
+    value_length) of 32 bytes.
+    """
+
+    def __init__(self, mmap, offset):
+        self.mmap = mmap
+        self.offset = int(offset)
+
+    # ==================== table info ==================== #
+    @property
+    def info(self):
+        if self.offset == 0:
+            return 0, 0, 0
+        return _INDEX_INFO.unpack_from(self.mmap, self.offset + len(_INDEX_HEADER))
+
+    @property
+    def capacity(self):
+        return self.info[0]
+
+    @property
+    def used(self):
+        return self.info[2]
+
+    @property
+    def _base(self):
+        return self.offset + len(_INDEX_HEADER) + _INDEX_INFO.size
+
+    def _set_info(self, capacity, count, used):
+        start = self.offset + len(_INDEX_HEADER)
+        self.mmap[start:start + _INDEX_INFO.size] = \
+            _INDEX_INFO.pack(capacity, count, used)
+
+    @staticmethod
+    def nbytes(capacity):
+        return len(_INDEX_HEADER) + _INDEX_INFO.size + capacity * _INDEX_SLOT.size
+
+    @staticmethod
+    def dump(table, count):
+        """ Serialize the table (array of `_INDEX_DTYPE`) to string """
+        return (_INDEX_HEADER +
+                _INDEX_INFO.pack(len(table), count, count) +
+                table.tostring())
+
+    # ==================== probing ==================== #
+    def _find(self, key, h):
+        """ Return: (slot_id, slot) of the key, or (free_slot_id, None) """
+        capacity = self.capacity
+        if capacity == 0:
+            return None, None
+        m = self.mmap
+        base = self._base
+        i = h % capacity
+        free = None
+        while True:
+            slot = _INDEX_SLOT.unpack_from(m, base + i * _INDEX_SLOT.size)
+            if slot[0] == _EMPTY_SLOT:
+                return (i if free is None else free), None
+            elif slot[0] == _DELETED_SLOT:
+                if free is None:
+                    free = i
+            elif slot[0] == h and slot[3] == len(key) and \
+            m[slot[1]:slot[1] + slot[3]] == key:
+                return i, slot
+            i = (i + 1) % capacity
+
+    def get(self, key, default=None):
+        slot = self._find(key, _hash_key(key))[1]
+        return default if slot is None else (slot[2], slot[4])
+
+    def put(self, key, kpos, vpos):
+        """ Insert or replace the key, the table must have free slots """
+        vpos, vlen = vpos
+        h = _hash_key(key)
+        i, slot = self._find(key, h)
+        capacity, count, used = self.info
+        start = self._base + i * _INDEX_SLOT.size
+        self.mmap[start:start + _INDEX_SLOT.size] = \
+            _INDEX_SLOT.pack(h, kpos, vpos, len(key), vlen)
+        if slot is None:
+            self._set_info(capacity, count + 1, used + 1)
+
+    def __delitem__(self, key):
+        i, slot = self._find(key, _hash_key(key))
+        if slot is None:
+            raise KeyError(key)
+        capacity, count, used = self.info
+        start = self._base + i * _INDEX_SLOT.size
+        self.mmap[start:start + _INDEX_SLOT.size] = \
+            _INDEX_SLOT.pack(_DELETED_SLOT, 0, 0, 0, 0)
+        self._set_info(capacity, count - 1, used)
+
+    def clear(self):
+        if self.offset == 0:
+            return
+        capacity = self.capacity
+        self.mmap[self._base:self._base + capacity * _INDEX_SLOT.size] = \
+            '\x00' * (capacity * _INDEX_SLOT.size)
+        self._set_info(capacity, 0, 0)
+
+    # ==================== dictionary ==================== #
+    def __getitem__(self, key):
+        slot = self.get(key)
+        if slot is None:
+            raise KeyError(key)
+        return slot
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self.info[1]
+
+    def __eq__(self, other):
+        return dict(self.iteritems()) == dict(other.iteritems())
+
+    def records(self, block=65536):
+        """ Iterate over the copies of all live slots, block by block """
+        capacity = self.capacity
+        for start in range(0, capacity, block):
+            n = min(block, capacity - start)
+            table = np.frombuffer(self.mmap, dtype=_INDEX_DTYPE, count=n,
+                offset=self._base + start * _INDEX_SLOT.size)
+            table = np.array(table[table['hash'] > _DELETED_SLOT])
+            if len(table) > 0:
+                yield table
+
+    def iteritems(self):
+        m = self.mmap
+        for table in self.records():
+            for h, kpos, vpos, klen, vlen in table.tolist():
+                yield m[kpos:kpos + klen], (vpos, vlen)
+
+    def iterkeys(self):
+        for key, _ in self.iteritems():
+            yield key
+
+    def keys(self):
+        return list(self.iterkeys())
+
+
 class MmapDict(dict):
     """ MmapDict
     Handle enormous dictionary (up to thousand terabytes of data) in
     memory mapped dictionary, extremely fast to load, and for randomly access.
     The alignment of saved files:
 
-    ==> |'mmapdict'|48-bytes(max_pos)|48-bytes(dict_size)|MmapData|indices-dict|
+    ==> |'mmapdict'|48-bytes(max_pos)|48-bytes(index_pos)|values and indices|
 
-    * The first 48-bytes number: is ending position of the Mmmap, start from
+    * The first 48-bytes number: is ending position of the file, start from
     the (8 + 48 + 48) bytes.
 
-    * The next 48-bytes number: is length of pickled indices (i.e. the
-    indices start from max_pos to max_pos + dict_size)
+    * The next 48-bytes: "idx:[position]" of the binary hash index (see
+    `_HashIndex`), the index is probed directly from the memory map, hence,
+    opening is O(1) and appending only writes the new slots. The index is
+    reallocated (at the end of the file) when its load factor excess 0.7.
+    Each value is stored as |key|value|, numpy.ndarray is stored as raw
+    buffer (aligned to 16 bytes) and returned as read-only view of the
+    memory map (zero-copy), other values are marshalled.
+
+    Old files store a pickled indices dictionary at max_pos, and the second
+    number is its length. They are read as before, and converted to the
+    binary index at the first flush in writing mode.
+
+    Parameters
+    ----------
+    path: str
+        path to the file
+    cache_size: int
+        number of (key, value) pairs are cached before written to the file
+    read_only: bool
+        no writing is allowed
+    override: bool
+        remove the old file if existed
+    read_cache_size: float
+        maximum size (in MegaBytes) of the least-recently-used cache for
+        reading, 0 for disable.
 
     Note
     ----
-    Only support (key, value) types = (str, primitive_type)
+    Only support (key, value) types = (str, primitive_type or numpy.ndarray)
+    The memory map is only unmapped after all returned arrays are released.
     MmapDict read speed is double faster than SQLiteDict.
     MmapDict also support multiprocessing
     """
     HEADER = 'mmapdict'
     SIZE_BYTES = 48
-    # the indices are flushed after it is increased this amount of size
-    MAX_INDICES_SIZE = 25 # in megabyte
     __INSTANCES = {}
 
     def __new__(clazz, *args, **kwargs):
@@ -62,13 +418,15 @@ class MmapDict(dict):
         return new_instance
 
     def __init__(self, path, cache_size=250,
-                 read_only=False, override=False):
+                 read_only=False, override=False, read_cache_size=0):
         super(MmapDict, self).__init__()
         # ====== check override ====== #
         if override and os.path.exists(path):
             os.remove(path)
         # ====== init ====== #
         self.__init(path, cache_size, read_only)
+        # LRU cache for reading (in MegaBytes)
+        self._read_cache = _LRUCache(read_cache_size * 1024 * 1024)
 
     def __init(self, path, cache_size, read_only):
         path = os.path.abspath(path)
@@ -83,12 +441,17 @@ class MmapDict(dict):
                                 'for MmapDict.')
             # 48 bytes for the file size
             max_position = int(file.read(MmapDict.SIZE_BYTES))
-            # length of pickled indices dictionary
-            dict_size = int(file.read(MmapDict.SIZE_BYTES))
-            # read dictionary
-            file.seek(max_position)
-            pickled_indices = file.read(dict_size)
-            self._indices_dict = async(lambda: cPickle.loads(pickled_indices))()
+            index_position = file.read(MmapDict.SIZE_BYTES).strip()
+            # binary hash index
+            if index_position[:4] == 'idx:':
+                index_position = int(index_position[4:])
+            # old format: length of pickled indices dictionary
+            else:
+                dict_size = int(index_position)
+                index_position = None
+                file.seek(max_position)
+                pickled_indices = file.read(dict_size)
+                self._indices_dict = async(lambda: cPickle.loads(pickled_indices))()
         # ====== create new file from scratch ====== #
         else:
             if read_only:
@@ -99,18 +462,18 @@ class MmapDict(dict):
             # just write the header
             file.write(('%' + str(MmapDict.SIZE_BYTES) + 'd') %
                        (len(MmapDict.HEADER) + MmapDict.SIZE_BYTES * 2))
-            # write the length of Pickled indices dictionary
-            file.write(('%' + str(MmapDict.SIZE_BYTES) + 'd') % 0)
+            # no index has been allocated
+            file.write(('%' + str(MmapDict.SIZE_BYTES) + 's') % 'idx:0')
             file.flush()
-            # init indices dict
-            self._indices_dict = {}
+            index_position = 0
         # ====== create Mmap from offset file ====== #
         self._file = file
         self._mmap = mmap.mmap(file.fileno(), length=0, offset=0,
                                flags=mmap.MAP_SHARED)
+        if index_position is not None:
+            self._indices_dict = _HashIndex(self._mmap, index_position)
         # store all the (key, value) recently added
         self._cache_dict = {}
-        self._increased_indices_size = 0.
         self._is_closed = False
 
     # ==================== pickling ==================== #
@@ -123,7 +486,7 @@ class MmapDict(dict):
     # ==================== I/O methods ==================== #
     @property
     def indices(self):
-        if not isinstance(self._indices_dict, dict):
+        if not isinstance(self._indices_dict, (dict, _HashIndex)):
             self._indices_dict = self._indices_dict.get()
         return self._indices_dict
 
@@ -131,7 +494,7 @@ class MmapDict(dict):
     def is_loaded(self):
         if self.is_closed:
             return False
-        if not isinstance(self._indices_dict, dict):
+        if not isinstance(self._indices_dict, (dict, _HashIndex)):
             return self._indices_dict.finished
         return True
 
@@ -143,17 +506,93 @@ class MmapDict(dict):
     def path(self):
         return self._path
 
+    @property
+    def read_cache_stats(self):
+        """ hits, misses, evictions, size and nbytes of the reading cache """
+        return self._read_cache.stats
+
+    def set_read_cache_size(self, read_cache_size):
+        """ Change the maximum size (in MegaBytes) of the reading cache,
+        0 for disable """
+        self._read_cache.clear()
+        self._read_cache.max_bytes = int(read_cache_size * 1024 * 1024)
+        return self
+
+    def _remap(self):
+        self._file.flush()
+        # old map is released (unmapped) when no array view refers to it
+        del self._mmap
+        self._mmap = mmap.mmap(self._file.fileno(), length=0, offset=0,
+                               flags=mmap.MAP_SHARED)
+        if isinstance(self._indices_dict, _HashIndex):
+            self._indices_dict.mmap = self._mmap
+
+    def _write_header(self, max_position, index_position):
+        file = self._file
+        file.seek(len(MmapDict.HEADER))
+        file.write(('%' + str(MmapDict.SIZE_BYTES) + 'd') % max_position)
+        file.write(('%' + str(MmapDict.SIZE_BYTES) + 's') %
+                   ('idx:%d' % index_position))
+
+    def _allocate_index(self, max_position, nb_new):
+        """ Create new index at the end of the file which has enough free
+        slots for `nb_new` keys, copy all the existing keys to it.
+
+        Return
+        ------
+        new max_position
+        """
+        file = self._file
+        old_index = self.indices
+        # ====== collect the existed slots ====== #
+        if isinstance(old_index, _HashIndex):
+            records = list(old_index.records())
+            records = np.concatenate(records) if len(records) > 0 else \
+                np.empty(shape=(0,), dtype=_INDEX_DTYPE)
+        else: # old pickled dictionary, write all the keys to the file
+            file.seek(max_position)
+            records = np.empty(shape=(len(old_index),), dtype=_INDEX_DTYPE)
+            for i, (key, (vpos, vlen)) in enumerate(old_index.iteritems()):
+                records[i] = (_hash_key(key), max_position, vpos, len(key), vlen)
+                file.write(key)
+                max_position += len(key)
+        count = len(records)
+        # ====== new capacity ====== #
+        capacity = _MIN_CAPACITY
+        while (count + nb_new) > capacity * _MAX_LOAD_FACTOR / 2:
+            capacity *= 2
+        table = _build_table(records, capacity)
+        # ====== write the table (aligned to 8 bytes) ====== #
+        max_position += (8 - max_position % 8) % 8
+        file.seek(max_position)
+        file.write(_HashIndex.dump(table, count))
+        self._indices_dict = _HashIndex(self._mmap, max_position)
+        return max_position + _HashIndex.nbytes(capacity)
+
     def flush(self, save_indices=False):
         """
         Parameters
         ----------
         save_indices: bool
-            force the indices dictionary to be saved, even though,
-            its increased hasn't reach the maximum.
+            kept for backward compatibility, the binary index is always
+            updated in-place.
         """
         # check if closed or in read only mode
         if self.is_closed or self.read_only:
             return
+        if len(self._cache_dict) == 0 and \
+        isinstance(self.indices, _HashIndex):
+            return
+        self._write_records([(key, _encode_value(value))
+                             for key, value in self._cache_dict.iteritems()])
+        # reset some values
+        del self._cache_dict
+        self._cache_dict = {}
+
+    def _write_records(self, records):
+        """ Append list of (key, encoded_value) to the file, then update
+        the index """
+        index = self.indices
         # ====== write new data ====== #
         # get old position
         file = self._file
@@ -161,40 +600,70 @@ class MmapDict(dict):
         file.seek(len(MmapDict.HEADER))
         max_position = int(file.read(MmapDict.SIZE_BYTES))
         # ====== serialize the data ====== #
-        # start from old_max_position, append new values
+        # start from old_max_position, append |key|padding|value|
         file.seek(max_position)
-        for key, value in self._cache_dict.iteritems():
-            value = marshal.dumps(value)
-            self.indices[key] = (max_position, len(value))
-            max_position += len(value)
+        new_slots = []
+        for key, value in records:
+            kpos = max_position
+            max_position += len(key)
+            padding = (_ARRAY_ALIGN - max_position % _ARRAY_ALIGN) % _ARRAY_ALIGN \
+                if value[:len(_ARRAY_MAGIC)] == _ARRAY_MAGIC else 0
+            max_position += padding
+            new_slots.append((key, kpos, (max_position, len(value))))
+            file.write(key + '\x00' * padding)
             file.write(value)
-            # increase indices size (in MegaBytes)
-            self._increased_indices_size += (8 + 8 + len(key)) / 1024. / 1024.
-        # ====== write the dumped indices ====== #
-        indices_length = 0
-        if save_indices or \
-        self._increased_indices_size > MmapDict.MAX_INDICES_SIZE:
-            indices_dump = cPickle.dumps(self.indices,
-                                         protocol=cPickle.HIGHEST_PROTOCOL)
-            indices_length = len(indices_dump)
-            file.write(indices_dump)
-            self._increased_indices_size = 0.
+            max_position += len(value)
+        # ====== grow the index if necessary ====== #
+        if not isinstance(index, _HashIndex) or \
+        index.used + len(new_slots) > index.capacity * _MAX_LOAD_FACTOR:
+            max_position = self._allocate_index(max_position, len(new_slots))
         # ====== update the position ====== #
-        # write new max size
-        file.seek(len(MmapDict.HEADER))
-        file.write(('%' + str(MmapDict.SIZE_BYTES) + 'd') % max_position)
-        # update length of pickled indices dictionary
-        if indices_length > 0:
-            file.write(('%' + str(MmapDict.SIZE_BYTES) + 'd') % indices_length)
+        self._write_header(max_position, self._indices_dict.offset)
+        # upate the mmap, then insert new keys to the index
+        self._remap()
+        for key, kpos, vpos in new_slots:
+            self._indices_dict.put(key, kpos, vpos)
         # flush everything
-        file.flush()
-        # upate the mmap
-        self._mmap.close(); del self._mmap
-        self._mmap = mmap.mmap(file.fileno(), length=0, offset=0,
-                               flags=mmap.MAP_SHARED)
-        # reset some values
-        del self._cache_dict
-        self._cache_dict = {}
+        self._mmap.flush()
+
+    # ==================== concurrent segments ==================== #
+    @property
+    def segments(self):
+        """ Return list of path to the segments written by
+        `MmapDictSegment` for this dictionary """
+        folder, name = os.path.split(self.path)
+        prefix = name + MmapDictSegment.EXTENSION
+        return sorted(os.path.join(folder, i) for i in os.listdir(folder)
+                      if i[:len(prefix)] == prefix and i[len(prefix):].isdigit())
+
+    def merge_segments(self, remove=True):
+        """ Compact all the records written to the segments (by concurrent
+        processes using `MmapDictSegment`) into this dictionary, the
+        segments are removed afterward.
+
+        Note
+        ----
+        The segments must not be written while merging.
+        """
+        if self.read_only:
+            raise RuntimeError("Cannot merge segments to MmapDict in "
+                               "read_only mode.")
+        self.flush()
+        self._read_cache.clear()
+        segments = self.segments
+        for path in segments:
+            records = []
+            for key, value in MmapDictSegment.read_records(path):
+                records.append((key, value))
+                if len(records) >= self.cache_size:
+                    self._write_records(records)
+                    records = []
+            if len(records) > 0:
+                self._write_records(records)
+        if remove:
+            for path in segments:
+                os.remove(path)
+        return self
 
     def close(self):
         # check if closed
@@ -205,7 +674,7 @@ class MmapDict(dict):
             self.flush(save_indices=True)
         # remove global instance
         del MmapDict.__INSTANCES[self.path]
-        self._mmap.close()
+        del self._mmap
         self._file.close()
         self._is_closed = True
         del self._indices_dict
@@ -231,6 +700,7 @@ class MmapDict(dict):
         if self.read_only:
             return
         key = str(key)
+        self._read_cache.invalidate(key)
         # store newly added value for fast query
         self._cache_dict[key] = value
         if len(self._cache_dict) > self.cache_size:
@@ -243,23 +713,37 @@ class MmapDict(dict):
         if key in self._cache_dict:
             return self._cache_dict[key]
         # ====== load from mmap ====== #
+        if self._read_cache.enable:
+            value = self._read_cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
         start, size = self.indices[key]
-        self._mmap.seek(start)
-        return marshal.loads(self._mmap.read(size))
+        value = _decode_value(self._mmap, start, size)
+        if self._read_cache.enable:
+            self._read_cache.put(key, value, size)
+        return value
 
     def __contains__(self, key):
-        return key in self.indices or key in self._cache_dict
+        return key in self._cache_dict or key in self.indices
 
     def __len__(self):
-        return len(self.indices) + len(self._cache_dict)
+        n = len(self.indices) + len(self._cache_dict)
+        # the keys updated in cache are counted twice
+        return n - sum(1 for key in self._cache_dict if key in self.indices)
 
     def __delitem__(self, key):
         if self.read_only:
             return
+        found = False
+        self._read_cache.invalidate(key)
         if key in self._cache_dict:
-            del self._cache_dict
-        else:
+            del self._cache_dict[key]
+            found = True
+        if key in self.indices:
             del self.indices[key]
+            found = True
+        if not found:
+            raise KeyError(key)
 
     def __cmp__(self, d):
         if isinstance(d, MmapDict):
@@ -275,33 +759,89 @@ class MmapDict(dict):
         return list(self.iterkeys())
 
     def iterkeys(self):
-        return chain(self.indices.iterkeys(), self._cache_dict.iterkeys())
+        return chain((key for key in self.indices.iterkeys()
+                      if key not in self._cache_dict),
+                     self._cache_dict.iterkeys())
 
     def values(self):
         return list(self.itervalues())
 
     def itervalues(self, shuffle=False):
-        for name, (start, size) in self.indices.iteritems():
-            self._mmap.seek(start)
-            yield marshal.loads(self._mmap.read(size))
-        for val in self._cache_dict.itervalues():
-            yield val
+        for name, value in self.iteritems():
+            yield value
 
     def items(self):
         return list(self.iteritems())
 
     def iteritems(self):
         for name, (start, size) in self.indices.iteritems():
-            self._mmap.seek(start)
-            yield name, marshal.loads(self._mmap.read(size))
-        for key, val in self._cache_dict.itervalues():
+            if name not in self._cache_dict:
+                yield name, _decode_value(self._mmap, start, size)
+        for key, val in self._cache_dict.iteritems():
             yield key, val
 
+    def get_many(self, keys, missing='raise', default=None):
+        """ Return the values of given `keys` in the same order, the values
+        are read from the file in the order of their position.
+
+        Parameters
+        ----------
+        keys: list of str
+        missing: 'raise', 'default', 'skip'
+            policy for the keys not found: raise KeyError, return `default`
+            instead, or exclude them from the returned list.
+        default: object
+            returned value for missing keys if `missing='default'`
+        """
+        missing = _check_missing_policy(missing)
+        keys = [str(k) for k in keys]
+        results = [None] * len(keys)
+        found = [False] * len(keys)
+        indices = self.indices
+        read_cache = self._read_cache
+        positions = []
+        for i, key in enumerate(keys):
+            if key in self._cache_dict:
+                results[i] = self._cache_dict[key]
+                found[i] = True
+                continue
+            if read_cache.enable:
+                value = read_cache.get(key, _MISSING)
+                if value is not _MISSING:
+                    results[i] = value
+                    found[i] = True
+                    continue
+            position = indices.get(key)
+            if position is not None:
+                positions.append((position[0], position[1], i))
+        # ====== sequential reading ====== #
+        m = self._mmap
+        for start, size, i in sorted(positions):
+            results[i] = _decode_value(m, start, size)
+            found[i] = True
+            if read_cache.enable:
+                read_cache.put(keys[i], results[i], size)
+        return _apply_missing_policy(keys, results, found, missing, default)
+
+    def put_many(self, items):
+        """ Write all (key, value) `items` in a single flush """
+        if self.read_only:
+            raise RuntimeError("Cannot put_many for this Dict in read_only mode.")
+        if isinstance(items, dict):
+            items = items.iteritems()
+        for key, value in items:
+            key = str(key)
+            self._read_cache.invalidate(key)
+            self._cache_dict[key] = value
+        self.flush()
+        return self
+
     def clear(self):
         if self.read_only:
             return
         self.indices.clear()
         self._cache_dict.clear()
+        self._read_cache.clear()
         return self
 
     def copy(self):
@@ -317,24 +857,128 @@ class MmapDict(dict):
             self.__setitem__(key, value)
 
 
-# ===========================================================================
-# SQLiteDict
-# ===========================================================================
-def _adapt_array(arr):
-    """ Converts np.array to TEXT when inserting
-    http://stackoverflow.com/a/31312102/190597 (SoulNibbler)
+class MmapDictSegment(object):
+    """ Append-only writer of MmapDict for concurrent processes, each
+    process appends its records to its own segment file
+    (i.e. "[path].seg[pid]"), hence, no lock is required.
+    All the segments are merged into the dictionary by
+    `MmapDict.merge_segments`.
+
+    ==> |key_length|value_length|key|value|key_length|...
+
+    Example
+    -------
+    >>> def map_func(jobs):
+    ...     db = MmapDictSegment(path)
+    ...     for j in jobs:
+    ...         db[j] = process(j)
+    ...     db.flush()
+    >>> # after all processes finished
+    >>> MmapDict(path).merge_segments()
     """
-    out = io.BytesIO()
-    np.save(out, arr)
-    out.seek(0)
-    return sqlite3.Binary(out.read())
+    EXTENSION = '.seg'
+    RECORD = struct.Struct('<II')
+    __INSTANCES = {}
 
+    def __new__(clazz, *args, **kwargs):
+        path = kwargs.get('path', None)
+        if path is None:
+            path = args[0]
+        if not is_string(path):
+            raise ValueError("`path` for MmapDictSegment must be string, but "
+                             "given object with type: %s" % type(path))
+        # one instance for each process
+        key = (os.path.abspath(path), os.getpid())
+        if key in MmapDictSegment.__INSTANCES:
+            return MmapDictSegment.__INSTANCES[key]
+        new_instance = super(MmapDictSegment, clazz).__new__(clazz)
+        MmapDictSegment.__INSTANCES[key] = new_instance
+        return new_instance
 
-def _convert_array(text):
-    """ Converts TEXT to np.array when selecting """
-    out = io.BytesIO(text)
-    out.seek(0)
-    return np.load(out)
+    def __init__(self, path):
+        super(MmapDictSegment, self).__init__()
+        if getattr(self, '_file', None) is not None:
+            # the segment is still opened, unless it was merged (removed)
+            if os.path.exists(self.segment_path):
+                return
+            self._file.close()
+        self._path = os.path.abspath(path)
+        self._pid = os.getpid()
+        self._file = open(self.segment_path, mode='ab')
+
+    @property
+    def path(self):
+        """ path to the MmapDict """
+        return self._path
+
+    @property
+    def segment_path(self):
+        return self._path + MmapDictSegment.EXTENSION + str(self._pid)
+
+    @property
+    def is_closed(self):
+        return self._file is None
+
+    @staticmethod
+    def read_records(path):
+        """ Iterate over all (key, encoded_value) in the segment at `path`,
+        an incomplete record at the end (i.e. interrupted writing) is
+        ignored """
+        header_size = MmapDictSegment.RECORD.size
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(header_size)
+                if len(header) < header_size:
+                    break
+                klen, vlen = MmapDictSegment.RECORD.unpack(header)
+                key = f.read(klen)
+                value = f.read(vlen)
+                if len(value) < vlen:
+                    break
+                yield key, value
+
+    def __setitem__(self, key, value):
+        key = str(key)
+        value = _encode_value(value)
+        self._file.write(MmapDictSegment.RECORD.pack(len(key), len(value)) +
+                         key + value)
+
+    def update(self, items):
+        if isinstance(items, dict):
+            items = items.iteritems()
+        for key, value in items:
+            self.__setitem__(key, value)
+        return self
+
+    def flush(self):
+        """ Must be called before the records are merged """
+        if not self.is_closed:
+            self._file.flush()
+        return self
+
+    def close(self):
+        if self.is_closed:
+            return
+        self._file.close()
+        self._file = None
+        del MmapDictSegment.__INSTANCES[(self.path, self._pid)]
+
+    def __str__(self):
+        return '<MmapDictSegment path:"%s" closed:%s>' % \
+            (self.segment_path, self.is_closed)
+
+    def __repr__(self):
+        return str(self)
+
+
+# ===========================================================================
+# SQLiteDict
+# ===========================================================================
+def _encode_sqlite(value):
+    value = _encode_value(value)
+    if value[:len(_ARRAY_MAGIC)] == _ARRAY_MAGIC:
+        return sqlite3.Binary(value)
+    return value
 
 
 class TableDict(dict):
@@ -413,6 +1057,15 @@ class TableDict(dict):
         with self.table_context():
             return self._sqlite.__getitem__(key)
 
+    def get_many(self, keys, missing='raise', default=None):
+        with self.table_context():
+            return self._sqlite.get_many(keys, missing=missing, default=default)
+
+    def put_many(self, items):
+        with self.table_context():
+            self._sqlite.put_many(items)
+        return self
+
     def update(self, items):
         with self.table_context():
             self._sqlite.update(items)
@@ -497,14 +1150,39 @@ class SQLiteDict(dict):
     >>> [p.start() for p in pros]
     >>> [p.join() for p in pros]
 
+    Parameters
+    ----------
+    path: str
+        path to the database file
+    cache_size: int
+        number of (key, value) pairs are cached before written to database
+    read_only: bool
+        no writing is allowed
+    override: bool
+        remove the old database if existed
+    read_optimized: bool
+        if True, the database is opened in WAL journal mode (readers do not
+        block and are not blocked by the writer) and each thread or process
+        reads from its own connection, hence, concurrent readers are not
+        serialized; otherwise, the database is exclusively locked by this
+        connection, with in-memory journal and no synchronization, which
+        is fastest for a single writer.
+    read_cache_size: float
+        maximum size (in MegaBytes) of the least-recently-used cache for
+        reading, 0 for disable.
+
     Note
     ----
-    numpy.ndarray will be converted to list before dumped to the database,
-    hence, the speed of serialize and deserialize ndarray is extremely slow.
+    numpy.ndarray is stored as BLOB of its raw buffer, and returned as
+    read-only view of the BLOB (zero-copy), other values are marshalled.
     This dict is purely performing in multiprocessing
     """
 
     _DEFAULT_TABLE = '_default_'
+    # maximum number of host parameters in a single SQL statement
+    _MAX_VARIABLES = 900
+    # number of prepared statements cached by each connection
+    _CACHED_STATEMENTS = 256
     __INSTANCES = {}
 
     def __new__(clazz, *args, **kwargs):
@@ -523,7 +1201,8 @@ class SQLiteDict(dict):
         SQLiteDict.__INSTANCES[path] = new_instance
         return new_instance
 
-    def __init__(self, path, cache_size=250, read_only=False, override=False):
+    def __init__(self, path, cache_size=250, read_only=False, override=False,
+                 read_optimized=False, read_cache_size=0):
         super(SQLiteDict, self).__init__()
         path = os.path.abspath(path)
         # ====== check override ====== #
@@ -535,22 +1214,74 @@ class SQLiteDict(dict):
         # ====== cache mechanism ====== #
         self._cache_size = int(cache_size)
         self._cache = defaultdict(dict)
+        # LRU cache for reading, key: (table, key)
+        self._read_cache = _LRUCache(read_cache_size * 1024 * 1024)
         # ====== db manager ====== #
         # detect_types=sqlite3.PARSE_DECLTYPES
-        self._conn = sqlite3.connect(path)
-        self._conn.text_factory = str
+        self._read_optimized = bool(read_optimized)
+        self._conn = self._connect()
         self._cursor = self._conn.cursor()
         # adjust pragma
-        # SQLITE_OPEN_EXCLUSIVE
-        self.connection.execute('PRAGMA main.locking_mode = EXCLUSIVE;')
-        self.connection.execute("PRAGMA main.synchronous = 0;")
-        self.connection.execute("PRAGMA journal_mode = MEMORY;")
+        if self._read_optimized:
+            self.connection.execute("PRAGMA journal_mode = WAL;")
+            self.connection.execute("PRAGMA main.synchronous = NORMAL;")
+        else:
+            # SQLITE_OPEN_EXCLUSIVE
+            self.connection.execute('PRAGMA main.locking_mode = EXCLUSIVE;')
+            self.connection.execute("PRAGMA main.synchronous = 0;")
+            self.connection.execute("PRAGMA journal_mode = MEMORY;")
         self.connection.commit()
+        # ====== pool of reading connections ====== #
+        self._owner = (os.getpid(), threading.current_thread().ident)
+        self._readers = threading.local()
+        self._readers_list = []
+        self._readers_lock = threading.Lock()
         # ====== create default table ====== #
         self._current_table = SQLiteDict._DEFAULT_TABLE
         self.set_table(SQLiteDict._DEFAULT_TABLE)
 
     # ==================== DB manager ==================== #
+    def _connect(self):
+        conn = sqlite3.connect(self._path,
+            cached_statements=SQLiteDict._CACHED_STATEMENTS,
+            check_same_thread=False)
+        conn.text_factory = str
+        return conn
+
+    @property
+    def read_connection(self):
+        """ Connection for reading, in `read_optimized` mode, each thread
+        (or forked process) has its own connection, otherwise, the main
+        connection is returned """
+        if not self._read_optimized or \
+        (os.getpid(), threading.current_thread().ident) == self._owner:
+            return self._conn
+        conn = getattr(self._readers, 'connection', None)
+        if conn is None or self._readers.pid != os.getpid():
+            conn = self._connect()
+            conn.execute("PRAGMA query_only = 1;")
+            self._readers.connection = conn
+            self._readers.pid = os.getpid()
+            with self._readers_lock:
+                self._readers_list.append(conn)
+        return conn
+
+    @property
+    def read_optimized(self):
+        return self._read_optimized
+
+    @property
+    def read_cache_stats(self):
+        """ hits, misses, evictions, size and nbytes of the reading cache """
+        return self._read_cache.stats
+
+    def set_read_cache_size(self, read_cache_size):
+        """ Change the maximum size (in MegaBytes) of the reading cache,
+        0 for disable """
+        self._read_cache.clear()
+        self._read_cache.max_bytes = int(read_cache_size * 1024 * 1024)
+        return self
+
     def set_cache_size(self, cache_size):
         self._cache_size = int(cache_size)
         return self
@@ -598,6 +1329,7 @@ class SQLiteDict(dict):
         if table_name == SQLiteDict._DEFAULT_TABLE:
             raise ValueError("Cannot drop default table.")
         self.cursor.execute("""DROP TABLE {tb};""".format(tb=table_name))
+        self._read_cache.clear()
         return self
 
     def is_table_exist(self, table_name):
@@ -618,9 +1350,8 @@ class SQLiteDict(dict):
             self.set_table(tab)
             if not self.read_only and len(self.current_cache) > 0:
                 self.cursor.executemany(
-                    "INSERT INTO {tb} VALUES (?, ?)".format(tb=tab),
-                    [(str(k), marshal.dumps(v.tolist()) if isinstance(v, np.ndarray)
-                      else marshal.dumps(v))
+                    "INSERT OR REPLACE INTO {tb} VALUES (?, ?)".format(tb=tab),
+                    [(str(k), _encode_sqlite(v))
                      for k, v in self.current_cache.iteritems()])
                 self.connection.commit()
                 self.current_cache.clear()
@@ -635,6 +1366,13 @@ class SQLiteDict(dict):
             self.flush()
         # remove global instance
         del SQLiteDict.__INSTANCES[self.path]
+        with self._readers_lock:
+            for conn in self._readers_list:
+                try:
+                    conn.close()
+                except sqlite3.Error: # created by other thread or process
+                    pass
+            self._readers_list = []
         self._conn.close()
         self._is_closed = True
 
@@ -688,6 +1426,7 @@ class SQLiteDict(dict):
         if self.read_only:
             raise RuntimeError("Cannot __setitem__ for this Dict in read_only mode.")
         key = str(key)
+        self._read_cache.invalidate((self._current_table, key))
         self.current_cache[key] = value
         if len(self.current_cache) >= self._cache_size:
             self.flush()
@@ -696,45 +1435,114 @@ class SQLiteDict(dict):
     def __getitem__(self, key):
         # ====== multiple keys select ====== #
         if isinstance(key, (tuple, list, np.ndarray)):
-            query = """SELECT value FROM {tb}
-                       WHERE key IN {keyval};"""
-            keyval = '(' + ', '.join(['"%s"' % str(k) for k in key]) + ')'
-            self.cursor.execute(
-                query.format(tb=self._current_table, keyval=keyval))
-            results = self.cursor.fetchall()
-            # check if any not found keys
-            if len(results) != len(key):
-                raise KeyError("Cannot find all `key`='%s' in the dictionary." % keyval)
-            # load binary data
-            results = [marshal.loads(r[0]) for r in results]
+            results = self.get_many(key, missing='raise')
         # ====== single key select ====== #
         else:
             key = str(key)
             if key in self.current_cache:
                 return self.current_cache[key]
-            query = """SELECT value FROM {tb} WHERE key="{keyval}" LIMIT 1;"""
-            results = self.connection.execute(
-                query.format(tb=self._current_table, keyval=key)).fetchone()
+            read_cache = self._read_cache
+            if read_cache.enable:
+                results = read_cache.get((self._current_table, key), _MISSING)
+                if results is not _MISSING:
+                    return results
+            query = """SELECT value FROM {tb} WHERE key=? LIMIT 1;"""
+            results = self.read_connection.execute(
+                query.format(tb=self._current_table), (key,)).fetchone()
             # results = self.cursor.fetchone()
             if results is None:
                 raise KeyError("Cannot find `key`='%s' in the dictionary." % key)
-            results = marshal.loads(results[0])
+            if read_cache.enable:
+                value = _decode_value(results[0])
+                read_cache.put((self._current_table, key), value, len(results[0]))
+                return value
+            results = _decode_value(results[0])
         return results
 
+    def get_many(self, keys, missing='raise', default=None):
+        """ Return the values of given `keys` in the same order, using
+        batched parameterized queries.
+
+        Parameters
+        ----------
+        keys: list of str
+        missing: 'raise', 'default', 'skip'
+            policy for the keys not found: raise KeyError, return `default`
+            instead, or exclude them from the returned list.
+        default: object
+            returned value for missing keys if `missing='default'`
+        """
+        missing = _check_missing_policy(missing)
+        keys = [str(k) for k in keys]
+        cache = self.current_cache
+        read_cache = self._read_cache
+        tb = self._current_table
+        db_values = {}
+        # ====== select from read cache ====== #
+        if read_cache.enable:
+            for k in set(k for k in keys if k not in cache):
+                v = read_cache.get((tb, k), _MISSING)
+                if v is not _MISSING:
+                    db_values[k] = v
+        # ====== select from database ====== #
+        db_keys = list(set(k for k in keys
+                           if k not in cache and k not in db_values))
+        query = """SELECT key, value FROM {tb} WHERE key IN ({params});"""
+        for start in range(0, len(db_keys), SQLiteDict._MAX_VARIABLES):
+            batch = db_keys[start:start + SQLiteDict._MAX_VARIABLES]
+            for k, v in self.read_connection.execute(
+                query.format(tb=self._current_table,
+                             params=', '.join(['?'] * len(batch))), batch):
+                db_values[k] = _decode_value(v)
+                if read_cache.enable:
+                    read_cache.put((tb, k), db_values[k], len(v))
+        # ====== ordering the results ====== #
+        results = []
+        found = []
+        for k in keys:
+            if k in cache:
+                results.append(cache[k]); found.append(True)
+            elif k in db_values:
+                results.append(db_values[k]); found.append(True)
+            else:
+                results.append(None); found.append(False)
+        return _apply_missing_policy(keys, results, found, missing, default)
+
+    def put_many(self, items):
+        """ Write all (key, value) `items` to the current table in
+        a single transaction, existed keys are replaced """
+        if self.read_only:
+            raise RuntimeError("Cannot put_many for this Dict in read_only mode.")
+        if isinstance(items, dict):
+            items = items.iteritems()
+        cache = self.current_cache
+        db_items = []
+        for key, value in items:
+            key = str(key)
+            cache.pop(key, None)
+            self._read_cache.invalidate((self._current_table, key))
+            db_items.append((key, _encode_sqlite(value)))
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO {tb} VALUES (?, ?)".format(tb=self._current_table),
+            db_items)
+        self.connection.commit()
+        return self
+
     def update(self, items):
         if self.read_only:
             return
-        query = """UPDATE {tb} SET value=(?) WHERE key=("?");"""
+        query = """UPDATE {tb} SET value=? WHERE key=?;"""
         if isinstance(items, dict):
             items = items.iteritems()
         # ====== check if update is in cache ====== #
         db_update = []
         for key, value in items:
             key = str(key)
+            self._read_cache.invalidate((self._current_table, key))
             if key in self.current_cache:
                 self.current_cache[key] = value
             else:
-                db_update.append((marshal.dumps(value), key))
+                db_update.append((_encode_sqlite(value), key))
         # ====== perform DB update ====== #
         self.cursor.executemany(query.format(tb=self._current_table), db_update)
         self.connection.commit()
@@ -749,23 +1557,19 @@ class SQLiteDict(dict):
         if key in self.current_cache:
             return True
         # check in database
-        query = """SELECT 1 FROM {tb} WHERE key="{keyval}" LIMIT 1;"""
-        self.cursor.execute(
-            query.format(tb=self._current_table, keyval=key))
-        if self.cursor.fetchone() is None:
-            return False
-        return True
+        query = """SELECT 1 FROM {tb} WHERE key=? LIMIT 1;"""
+        return self.read_connection.execute(
+            query.format(tb=self._current_table), (key,)).fetchone() is not None
 
     def __len__(self):
         query = """SELECT COUNT(1) FROM {tb}""".format(tb=self._current_table)
-        self.cursor.execute(query)
-        n = self.cursor.fetchone()[0]
+        n = self.read_connection.execute(query).fetchone()[0]
         return n + len(self.current_cache)
 
     def __delitem__(self, key):
         if self.read_only:
             return
-        query = """DELETE FROM {tb} WHERE {cond};"""
+        query = """DELETE FROM {tb} WHERE key=?;"""
         if isinstance(key, (tuple, list, Iterator, np.ndarray)):
             key = [str(k) for k in key]
         else:
@@ -773,14 +1577,14 @@ class SQLiteDict(dict):
         # ====== check if key in cache ====== #
         db_key = []
         for k in key:
+            self._read_cache.invalidate((self._current_table, k))
             if k in self.current_cache:
                 del self.current_cache[k]
             else:
                 db_key.append(k)
         # ====== remove key from db ====== #
-        self.cursor.execute(
-            query.format(tb=self._current_table,
-                         cond='key IN ("%s")' % ', '.join(db_key)))
+        self.cursor.executemany(query.format(tb=self._current_table),
+                                [(k,) for k in db_key])
         self.connection.commit()
 
     def __cmp__(self, dict):
@@ -790,7 +1594,7 @@ class SQLiteDict(dict):
         return list(self.iterkeys())
 
     def iterkeys(self):
-        for k in self.cursor.execute(
+        for k in self.read_connection.execute(
             """SELECT key from {tb};""".format(tb=self._current_table)):
             yield k[0]
         for k in self.current_cache.iterkeys():
@@ -800,9 +1604,9 @@ class SQLiteDict(dict):
         return list(self.itervalues())
 
     def itervalues(self):
-        for val in self.cursor.execute(
+        for val in self.read_connection.execute(
             """SELECT value from {tb};""".format(tb=self._current_table)):
-            yield marshal.loads(val[0])
+            yield _decode_value(val[0])
         for v in self.current_cache.itervalues():
             yield v
 
@@ -810,18 +1614,19 @@ class SQLiteDict(dict):
         return list(self.iteritems())
 
     def iteritems(self):
-        for item in self.cursor.execute(
+        for item in self.read_connection.execute(
             """SELECT key, value from {tb};""".format(tb=self._current_table)):
-            yield (item[0], marshal.loads(item[1]))
+            yield (item[0], _decode_value(item[1]))
         for k, v in self.current_cache.iteritems():
             yield k, v
 
     def clear(self):
         if self.read_only:
             return
-        self.cursor.execute("""TRUNCATE TABLE {tb};""".format(tb=self._current_table))
+        self.cursor.execute("""DELETE FROM {tb};""".format(tb=self._current_table))
         self.connection.commit()
         self.current_cache.clear()
+        self._read_cache.clear()
         return self
 
     def copy(self):
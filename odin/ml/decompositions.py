@@ -20,7 +20,9 @@ __all__ = [
 
 class MiniBatchPCA(IncrementalPCA):
     """ A modified version of IncrementalPCA to effectively
-    support multi-processing (but not work)
+    support multi-processing, the sufficient statistics of the samples
+    seen by each process (`compute_statistics`) are summed and fitted
+    exactly at the end (`fit_statistics`, `merge`)
     Original Author: Kyle Kastner <kastnerkyle@gmail.com>
                      Giorgio Patrini
     License: BSD 3 clause
@@ -182,6 +184,8 @@ class MiniBatchPCA(IncrementalPCA):
         # we have enough samples
         self._cache_batches = []
         self._nb_cached_samples = 0
+        # sufficient statistics given to `fit_statistics`
+        self._statistics = None
 
     @property
     def is_fitted(self):
@@ -272,6 +276,8 @@ class MiniBatchPCA(IncrementalPCA):
             _incremental_mean_and_var(X, last_mean=self.mean_,
                                       last_variance=self.var_,
                                       last_sample_count=self.n_samples_seen_)
+        # sklearn>=0.20 returns the count of each feature
+        n_total_samples = int(np.max(n_total_samples))
         total_var = np.sum(col_var * n_total_samples)
         if total_var == 0: # if variance == 0, make no sense to continue
             return self
@@ -294,6 +300,7 @@ class MiniBatchPCA(IncrementalPCA):
         explained_variance = S ** 2 / n_total_samples
         explained_variance_ratio = S ** 2 / total_var
 
+        self._statistics = None
         self.n_samples_seen_ = n_total_samples
         self.components_ = V[:self.n_components_]
         self.singular_values_ = S[:self.n_components_]
@@ -309,6 +316,113 @@ class MiniBatchPCA(IncrementalPCA):
             self.noise_variance_ = 0.
         return self
 
+    # ==================== Sufficient statistics ==================== #
+    @staticmethod
+    def compute_statistics(X):
+        """ Return the sufficient statistics `(n_samples, sum, scatter)` of
+        X, where `scatter = X^T X`. The statistics of different batches
+        (e.g. computed by different processes) are summed, then given to
+        `fit_statistics` or `merge`.
+        """
+        if isinstance(X, Data):
+            X = X[:]
+        X = np.asarray(X, dtype='float64')
+        return X.shape[0], np.sum(X, axis=0), np.dot(X.T, X)
+
+    @property
+    def statistics(self):
+        """ The sufficient statistics `(n_samples, sum, scatter)` of all
+        fitted samples, they are exact if the model is fitted by
+        `fit_statistics`, or all components are kept, otherwise, the
+        scatter is approximated by the kept components.
+        """
+        stats = getattr(self, '_statistics', None)
+        if stats is None:
+            if self.is_fitted:
+                n = self.n_samples_seen_
+                scatter = np.dot(self.components_.T *
+                                 self.singular_values_ ** 2, self.components_)
+                stats = (n, self.mean_ * n,
+                         scatter + n * np.outer(self.mean_, self.mean_))
+            else:
+                stats = (0, 0., 0.)
+        # samples cached by `partial_fit`
+        if self._nb_cached_samples > 0:
+            cached = MiniBatchPCA.compute_statistics(
+                np.concatenate(self._cache_batches, axis=0))
+            stats = tuple(i + j for i, j in zip(stats, cached))
+        return stats
+
+    def fit_statistics(self, n_samples, sum1, scatter):
+        """ Fit the model with the sufficient statistics given by
+        `compute_statistics`, the eigen-decomposition of the covariance
+        gives the same components as the SVD of all samples.
+
+        Returns
+        -------
+        self: object
+            Returns the instance itself.
+        """
+        n_samples = int(n_samples)
+        if n_samples <= 0:
+            return self
+        sum1 = np.asarray(sum1, dtype='float64')
+        scatter = np.asarray(scatter, dtype='float64')
+        n_features = sum1.shape[0]
+        if self.n_components is None:
+            self.n_components_ = n_features
+        elif not 1 <= self.n_components <= n_features:
+            raise ValueError("n_components=%r invalid for n_features=%d"
+                             % (self.n_components, n_features))
+        else:
+            self.n_components_ = self.n_components
+        self._statistics = (n_samples, sum1, scatter)
+        self._cache_batches = []
+        self._nb_cached_samples = 0
+        # centered scatter matrix
+        mean = sum1 / n_samples
+        scatter = scatter - n_samples * np.outer(mean, mean)
+        total_var = np.trace(scatter)
+        if total_var <= 0: # if variance == 0, make no sense to continue
+            return self
+        eigval, eigvec = linalg.eigh(scatter)
+        # descending order, the eigen values are squared singular values
+        eigval = np.maximum(eigval[::-1], 0.)
+        V = eigvec[:, ::-1].T
+        U = np.ones((1, n_features))
+        U, V = svd_flip(U, V, u_based_decision=False)
+        explained_variance = eigval / n_samples
+        explained_variance_ratio = eigval / total_var
+
+        self.n_samples_seen_ = n_samples
+        self.components_ = V[:self.n_components_]
+        self.singular_values_ = np.sqrt(eigval[:self.n_components_])
+        self.mean_ = mean
+        self.var_ = np.maximum(np.diag(scatter), 0.) / n_samples
+        self.explained_variance_ = explained_variance[:self.n_components_]
+        self.explained_variance_ratio_ = \
+            explained_variance_ratio[:self.n_components_]
+        if self.n_components_ < n_features:
+            self.noise_variance_ = \
+                explained_variance[self.n_components_:].mean()
+        else:
+            self.noise_variance_ = 0.
+        return self
+
+    def merge(self, other):
+        """ Merge the samples fitted by other model, or given sufficient
+        statistics `(n_samples, sum, scatter)`, into this model.
+
+        Returns
+        -------
+        self: object
+            Returns the instance itself.
+        """
+        if isinstance(other, MiniBatchPCA):
+            other = other.statistics
+        n, sum1, scatter = [i + j for i, j in zip(self.statistics, other)]
+        return self.fit_statistics(n, sum1, scatter)
+
     def transform(self, X, y=None, n_components=None):
         n = X.shape[0]
         if self.batch_size is None:
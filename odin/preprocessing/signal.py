@@ -20,7 +20,9 @@ from __future__ import print_function, division, absolute_import
 import six
 import copy
 import warnings
+import threading
 from numbers import Number
+from collections import OrderedDict
 from six import string_types
 
 import numpy as np
@@ -62,6 +64,11 @@ def set_vad_mode(mode):
         __current_vad_mode = float(mode)
 
 
+def get_vad_mode():
+    """ Return the current alpha of `vad_energy` (see `set_vad_mode`) """
+    return __current_vad_mode
+
+
 def vad_energy(log_energy, distrib_nb=3, nb_train_it=25):
     """ Fitting Gaussian mixture model on the log-energy and the voice
     activity is the component with highest energy.
@@ -102,6 +109,97 @@ def vad_energy(log_energy, distrib_nb=3, nb_train_it=25):
     return label, threshold
 
 
+class OnlineVAD(object):
+    """ Online version of `vad_energy` for streaming, the log-energy of
+    noise and speech frames are modeled by two Gaussians, which are
+    initialized on the first `nb_init` frames, then updated for every new
+    frame with exponential forgetting. A frame is voiced if its energy
+    exceeds the threshold of `vad_energy` (computed on the speech Gaussian,
+    see `set_vad_mode`).
+
+    Parameters
+    ----------
+    nb_init: int
+        number of frames for initializing the distributions, the decision
+        of these frames is delayed until the initialization
+    forget: float `(0, 1)`
+        forgetting factor of the running statistics
+
+    Note
+    ----
+    The decisions are not identical to `vad_energy`, since the later
+    fits the GMM on the whole utterance.
+    """
+
+    def __init__(self, nb_init=50, forget=0.995):
+        super(OnlineVAD, self).__init__()
+        self.nb_init = max(int(nb_init), 2)
+        self.forget = float(forget)
+        if not 0. < self.forget < 1.:
+            raise ValueError("`forget` must be in (0, 1), given: %f" %
+                             self.forget)
+        self.reset()
+
+    def reset(self):
+        self._pending = [] # frames waiting for initialization
+        self.means = None
+        self.variances = None
+
+    def _initialize(self, log_energy):
+        low, high = np.percentile(log_energy, [10, 90])
+        high = max(high, low + 1e-3)
+        is_speech = np.abs(log_energy - high) < np.abs(log_energy - low)
+        var = max(np.var(log_energy), 1e-3)
+        self.means = np.array([low, high], dtype='float64')
+        self.variances = np.array(
+            [max(np.var(log_energy[~is_speech]), 1e-3)
+             if np.sum(~is_speech) > 1 else var,
+             max(np.var(log_energy[is_speech]), 1e-3)
+             if np.sum(is_speech) > 1 else var], dtype='float64')
+
+    def _update(self, log_energy):
+        vad = np.empty((len(log_energy),), dtype='uint8')
+        means, variances, forget = self.means, self.variances, self.forget
+        vad_mode = get_vad_mode()
+        for i, e in enumerate(log_energy):
+            # assign the frame to the most likely Gaussian
+            llk = -0.5 * np.log(variances) - 0.5 * (e - means)**2 / variances
+            k = int(np.argmax(llk))
+            means[k] = forget * means[k] + (1. - forget) * e
+            variances[k] = max(forget * variances[k] +
+                               (1. - forget) * (e - means[k])**2, 1e-3)
+            speech = int(np.argmax(means))
+            threshold = means[speech] - vad_mode * np.sqrt(variances[speech])
+            vad[i] = e > threshold
+        return vad
+
+    def process(self, log_energy):
+        """ Return the voice activities of the frames whose decision
+        is available (uint8) """
+        log_energy = np.asarray(log_energy, dtype='float64').ravel()
+        if self.means is None:
+            self._pending.append(log_energy)
+            pending = np.concatenate(self._pending)
+            if len(pending) < self.nb_init:
+                return np.empty((0,), dtype='uint8')
+            self._pending = []
+            self._initialize(pending)
+            log_energy = pending
+        return self._update(log_energy)
+
+    def flush(self):
+        """ Return the decision of the frames waiting for the
+        initialization, then reset the detector """
+        vad = np.empty((0,), dtype='uint8')
+        if self.means is None and len(self._pending) > 0:
+            pending = np.concatenate(self._pending)
+            if len(pending) > 0:
+                self._initialize(pending)
+                vad = self._update(pending)
+        self.reset()
+        return vad
+
+
 def vad_split_audio(s, sr, maximum_duration=30, minimum_duration=None,
                     frame_length=128, nb_mixtures=3, threshold=0.6,
                     return_vad=False, return_voices=False, return_cut=False):
@@ -403,7 +501,6 @@ def power2db(S, ref=1.0, amin=1e-10, top_db=80.0):
     return log_spec
 
 
-@cache_memory
 def dct_filters(n_filters, n_input):
     """Discrete cosine transform (DCT type-III) basis.
 
@@ -426,7 +523,7 @@ def dct_filters(n_filters, n_input):
 
     Notes
     -----
-    This function caches at level 10.
+    Use `get_dct_filters` for the cached version.
 
     Examples
     --------
@@ -457,7 +554,6 @@ def dct_filters(n_filters, n_input):
     return basis
 
 
-@cache_memory
 def mel_filters(sr, n_fft, n_mels=128, fmin=0.0, fmax=None):
     """Create a Filterbank matrix to combine FFT bins into Mel-frequency bins
     Original code: librosa
@@ -506,8 +602,9 @@ def mel_filters(sr, n_fft, n_mels=128, fmin=0.0, fmax=None):
                            endpoint=True)
 
     # 'Center freqs' of mel bands - uniformly spaced between limits
-    min_mel = hz2mel(fmin)
-    max_mel = hz2mel(fmax)
+    # scalar limits, `np.linspace` of 1-D arrays returns 2-D array
+    min_mel = hz2mel(fmin)[0]
+    max_mel = hz2mel(fmax)[0]
     mel_f = mel2hz(mels=np.linspace(min_mel, max_mel, n_mels + 2))
 
     fdiff = np.diff(mel_f)
@@ -674,6 +771,231 @@ def compute_delta(data, width=9, order=1, axis=-1, trim=True):
     return all_deltas
 
 
+def delta_filters(width=9, order=1):
+    """ Regression filter bank of `compute_delta`, the filter of the
+    `k`-th order is the delta window convolved `k` times with itself.
+
+    Return
+    ------
+    read-only np.ndarray [shape=(order, order * (width - 1) + 1)], the
+    filters are right-aligned (zero-padded on the left), the taps are in
+    `lfilter` order (`filters[k - 1, j]` multiplies the frame `t - j`)
+    """
+    width = int(width)
+    if width < 3 or np.mod(width, 2) != 1:
+        raise ValueError('width must be an odd integer >= 3')
+    order = int(order)
+    if order <= 0:
+        raise ValueError('order must be a positive integer')
+
+    def create():
+        half_length = 1 + int(width // 2)
+        window = np.arange(half_length - 1., -half_length, -1.)
+        window /= np.sum(np.abs(window)**2)
+        filters = np.zeros((order, order * (width - 1) + 1), dtype='float64')
+        f = np.ones((1,), dtype='float64')
+        for k in range(order):
+            f = np.convolve(f, window)
+            filters[k, :f.shape[0]] = f
+        filters.flags.writeable = False
+        return filters
+    return _lru_get(_cached_filters, ('delta', width, order), create)
+
+
+def stack_deltas(data, width=9, order=1, axis=-2, stack_axis=-1,
+                 keep_original=True):
+    """ Fused version of `compute_delta`: all deltas up to `order` are
+    computed in one pass by the regression filter bank (`delta_filters`)
+    and written into one output buffer `[x, delta1, delta2, ...]`.
+
+    The result is the same as
+    `np.concatenate([data] + compute_delta(data, width, order, axis),
+    axis=stack_axis)`, however, the data is padded only once, and there
+    is no intermediate array for each order.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        e.g. [shape=(t, d)] or a batch of utterances [shape=(n, t, d)]
+    width : int >= 3, odd [scalar]
+        Number of frames over which to compute the delta feature
+    order : int > 0 [scalar]
+        the order of the difference operator.
+    axis : int
+        the axis along which to compute deltas (default: the time axis
+        of 2-D and 3-D inputs)
+    stack_axis : int
+        the axis along which the deltas are stacked
+    keep_original : bool
+        if False, only the deltas are returned
+
+    Return
+    ------
+    np.ndarray [shape=(t, d * (order + 1)) for 2-D input]
+    """
+    data = np.atleast_1d(data)
+    filters = delta_filters(width, order)
+    width = int(width)
+    order, nb_taps = filters.shape
+    ndim = data.ndim
+    axis = axis % ndim
+    stack_axis = stack_axis % ndim
+    dtype = np.result_type(data.dtype, np.float32)
+    # ====== output buffer ====== #
+    nb_stacks = order + 1 if keep_original else order
+    shape = list(data.shape)
+    dim = shape[stack_axis]
+    shape[stack_axis] = dim * nb_stacks
+    out = np.empty(shape, dtype=dtype)
+    idx = [slice(None)] * ndim
+    idx[stack_axis] = slice(0, dim)
+    if keep_original:
+        out[tuple(idx)] = data
+    # ====== padding (same as `compute_delta`) ====== #
+    # the time axis is moved to -2, the borders are repeated `width`
+    # times, and the `lfilter` of higher orders starts from zeros
+    # before the padded data
+    def move(x):
+        return np.moveaxis(x, axis, -2) if ndim > 1 else x[:, None]
+    x = move(data)
+    n = x.shape[-2]
+    half_length = 1 + int(width // 2)
+    start = 2 * width - half_length - (nb_taps - 1)
+    padding = [(0, 0)] * x.ndim
+    padding[-2] = (width, width)
+    x = np.pad(x.astype(dtype), padding, mode='edge')
+    if start < 0:
+        padding[-2] = (-start, 0)
+        x = np.pad(x, padding, mode='constant')
+        start = 0
+    # ====== all orders in one product ====== #
+    # windows[..., t, j, :] is the padded frame `t + j`, the taps of
+    # `lfilter` are reversed
+    x = x[..., start:, :]
+    windows = as_strided(x, shape=x.shape[:-2] + (n, nb_taps, x.shape[-1]),
+                         strides=x.strides[:-2] + (x.strides[-2],) +
+                         x.strides[-2:])
+    filters = filters[:, ::-1].astype(dtype)
+    if ndim > 1 and axis == ndim - 2 and stack_axis == ndim - 1:
+        # the deltas are written directly into the output buffer
+        idx[stack_axis] = slice(nb_stacks * dim - order * dim, None)
+        deltas = out[tuple(idx)].reshape(
+            data.shape[:-1] + (order, dim))
+        np.matmul(filters, windows, out=deltas)
+    else:
+        deltas = np.matmul(filters, windows)
+        for k in range(order):
+            idx[stack_axis] = slice((nb_stacks - order + k) * dim,
+                                    (nb_stacks - order + k + 1) * dim)
+            move(out[tuple(idx)])[...] = deltas[..., k, :]
+    return out
+
+
+class StreamingDelta(object):
+    """ Streaming version of `compute_delta` along the time axis
+    (i.e. the first axis of each block of frames), the state of the
+    filters is carried between calls, so the output is identical to
+    calling `compute_delta` on the whole utterance.
+
+    Each block of delta is available `width // 2` frames later, the
+    returned frames are `[x, delta1, delta2, ...]` concatenated on the
+    feature axis.
+
+    Parameters
+    ----------
+    width     : int >= 3, odd [scalar]
+        Number of frames over which to compute the delta feature
+    order     : int > 0 [scalar]
+        the order of the difference operator.
+    """
+
+    def __init__(self, width=9, order=1):
+        super(StreamingDelta, self).__init__()
+        width = int(width)
+        if width < 3 or np.mod(width, 2) != 1:
+            raise ValueError('width must be an odd integer >= 3')
+        order = int(order)
+        if order <= 0:
+            raise ValueError('order must be a positive integer')
+        self.width = width
+        self.order = order
+        half_length = 1 + int(width // 2)
+        window = np.arange(half_length - 1., -half_length, -1.)
+        # Normalize the window so we're scale-invariant
+        self.window = window / np.sum(np.abs(window)**2)
+        # the delta of frame `t` is read at padded index `t + _offset`
+        self._offset = 2 * width - half_length
+        self.reset()
+
+    @property
+    def delay(self):
+        """ Number of frames needed after a frame for its delta """
+        return self._offset - self.width
+
+    def reset(self):
+        self._states = None
+        self._last = None
+        self._inputs = [] # frames waiting for their deltas
+        self._outputs = [[] for _ in range(self.order)]
+        self._nb_padded = 0 # number of filtered frames (with padding)
+        self._nb_frames = 0 # number of input frames
+        self._nb_emitted = 0
+
+    def _filter(self, x):
+        if self._states is None:
+            self._states = [np.zeros((len(self.window) - 1,) + x.shape[1:])
+                            for _ in range(self.order)]
+        skip = max(self._offset - self._nb_padded, 0)
+        self._nb_padded += x.shape[0]
+        for i in range(self.order):
+            x, self._states[i] = signal.lfilter(self.window, 1, x, axis=0,
+                                                zi=self._states[i])
+            if skip < x.shape[0]:
+                self._outputs[i].append(x[skip:])
+
+    def _emit(self, n):
+        if len(self._outputs[0]) == 0:
+            x = self._inputs[0]
+            return np.empty((0, x.shape[1] * (self.order + 1)),
+                            dtype=x.dtype)
+        inputs = np.concatenate(self._inputs, axis=0)
+        outputs = [np.concatenate(o, axis=0) for o in self._outputs]
+        n = min(n, inputs.shape[0], outputs[0].shape[0])
+        self._inputs = [inputs[n:]]
+        self._outputs = [[o[n:]] for o in outputs]
+        self._nb_emitted += n
+        return np.concatenate([inputs[:n]] +
+                              [o[:n].astype('float32') for o in outputs],
+                              axis=1)
+
+    def process(self, x):
+        """ Feed new frames `x` [shape=(n, d)], return the frames
+        whose deltas are available [shape=(m, d * (order + 1))] """
+        x = np.asarray(x)
+        if x.shape[0] == 0:
+            return np.empty((0, x.shape[1] * (self.order + 1)),
+                            dtype=x.dtype)
+        # repeat the first frame like the padding of `compute_delta`
+        if self._last is None:
+            self._filter(np.repeat(x[:1], self.width, axis=0))
+        self._filter(x)
+        self._last = x[-1:]
+        self._inputs.append(x)
+        self._nb_frames += x.shape[0]
+        return self._emit(self._nb_frames - self._nb_emitted)
+
+    def flush(self):
+        """ Return the remaining frames (the end of the utterance is
+        padded with the last frame), then reset the state """
+        if self._last is None:
+            self.reset()
+            return None
+        self._filter(np.repeat(self._last, self.width, axis=0))
+        x = self._emit(self._nb_frames - self._nb_emitted)
+        self.reset()
+        return x
+
+
 @cache_memory('__strict__')
 def pad_center(data, size, axis=-1, **kwargs):
     '''Wrapper for numpy.pad to automatically center an array prior to padding.
@@ -1091,8 +1413,7 @@ def framing(y, win_length, hop_length, window='hann', center=True):
     y_frames = segment_axis(y,
         frame_length=win_length, hop_length=hop_length, end='cut')
     if window is not None:
-        fft_window = get_window(window, win_length, fftbins=True)
-        y_frames = y_frames * fft_window.reshape(1, -1)
+        y_frames = y_frames * fft_window(window, win_length)
     return y_frames
 
 
@@ -1117,8 +1438,259 @@ def get_energy(frames, log=True):
     return log_energy.astype('float32')
 
 
+# ===========================================================================
+# STFT engine
+# ===========================================================================
+# maximum number of cached windows and STFT engines
+_MAX_CACHED_PLANS = 32
+_cached_windows = OrderedDict()
+_cached_engines = OrderedDict()
+_cached_filters = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _lru_get(cache, key, create):
+    """ Bounded least-recently-used lookup, `key` is None for
+    un-hashable specification (nothing is cached) """
+    if key is None:
+        return create()
+    with _cache_lock:
+        if key in cache:
+            value = cache.pop(key)
+            cache[key] = value
+            return value
+    value = create()
+    with _cache_lock:
+        cache[key] = value
+        while len(cache) > _MAX_CACHED_PLANS:
+            cache.popitem(last=False)
+    return value
+
+
+def _window_key(window, n):
+    if isinstance(window, (np.ndarray, list)):
+        return None
+    try:
+        hash(window)
+    except TypeError:
+        return None
+    return (window, int(n))
+
+
+def fft_window(window, n_fft):
+    """ Cached float64 window of `n_fft` samples for the FFT,
+    return [shape=(1, n_fft)] (read-only) """
+    def create():
+        w = np.asarray(get_window(window, n_fft, fftbins=True),
+                       dtype='float64').reshape(1, -1)
+        w.flags.writeable = False
+        return w
+    return _lru_get(_cached_windows, _window_key(window, n_fft), create)
+
+
+class STFT(object):
+    """ Short-time Fourier transform engine, the window and the block
+    size (the plan) is prepared once for given `n_fft`, `hop_length`
+    and `window`, then the real FFT of each block of frames is written
+    directly into the preallocated output.
+
+    Parameters
+    ----------
+    n_fft : int > 0 [scalar]
+        FFT window size
+    hop_length : int > 0 [scalar]
+        number audio of frames between STFT columns.
+        If unspecified, defaults `win_length / 4`.
+    window : string, tuple, number, function, or np.ndarray [shape=(n_fft,)]
+        window specification (see `stft`)
+    center : boolean
+        If `True`, the signal `y` is padded so that frame
+        `D[:, t]` is centered at `y[t * hop_length]`.
+    preemphasis: float `(0, 1)`, None
+        pre-emphasis coefficience
+
+    Note
+    ----
+    Use `get_stft` to reuse the cached engine for given configuration.
+    """
+
+    def __init__(self, n_fft=256, hop_length=None, window='hann',
+                 center=True, preemphasis=None):
+        super(STFT, self).__init__()
+        self.n_fft = int(n_fft)
+        self.hop_length = self.n_fft // 4 if hop_length is None \
+            else int(hop_length)
+        self.center = bool(center)
+        self.preemphasis = preemphasis \
+            if isinstance(preemphasis, Number) and 0. < preemphasis < 1. \
+            else None
+        self.window = fft_window(window, self.n_fft)
+        self.nb_bins = int(1 + self.n_fft // 2)
+        # how many frames can we fit within MAX_MEM_BLOCK?
+        self.block_size = max(int(MAX_MEM_BLOCK /
+            (self.nb_bins * np.dtype('complex64').itemsize)), 1)
+
+    def framing(self, y):
+        """ Return the (un-windowed) frames of `y`, shape=(t, n_fft),
+        the frames are a strided view of the (padded) signal """
+        if self.preemphasis is not None:
+            y = pre_emphasis(y, coeff=self.preemphasis)
+        if self.center:
+            y = np.pad(y, int(self.n_fft // 2), mode='reflect')
+        return segment_axis(y, frame_length=self.n_fft,
+                            hop_length=self.hop_length, end='cut')
+
+    def _flush(self, x, out, log_energy, magnitude, start):
+        """ Transform the windowed frames `x` into `out[start:]` """
+        end = start + x.shape[0]
+        if log_energy is not None:
+            e = (x**2).sum(axis=1)
+            e = np.where(e == 0., np.finfo(np.float32).eps, e)
+            log_energy[start:end] = np.log(e)
+        # RFFT and Conjugate here to match phase from DPWE code
+        if magnitude:
+            np.abs(np.conj(np.fft.rfft(x, n=self.n_fft, axis=1)
+                           ).astype('complex64'),
+                   out=out[start:end])
+        else:
+            np.conj(np.fft.rfft(x, n=self.n_fft, axis=1),
+                    out=out[start:end], casting='same_kind')
+
+    def _transform(self, frames, out, log_energy, magnitude, start, end):
+        for bl_s in range(start, end, self.block_size):
+            bl_t = min(bl_s + self.block_size, end)
+            self._flush(frames[bl_s:bl_t] * self.window,
+                        out, log_energy, magnitude, bl_s)
+
+    def transform(self, frames, energy=False, magnitude=False):
+        """ Transform the (un-windowed) frames [shape=(t, n_fft)], e.g.
+        the output of `framing`, the return is the same as `__call__` """
+        nb_frames = frames.shape[0]
+        out = np.empty((nb_frames, self.nb_bins),
+                       dtype='float32' if magnitude else 'complex64')
+        log_energy = np.empty((nb_frames,), dtype='float32') \
+            if energy else None
+        self._transform(frames, out, log_energy, magnitude, 0, nb_frames)
+        if energy:
+            return out, log_energy
+        return out
+
+    def batch(self, ys, energy=False, magnitude=False):
+        """ Transform multiple signals at once, the frames of all signals
+        are gathered into the same blocks, hence, many short signals only
+        require few FFT calls. The frames of each signal are identical to
+        the output of calling the engine on that signal.
+
+        Parameters
+        ----------
+        ys : list of np.ndarray [shape=(n,)]
+            the input signals
+        energy: bool
+            if True, return log-frame-wise energy
+        magnitude: bool
+            if True, return the magnitude `np.abs(D)` (float32)
+
+        Return
+        ------
+        D : np.ndarray [shape=(sum(lengths), 1 + n_fft/2)]
+            the frames of all signals are concatenated
+        log_energy : ndarray [shape=(sum(lengths),), dtype=float32]
+            (if `energy`)
+        lengths : list of int
+            number of frames of each signal
+        """
+        frames = [self.framing(y) for y in ys]
+        lengths = [f.shape[0] for f in frames]
+        nb_frames = sum(lengths)
+        out = np.empty((nb_frames, self.nb_bins),
+                       dtype='float32' if magnitude else 'complex64')
+        log_energy = np.empty((nb_frames,), dtype='float32') \
+            if energy else None
+        # ====== fill the blocks with frames of multiple signals ====== #
+        block = np.empty((min(self.block_size, max(nb_frames, 1)),
+                          self.n_fft), dtype='float64')
+        start = 0 # first output frame of current block
+        n = 0 # number of frames in current block
+        for f in frames:
+            i = 0
+            while i < f.shape[0]:
+                k = min(block.shape[0] - n, f.shape[0] - i)
+                np.multiply(f[i:i + k], self.window, out=block[n:n + k])
+                n += k
+                i += k
+                if n == block.shape[0]:
+                    self._flush(block, out, log_energy, magnitude, start)
+                    start += n
+                    n = 0
+        if n > 0:
+            self._flush(block[:n], out, log_energy, magnitude, start)
+        if energy:
+            return out, log_energy, lengths
+        return out, lengths
+
+    def __call__(self, y, energy=False, magnitude=False, nthreads=1):
+        """
+        Parameters
+        ----------
+        y : np.ndarray [shape=(n,)], real-valued
+            the input signal (audio time series)
+        energy: bool
+            if True, return log-frame-wise energy
+        magnitude: bool
+            if True, return the magnitude `np.abs(D)` (float32), and the
+            complex STFT matrix is never stored
+        nthreads: int
+            number of threads for long signals, each thread processes
+            a contiguous part of the frames
+
+        Return
+        ------
+        D : np.ndarray [shape=(t, 1 + n_fft/2), dtype=complex64 or float32]
+        log_energy : ndarray [shape=(t,), dtype=float32] (if `energy`)
+        """
+        frames = self.framing(y)
+        nb_frames = frames.shape[0]
+        out = np.empty((nb_frames, self.nb_bins),
+                       dtype='float32' if magnitude else 'complex64')
+        log_energy = np.empty((nb_frames,), dtype='float32') \
+            if energy else None
+        # ====== split the frames for multi-threading ====== #
+        nthreads = max(min(int(nthreads),
+            int(np.ceil(nb_frames / self.block_size))), 1)
+        if nthreads == 1:
+            self._transform(frames, out, log_energy, magnitude,
+                            0, nb_frames)
+        else:
+            # each thread handles whole blocks
+            size = int(np.ceil(nb_frames / self.block_size / nthreads)) * \
+                self.block_size
+            threads = [threading.Thread(target=self._transform,
+                args=(frames, out, log_energy, magnitude,
+                      start, min(start + size, nb_frames)))
+                for start in range(0, nb_frames, size)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        if energy:
+            return out, log_energy
+        return out
+
+
+def get_stft(n_fft=256, hop_length=None, window='hann',
+             center=True, preemphasis=None):
+    """ Return the cached `STFT` engine of given configuration """
+    key = _window_key(window, n_fft)
+    if key is not None:
+        key = key + (hop_length, bool(center), preemphasis)
+    return _lru_get(_cached_engines, key,
+        lambda: STFT(n_fft=n_fft, hop_length=hop_length, window=window,
+                     center=center, preemphasis=preemphasis))
+
+
 def stft(y, n_fft=256, hop_length=None, window='hann',
-         center=True, preemphasis=None, energy=False):
+         center=True, preemphasis=None, energy=False,
+         magnitude=False, nthreads=1):
     """Short-time Fourier transform (STFT)
 
     Returns a complex-valued matrix D such that
@@ -1150,6 +1722,10 @@ def stft(y, n_fft=256, hop_length=None, window='hann',
         pre-emphasis coefficience
     energy: bool
         if True, return log-frame-wise energy
+    magnitude: bool
+        if True, return the magnitude spectrogram `np.abs(D)` (float32)
+    nthreads: int
+        number of threads used for long signals
 
     Returns
     -------
@@ -1157,38 +1733,14 @@ def stft(y, n_fft=256, hop_length=None, window='hann',
         STFT matrix
     log_energy : ndarray [shape=(t,), dtype=float32]
         (log) energy of each frame
+
+    Note
+    ----
+    The computation is performed by the cached `STFT` engine (see `get_stft`)
     """
-    # if n_fft is None:
-    n_fft = int(n_fft)
-    # Set the default hop, if it's not already specified
-    if hop_length is None:
-        hop_length = n_fft // 4
-    hop_length = int(hop_length)
-    # pre-emphasis
-    if isinstance(preemphasis, Number) and 0. < preemphasis < 1.:
-        y = pre_emphasis(y, coeff=preemphasis)
-    y_frames = framing(y, win_length=n_fft, hop_length=hop_length,
-                       center=center, window=window)
-    # calculate frames energy
-    if energy:
-        log_energy = get_energy(y_frames, log=True)
-    # Pre-allocate the STFT matrix
-    y_frames = y_frames.T
-    stft_matrix = np.empty((int(1 + n_fft // 2), y_frames.shape[1]),
-                           dtype=np.complex64, order='F')
-    # how many columns can we fit within MAX_MEM_BLOCK?
-    n_columns = int(MAX_MEM_BLOCK / (stft_matrix.shape[0] *
-                                     stft_matrix.itemsize))
-    for bl_s in range(0, stft_matrix.shape[1], n_columns):
-        bl_t = min(bl_s + n_columns, stft_matrix.shape[1])
-        # RFFT and Conjugate here to match phase from DPWE code
-        stft_matrix[:, bl_s:bl_t] = fftpack.fft(
-            y_frames[:, bl_s:bl_t], axis=0
-        )[:stft_matrix.shape[0]].conj()
-    # return in form (t, d)
-    if energy:
-        return stft_matrix.T, log_energy.astype('float32')
-    return stft_matrix.T
+    engine = get_stft(n_fft=n_fft, hop_length=hop_length, window=window,
+                      center=center, preemphasis=preemphasis)
+    return engine(y, energy=energy, magnitude=magnitude, nthreads=nthreads)
 
 
 def istft(stft_matrix, hop_length=None, window='hann', center=True):
@@ -1261,12 +1813,168 @@ def istft(stft_matrix, hop_length=None, window='hann', center=True):
     return y
 
 
+# ===========================================================================
+# Cached filter banks
+# ===========================================================================
+class BandedFilters(object):
+    """ Banded representation of a filter bank (e.g. `mel_filters`),
+    each group of consecutive filters only stores the range of frequency
+    bins where the filters are non-zero, hence, the product with the
+    spectrogram skips the zero regions.
+
+    Parameters
+    ----------
+    weights: np.ndarray [shape=(n_filters, n_bins)]
+        the dense filter bank
+    group: int
+        number of consecutive filters sharing the same band
+    block: int
+        number of frames processed at once by `dot`
+    """
+
+    def __init__(self, weights, group=8, block=1024):
+        super(BandedFilters, self).__init__()
+        weights = np.asarray(weights)
+        self.shape = weights.shape
+        self.dtype = weights.dtype
+        self.block = int(block)
+        nonzeros = weights != 0
+        # first and last (exclusive) non-zero bins of each filter
+        starts = np.where(nonzeros.any(axis=1), nonzeros.argmax(axis=1),
+                          weights.shape[1])
+        ends = weights.shape[1] - nonzeros[:, ::-1].argmax(axis=1)
+        self.bands = []
+        for i in range(0, weights.shape[0], int(group)):
+            j = min(i + int(group), weights.shape[0])
+            lo = int(starts[i:j].min())
+            hi = max(int(ends[i:j].max()), lo)
+            # (hi - lo, j - i) so the band is used as right operand
+            band = np.ascontiguousarray(weights[i:j, lo:hi].T)
+            band.flags.writeable = False
+            self.bands.append((i, j, lo, hi, band))
+
+    def toarray(self):
+        """ Return the dense filter bank [shape=(n_filters, n_bins)] """
+        weights = np.zeros(self.shape, dtype=self.dtype)
+        for i, j, lo, hi, band in self.bands:
+            weights[i:j, lo:hi] = band.T
+        return weights
+
+    def dot(self, x):
+        """ Same as `np.dot(weights, x.T).T`, every frame is multiplied
+        separately (see `rowwise_dot`)
+
+        Parameters
+        ----------
+        x: np.ndarray [shape=(t, n_bins)]
+            the (power) spectrogram
+
+        Return
+        ------
+        np.ndarray [shape=(t, n_filters)]
+        """
+        if x.ndim != 2 or x.shape[1] != self.shape[1]:
+            raise ValueError("Expect input with shape (t, %d), but given: %s" %
+                             (self.shape[1], str(x.shape)))
+        dtype = np.result_type(self.dtype, x.dtype)
+        out = np.empty((x.shape[0], self.shape[0]), dtype=dtype)
+        for start in range(0, x.shape[0], self.block):
+            x_ = x[start:start + self.block].astype(dtype)[:, None, :]
+            out_ = out[start:start + self.block]
+            for i, j, lo, hi, band in self.bands:
+                out_[:, i:j] = np.matmul(x_[:, :, lo:hi], band)[:, 0]
+        return out
+
+
+def rowwise_dot(x, w):
+    """ Same as `np.dot(x, w)`, but each row of `x` is multiplied by `w`
+    separately, hence, the result of a row does not depend on the other
+    rows (i.e. the output is identical whether the frames of multiple
+    utterances are processed in batch or one by one)
+
+    Parameters
+    ----------
+    x: np.ndarray [shape=(t, k)]
+    w: np.ndarray [shape=(k, n)]
+
+    Return
+    ------
+    np.ndarray [shape=(t, n)]
+    """
+    dtype = np.result_type(x.dtype, w.dtype)
+    return np.matmul(x.astype(dtype)[:, None, :], w)[:, 0]
+
+
+def get_mel_filters(sr, n_fft, n_mels=128, fmin=0.0, fmax=None):
+    """ Cached banded version of `mel_filters`, the number of cached filter
+    banks is bounded, return `BandedFilters` """
+    key = ('mel', int(sr), int(n_fft), int(n_mels), float(fmin),
+           None if fmax is None else float(fmax))
+    return _lru_get(_cached_filters, key,
+        lambda: BandedFilters(mel_filters(sr, n_fft=n_fft, n_mels=n_mels,
+                                          fmin=fmin, fmax=fmax)))
+
+
+def get_dct_filters(n_filters, n_input):
+    """ Cached version of `dct_filters`, the number of cached bases is
+    bounded, return read-only np.ndarray [shape=(n_filters, n_input)] """
+    def create():
+        basis = dct_filters(n_filters, n_input)
+        basis.flags.writeable = False
+        return basis
+    return _lru_get(_cached_filters, ('dct', int(n_filters), int(n_input)),
+                    create)
+
+
+def spectra_frequency_range(sr, fmin, fmax):
+    """ Return the (fmin, fmax) used by `spectra` for the mel filters """
+    # check fmax
+    if sr is None and fmax is None:
+        fmax = 4000
+    else:
+        fmax = sr // 2 if fmax is None else int(fmax)
+    # check fmin
+    fmin = int(fmin)
+    if fmin >= fmax:
+        raise ValueError("fmin must < fmax.")
+    return fmin, fmax
+
+
+def phase_spectrogram(S):
+    """ Delta of the phase of STFT matrix `S` [shape=(t, d)] """
+    phase = np.angle(S)
+    return compute_delta(phase, width=9, axis=0, order=1)[-1].astype('float32')
+
+
+def mel_spectrogram(spec, sr, n_fft, nb_melfilters, fmin, fmax):
+    """ Map the (power) spectrogram [shape=(t, 1 + n_fft/2)] onto
+    the mel basis, return [shape=(t, nb_melfilters)] """
+    mel_basis = get_mel_filters(sr, n_fft=n_fft, n_mels=int(nb_melfilters),
+                                fmin=fmin, fmax=fmax)
+    # (nb_samples; nb_mels)
+    return mel_basis.dot(spec)
+
+
+def cepstrum(mel_spec, nb_ceps, top_db=80.0):
+    """ Return the log mel-spectrogram and `nb_ceps` MFCCs (the first
+    coefficient is ignored) of the mel-spectrogram [shape=(t, nb_mels)] """
+    log_mel_spec = power2db(mel_spec, top_db=top_db)
+    return log_mel_spec, dct_cepstrum(log_mel_spec, nb_ceps)
+
+
+def dct_cepstrum(log_mel_spec, nb_ceps):
+    """ Return `nb_ceps` MFCCs (the first coefficient is ignored) of the
+    log mel-spectrogram [shape=(t, nb_mels)] """
+    dct_basis = get_dct_filters(int(nb_ceps) + 1, log_mel_spec.shape[1])
+    return rowwise_dot(log_mel_spec, dct_basis[1:].T)
+
+
 def spectra(sr, y=None, S=None,
             n_fft=256, hop_length=None, window='hann',
             nb_melfilters=None, nb_ceps=None,
             fmin=64, fmax=None,
             top_db=80.0, center=True, power=2.0, log=True,
-            preemphasis=None, backend='odin'):
+            preemphasis=None, get_phase=True, nthreads=1, backend='odin'):
     """Compute spectra information from STFT matrix or a power spectrogram,
     The extracted spectra include:
     * log-power spectrogram
@@ -1304,6 +2012,11 @@ def spectra(sr, y=None, S=None,
         if True, convert all power spectrogram to DB
     preemphasis: float `(0, 1)`, None
         pre-emphasis coefficience
+    get_phase: bool
+        if False, the phase is not computed, and only the magnitude of
+        the STFT is stored ('odin' backend)
+    nthreads: int
+        number of threads for the STFT ('odin' backend)
     backend: 'odin', 'sptk'
         support backend for calculating the spectra
 
@@ -1324,6 +2037,7 @@ def spectra(sr, y=None, S=None,
     mfcc = None
     log_mel_spec = None
     log_energy = None
+    phase = None
     # ====== sptk backend ====== #
     if backend == 'sptk':
         if y is None:
@@ -1365,43 +2079,31 @@ def spectra(sr, y=None, S=None,
         if S is None:
             S, log_energy = stft(y, n_fft=n_fft, hop_length=hop_length,
                                  window=window, preemphasis=preemphasis,
-                                 center=center, energy=True)
+                                 center=center, energy=True,
+                                 magnitude=not get_phase, nthreads=nthreads)
         n_fft = int(2 * (S.shape[1] - 1))
         # ====== check arguments ====== #
         power = int(power)
-        # check fmax
-        if sr is None and fmax is None:
-            fmax = 4000
-        else:
-            fmax = sr // 2 if fmax is None else int(fmax)
-        # check fmin
-        fmin = int(fmin)
-        if fmin >= fmax:
-            raise ValueError("fmin must < fmax.")
-        # ====== getting phase spectrogram ====== #
-        phase = np.angle(S)
-        phase = compute_delta(phase, width=9, axis=0, order=1
-            )[-1].astype('float32')
+        fmin, fmax = spectra_frequency_range(sr, fmin, fmax)
         # ====== extract the basic spectrogram ====== #
         if 'complex' in str(S.dtype): # STFT
+            # ====== getting phase spectrogram ====== #
+            if get_phase:
+                phase = phase_spectrogram(S)
             spec = np.abs(S)
+        else: # magnitude spectrogram
+            spec = S
         if power > 1:
             spec = np.power(spec, power)
         # ====== extrct mel-filter-bands features ====== #
         if nb_melfilters is not None or nb_ceps is not None:
-            mel_basis = mel_filters(sr, n_fft=n_fft,
-                n_mels=24 if nb_melfilters is None else int(nb_melfilters),
+            mel_spec = mel_spectrogram(spec, sr, n_fft,
+                nb_melfilters=24 if nb_melfilters is None else nb_melfilters,
                 fmin=fmin, fmax=fmax)
-            # transpose to (nb_samples; nb_mels)
-            mel_spec = np.dot(mel_basis, spec.T)
-            mel_spec = mel_spec.T
         # ====== extract cepstrum features ====== #
         # extract MFCC
         if nb_ceps is not None:
-            nb_ceps = int(nb_ceps) + 1
-            log_mel_spec = power2db(mel_spec, top_db=top_db)
-            dct_basis = dct_filters(nb_ceps, log_mel_spec.shape[1])
-            mfcc = np.dot(dct_basis, log_mel_spec.T)[1:, :].T
+            log_mel_spec, mfcc = cepstrum(mel_spec, nb_ceps, top_db=top_db)
         # applying log to convert to db
         if log:
             spec = power2db(spec, top_db=top_db)
@@ -1415,7 +2117,7 @@ def spectra(sr, y=None, S=None,
         mfcc = mfcc.astype('float32')
     results = {}
     results['spec'] = spec.astype('float32')
-    results['phase'] = phase.astype('float32')
+    results['phase'] = None if phase is None else phase.astype('float32')
     results['energy'] = log_energy
     results['mspec'] = mel_spec
     results['mfcc'] = mfcc
@@ -11,15 +11,20 @@ import os
 import six
 import math
 import copy
+import inspect
+import hashlib
 import warnings
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 
 import numpy as np
 
 from odin.utils import is_number, cache_memory, is_string
 from .signal import (pad_center, get_window, segment_axis, stft, istft,
-                     compute_delta, smooth, pre_emphasis, spectra,
-                     vad_energy, power2db, pitch_track)
+                     compute_delta, stack_deltas, smooth, pre_emphasis,
+                     spectra, vad_energy, power2db, pitch_track, get_vad_mode,
+                     spectra_frequency_range, phase_spectrogram,
+                     mel_spectrogram, cepstrum, dct_cepstrum, get_stft,
+                     OnlineVAD, StreamingDelta)
 
 # ===========================================================================
 # Predefined variables of speech datasets
@@ -160,6 +165,46 @@ def read(path_or_file, pcm=False, remove_dc_offset=True, remove_zeros=True,
     return s, sr
 
 
+def read_length(path_or_file, pcm=False, remove_zeros=True, blocksize=65536):
+    '''
+    Number of samples of the waveform returned by `read`, the length is
+    given by the header, the zeros are counted by reading the file block
+    by block (the whole file is never decoded into memory)
+
+    Return
+    ------
+    number of samples (int), sample rate (int)
+    '''
+    if pcm or \
+    (is_string(path_or_file) and '.pcm' in path_or_file.lower()) or \
+    (isinstance(path_or_file, file) and '.pcm' in path_or_file.name.lower()):
+        s, sr = (np.memmap(path_or_file, dtype=np.int16, mode='r'), None)
+    else:
+        import soundfile
+        f = open(path_or_file, 'r') if is_string(path_or_file) else path_or_file
+        try:
+            info = soundfile.SoundFile(f)
+            sr = info.samplerate
+            if remove_zeros: # same as `read`, all channels are flattened
+                n = sum(int(np.count_nonzero(b))
+                        for b in info.blocks(blocksize=blocksize,
+                                             dtype='float32'))
+            else:
+                n = info.frames
+            info.close()
+            f.close()
+            return n, sr
+        except Exception as e:
+            if '.sph' in f.name.lower():
+                f.seek(0)
+                s, sr = (np.memmap(f, dtype=np.int16, mode='r'), None)
+            else:
+                raise e
+        f.close()
+    n = int(np.count_nonzero(s)) if remove_zeros else len(s)
+    return n, sr
+
+
 def audio_duration(fpath, sr=None, bitdepth=None):
     """ Estimate audio length in second """
     if sr is None or bitdepth is None:
@@ -265,6 +310,179 @@ def __to_separated_indices(idx, min_distance=1, min_length=8):
     return [(s[0], s[-1] + 1) for s in segments if len(s) >= min_length]
 
 
+# ===========================================================================
+# Feature cache
+# ===========================================================================
+class FeatureCache(object):
+    """ Content-addressed cache for the expensive intermediate stages of
+    `speech_features`, every entry is keyed by the digest of the signal
+    (i.e. the audio file and the segment) and only the parameters which
+    affect given stage, hence, changing e.g. `nb_ceps` reuses the cached
+    mel-spectrogram, and adding `get_pitch` reuses the cached STFT.
+
+    Stages
+    ------
+    'stft': magnitude spectrogram
+    'energy': log energy of each frame
+    'phase': phase spectrogram
+    'mspec': linear mel-spectrogram (before taking the log)
+    'vad': voice activities (before smoothing)
+    'pitch', 'f0': output of `pitch_track`
+
+    Parameters
+    ----------
+    path: str
+        path to the cache folder
+    stages: list of str, or None
+        only these stages are stored, if None, store all stages
+
+    Note
+    ----
+    Each entry is stored in a separated `.npy` file, written to a temporary
+    file then renamed, so the cache can be shared by multiple processes.
+    """
+
+    STAGES = ('stft', 'energy', 'phase', 'mspec', 'vad', 'pitch', 'f0')
+
+    def __init__(self, path, stages=None):
+        super(FeatureCache, self).__init__()
+        self.path = os.path.abspath(path)
+        if os.path.isfile(self.path):
+            raise ValueError("Cache path must be a folder: %s" % self.path)
+        if stages is None:
+            stages = FeatureCache.STAGES
+        stages = tuple(str(i) for i in stages)
+        for s in stages:
+            if s not in FeatureCache.STAGES:
+                raise ValueError("Unknown stage: '%s', supported stages: %s" %
+                                 (s, ', '.join(FeatureCache.STAGES)))
+        self.stages = stages
+        # statistics of the current process
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_key(s, sr):
+        """ Digest of the raw signal and its sample rate """
+        h = hashlib.sha1(('%d:%s:' % (int(sr), str(s.dtype))).encode('utf-8'))
+        h.update(np.ascontiguousarray(s))
+        return h.hexdigest()
+
+    def _get_path(self, stage, content, params):
+        h = hashlib.sha1(('%s:%s' % (stage, content)).encode('utf-8'))
+        for p in params:
+            if isinstance(p, np.ndarray):
+                h.update(np.ascontiguousarray(p))
+            else:
+                h.update(repr(p).encode('utf-8'))
+        key = h.hexdigest()
+        return os.path.join(self.path, stage, key[:2], key + '.npy')
+
+    def get(self, stage, content, params):
+        """ Return the cached array, or None if not found """
+        if stage not in self.stages:
+            return None
+        path = self._get_path(stage, content, params)
+        if os.path.exists(path):
+            try:
+                x = np.load(path)
+                self.hits += 1
+                return x
+            except Exception: # corrupted entry, computed again
+                pass
+        self.misses += 1
+        return None
+
+    def set(self, stage, content, params, x):
+        if stage not in self.stages:
+            return x
+        path = self._get_path(stage, content, params)
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            try:
+                os.makedirs(folder)
+            except OSError: # created by other process
+                pass
+        tmp_path = path + '.%d.tmp' % os.getpid()
+        with open(tmp_path, 'wb') as f:
+            np.save(f, x)
+        os.rename(tmp_path, path)
+        return x
+
+    def clear(self, stage=None):
+        """ Remove all entries of given stage, or the whole cache """
+        import shutil
+        path = self.path if stage is None else os.path.join(self.path, stage)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+    def __str__(self):
+        return '<FeatureCache: %s stages:%s hits:%d misses:%d>' % \
+            (self.path, ','.join(self.stages), self.hits, self.misses)
+
+
+def _cached_spectra(cache, content, sr, y, n_fft, hop_length, window,
+                    nb_melfilters, nb_ceps, fmin, fmax, power, log,
+                    center, preemphasis, get_spec, get_phase,
+                    nthreads=1, top_db=80.0):
+    """ Same as `spectra` with 'odin' backend, the STFT is only performed
+    if one of the required stages is missing in the `cache` """
+    power = int(power)
+    fmin, fmax = spectra_frequency_range(sr, fmin, fmax)
+    stft_params = (int(sr), int(n_fft), int(hop_length), window,
+                   bool(center), preemphasis)
+    get_mel = nb_melfilters is not None or nb_ceps is not None
+    mel_params = stft_params + (
+        24 if nb_melfilters is None else int(nb_melfilters),
+        fmin, fmax, power)
+    # ====== load the cached stages ====== #
+    log_energy = cache.get('energy', content, stft_params)
+    phase = cache.get('phase', content, stft_params) if get_phase else None
+    mel_spec = cache.get('mspec', content, mel_params) if get_mel else None
+    get_spec = get_spec or (get_mel and mel_spec is None)
+    spec = cache.get('stft', content, stft_params) if get_spec else None
+    # ====== only perform STFT if necessary ====== #
+    if log_energy is None or (get_spec and spec is None) or \
+    (get_phase and phase is None):
+        magnitude = not get_phase or phase is not None
+        S, energy = stft(y, n_fft=n_fft, hop_length=hop_length,
+                         window=window, preemphasis=preemphasis,
+                         center=center, energy=True,
+                         magnitude=magnitude, nthreads=nthreads)
+        if log_energy is None:
+            log_energy = cache.set('energy', content, stft_params, energy)
+        if get_spec and spec is None:
+            spec = cache.set('stft', content, stft_params,
+                             S if magnitude else np.abs(S))
+        if not magnitude:
+            phase = cache.set('phase', content, stft_params,
+                              phase_spectrogram(S))
+        del S
+    # ====== spectrogram ====== #
+    if spec is not None and power > 1:
+        spec = np.power(spec, power)
+    if get_mel and mel_spec is None:
+        mel_spec = cache.set('mspec', content, mel_params,
+            mel_spectrogram(spec, sr, n_fft, nb_melfilters=mel_params[-4],
+                            fmin=fmin, fmax=fmax))
+    # ====== cepstrum ====== #
+    log_mel_spec = None
+    mfcc = None
+    if nb_ceps is not None:
+        log_mel_spec, mfcc = cepstrum(mel_spec, nb_ceps, top_db=top_db)
+    if log:
+        if spec is not None:
+            spec = power2db(spec, top_db=top_db)
+        if mel_spec is not None:
+            mel_spec = log_mel_spec if log_mel_spec is not None else \
+                power2db(mel_spec, top_db=top_db)
+    return {'spec': None if spec is None else spec.astype('float32'),
+            'phase': phase,
+            'energy': log_energy,
+            'mspec': None if mel_spec is None else mel_spec.astype('float32'),
+            'mfcc': None if mfcc is None else mfcc.astype('float32')}
+
+
 def speech_features(s, sr=None,
                     win=0.02, hop=0.01, window='hann',
                     nb_melfilters=None, nb_ceps=None,
@@ -276,7 +494,8 @@ def speech_features(s, sr=None,
                     vad_smooth=3, vad_minlen=0.1,
                     cqt_bins=96, preemphasis=None,
                     center=True, power=2, log=True,
-                    return_raw=False, backend='odin'):
+                    return_raw=False, backend='odin', cache=None,
+                    nthreads=1):
     """ Automatically extract multiple acoustic representation of
     speech features
 
@@ -352,6 +571,12 @@ def speech_features(s, sr=None,
         if True, return downsampled raw signal
     backend: 'odin', 'sptk'
         support backend for calculating the spectra
+    cache: str, `FeatureCache`, or None
+        if given, the STFT, mel-spectrogram, VAD and pitch are read from
+        (or stored to) the cache, and only the stages whose parameters
+        changed are computed (only for 'odin' backend)
+    nthreads: int
+        number of threads for the STFT of long signals ('odin' backend)
 
     Return
     ------
@@ -372,6 +597,24 @@ def speech_features(s, sr=None,
     }
     (txd): time x features
     """
+    s, sr = _load_signal(s, sr, sr_new)
+    return _speech_features(s, sr, None, win=win, hop=hop, window=window,
+        nb_melfilters=nb_melfilters, nb_ceps=nb_ceps,
+        get_spec=get_spec, get_qspec=get_qspec, get_phase=get_phase,
+        get_pitch=get_pitch, get_f0=get_f0,
+        get_vad=get_vad, get_energy=get_energy, get_delta=get_delta,
+        fmin=fmin, fmax=fmax,
+        pitch_threshold=pitch_threshold, pitch_fmax=pitch_fmax,
+        pitch_algo=pitch_algo,
+        vad_smooth=vad_smooth, vad_minlen=vad_minlen,
+        cqt_bins=cqt_bins, preemphasis=preemphasis,
+        center=center, power=power, log=log,
+        return_raw=return_raw, backend=backend, cache=cache,
+        nthreads=nthreads)
+
+
+def _load_signal(s, sr, sr_new):
+    """ Return the float32 1-D signal and its sample rate """
     from odin.fuel import Data
     # file path
     if is_string(s):
@@ -394,13 +637,16 @@ def speech_features(s, sr=None,
     if sr_new is not None and int(sr_new) != int(sr):
         s = resample(s, sr, sr_new, axis=0, best_algorithm=False)
         sr = sr_new
-    # ====== check other info ====== #
+    return s, sr
+
+
+def _frame_config(sr, win, hop, fmin, fmax):
+    """ Return the `fmin`, `fmax`, `n_fft` and `hop_length` used by
+    `speech_features` """
     if fmax is None:
         fmax = sr // 2
     if fmin is None or fmin < 0 or fmin >= fmax:
         fmin = 0
-    if pitch_fmax is None:
-        pitch_fmax = fmax
     win_length = int(win * sr)
     # n_fft must be 2^x
     n_fft = 2 ** int(np.ceil(np.log2(win_length)))
@@ -408,18 +654,51 @@ def speech_features(s, sr=None,
         hop_length = int(hop * sr) # hop_length must be 2^x
     else:
         hop_length = n_fft // 4
+    return fmin, fmax, n_fft, hop_length
+
+
+def _speech_features(s, sr, feat, win, hop, window,
+                     nb_melfilters, nb_ceps,
+                     get_spec, get_qspec, get_phase, get_pitch, get_f0,
+                     get_vad, get_energy, get_delta, fmin, fmax,
+                     pitch_threshold, pitch_fmax, pitch_algo,
+                     vad_smooth, vad_minlen, cqt_bins, preemphasis,
+                     center, power, log, return_raw, backend, cache,
+                     nthreads):
+    """ `speech_features` of the loaded signal, `feat` is the output
+    of `spectra` if it was already computed, otherwise, None """
+    # ====== feature cache ====== #
+    content = None
+    if cache is not None:
+        if is_string(cache):
+            cache = FeatureCache(cache)
+        elif not isinstance(cache, FeatureCache):
+            raise ValueError("`cache` must be path or FeatureCache, but "
+                             "given: %s" % str(type(cache)))
+        content = FeatureCache.content_key(s, sr)
+    # ====== check other info ====== #
+    fmin, fmax, n_fft, hop_length = _frame_config(sr, win, hop, fmin, fmax)
+    if pitch_fmax is None:
+        pitch_fmax = fmax
     # nb_ceps += 1 # increase one so we can ignore the first MFCC
     # ====== 5: extract pitch features ====== #
+    def _pitch(otype):
+        params = (int(sr), hop_length, fmin, pitch_fmax, pitch_threshold,
+                  pitch_algo)
+        x = None if cache is None else cache.get(otype, content, params)
+        if x is None:
+            x = pitch_track(s, sr, hop_length, fmin=fmin,
+                fmax=pitch_fmax, threshold=pitch_threshold, otype=otype,
+                algorithm=pitch_algo).reshape(-1, 1)
+            if cache is not None:
+                cache.set(otype, content, params, x)
+        return x
     pitch_freq = None
     if get_pitch:
-        pitch_freq = pitch_track(s, sr, hop_length, fmin=fmin,
-            fmax=pitch_fmax, threshold=pitch_threshold, otype='pitch',
-            algorithm=pitch_algo).reshape(-1, 1)
+        pitch_freq = _pitch('pitch')
     f0_freq = None
     if get_f0:
-        f0_freq = pitch_track(s, sr, hop_length, fmin=fmin,
-            fmax=pitch_fmax, threshold=pitch_threshold, otype='f0',
-            algorithm=pitch_algo).reshape(-1, 1)
+        f0_freq = _pitch('f0')
     # ====== 0: extract Constant Q-transform ====== #
     q_melspectrogram = None
     q_mfcc = None
@@ -451,30 +730,43 @@ def speech_features(s, sr=None,
         qphase = Q['phase']
     # ====== 1: extract STFT and Spectrogram ====== #
     # no padding for center
-    feat = spectra(sr=sr, y=s, n_fft=n_fft, hop_length=hop_length,
-                   window=window, nb_melfilters=nb_melfilters,
-                   nb_ceps=nb_ceps, fmin=fmin, fmax=fmax,
-                   power=power, log=log, center=center,
-                   preemphasis=preemphasis, backend=backend)
+    if feat is not None: # computed by `speech_features_batch`
+        pass
+    elif cache is not None and str(backend) == 'odin':
+        feat = _cached_spectra(cache, content, sr=sr, y=s, n_fft=n_fft,
+                               hop_length=hop_length, window=window,
+                               nb_melfilters=nb_melfilters, nb_ceps=nb_ceps,
+                               fmin=fmin, fmax=fmax, power=power, log=log,
+                               center=center, preemphasis=preemphasis,
+                               get_spec=get_spec, get_phase=get_phase,
+                               nthreads=nthreads)
+    else:
+        feat = spectra(sr=sr, y=s, n_fft=n_fft, hop_length=hop_length,
+                       window=window, nb_melfilters=nb_melfilters,
+                       nb_ceps=nb_ceps, fmin=fmin, fmax=fmax,
+                       power=power, log=log, center=center,
+                       preemphasis=preemphasis, get_phase=get_phase,
+                       nthreads=nthreads, backend=backend)
     # ====== 4: extract spectrogram ====== #
     spec = feat['spec']
     mspec = feat['mspec'] if 'mspec' in feat else None
     mfcc = feat['mfcc'] if 'mfcc' in feat else None
     log_energy = feat['energy'][:, None] # always 2D
+    nb_frames = len(log_energy)
     # ====== adjust the length of pitch and f0 equal to spec ====== #
     if pitch_freq is not None:
-        if len(pitch_freq) > len(spec):
-            n = len(pitch_freq) - len(spec)
+        if len(pitch_freq) > nb_frames:
+            n = len(pitch_freq) - nb_frames
             pitch_freq = pitch_freq[n // 2:-int(np.ceil(n / 2))]
-        elif len(pitch_freq) < len(spec):
-            _ = len(spec) - len(pitch_freq)
+        elif len(pitch_freq) < nb_frames:
+            _ = nb_frames - len(pitch_freq)
             pitch_freq = np.pad(pitch_freq, ((0, _), (0, 0)), mode='constant')
     if f0_freq is not None:
-        if len(f0_freq) > len(spec):
-            n = len(f0_freq) - len(spec)
+        if len(f0_freq) > nb_frames:
+            n = len(f0_freq) - nb_frames
             f0_freq = f0_freq[n // 2:-int(np.ceil(n / 2))]
-        elif len(f0_freq) < len(spec):
-            _ = len(spec) - len(f0_freq)
+        elif len(f0_freq) < nb_frames:
+            _ = nb_frames - len(f0_freq)
             f0_freq = np.pad(f0_freq, ((0, _), (0, 0)), mode='constant')
     # ====== 3: extract VAD ====== #
     vad = None
@@ -483,9 +775,16 @@ def speech_features(s, sr=None,
         distribNb, nbTrainIt = 3, 24
         if is_number(get_vad) and get_vad >= 2:
             distribNb = int(get_vad)
-        vad, vad_threshold = vad_energy(log_energy.ravel(), distrib_nb=distribNb,
-                                        nb_train_it=nbTrainIt)
-        vad = vad.astype('uint8')
+        vad_params = (int(sr), n_fft, hop_length, window, bool(center),
+                      preemphasis, distribNb, nbTrainIt, get_vad_mode())
+        vad = None if cache is None else cache.get('vad', content, vad_params)
+        if vad is None:
+            vad, vad_threshold = vad_energy(log_energy.ravel(),
+                                            distrib_nb=distribNb,
+                                            nb_train_it=nbTrainIt)
+            vad = vad.astype('uint8')
+            if cache is not None:
+                cache.set('vad', content, vad_params, vad)
         if vad_smooth:
             vad_smooth = 3 if int(vad_smooth) == 1 else vad_smooth
             # at least 2 voice frames
@@ -499,39 +798,26 @@ def speech_features(s, sr=None,
     if get_delta and get_delta > 0:
         get_delta = int(get_delta)
         if log_energy is not None:
-            log_energy = np.concatenate(
-                [log_energy] + compute_delta(log_energy, order=get_delta),
-                axis=1)
+            log_energy = stack_deltas(log_energy, order=get_delta, axis=-1)
         # STFT
         if mspec is not None:
-            mspec = np.concatenate(
-                [mspec] + compute_delta(mspec, order=get_delta),
-                axis=1)
+            mspec = stack_deltas(mspec, order=get_delta, axis=-1)
         if mfcc is not None:
-            mfcc = np.concatenate(
-                [mfcc] + compute_delta(mfcc, order=get_delta),
-                axis=1)
+            mfcc = stack_deltas(mfcc, order=get_delta, axis=-1)
         # Q-transform
         if q_melspectrogram is not None:
-            q_melspectrogram = np.concatenate(
-                [q_melspectrogram] + compute_delta(q_melspectrogram, order=get_delta),
-                axis=1)
+            q_melspectrogram = stack_deltas(q_melspectrogram,
+                                            order=get_delta, axis=-1)
         if q_mfcc is not None:
-            q_mfcc = np.concatenate(
-                [q_mfcc] + compute_delta(q_mfcc, order=get_delta),
-                axis=1)
+            q_mfcc = stack_deltas(q_mfcc, order=get_delta, axis=-1)
         # Pitch and F0
         if get_pitch:
-            pitch_freq = np.concatenate(
-                [pitch_freq] + compute_delta(pitch_freq, order=get_delta),
-                axis=1)
+            pitch_freq = stack_deltas(pitch_freq, order=get_delta, axis=-1)
         if get_f0:
-            f0_freq = np.concatenate(
-                [f0_freq] + compute_delta(f0_freq, order=get_delta),
-                axis=1)
+            f0_freq = stack_deltas(f0_freq, order=get_delta, axis=-1)
     # ====== 8: make sure CQT give the same length with STFT ====== #
-    if get_qspec and qspec.shape[0] > spec.shape[0]:
-        n = qspec.shape[0] - spec.shape[0]
+    if get_qspec and qspec.shape[0] > nb_frames:
+        n = qspec.shape[0] - nb_frames
         qspec = qspec[n // 2:-int(np.ceil(n / 2))]
         if qphase is not None:
             qphase = qphase[n // 2:-int(np.ceil(n / 2))]
@@ -559,3 +845,387 @@ def speech_features(s, sr=None,
         ('vadids', vad_ids if get_vad else None),
         ('raw', s if return_raw else None)
     ])
+
+
+def _batch_spectra(ys, sr, n_fft, hop_length, window,
+                   nb_melfilters, nb_ceps, fmin, fmax, power, log,
+                   center, preemphasis, get_phase, top_db=80.0):
+    """ Same as calling `spectra` ('odin' backend) on each signal of `ys`,
+    but the STFT, power, mel filter banks and DCT are applied on the
+    frames of all signals at once """
+    engine = get_stft(n_fft=n_fft, hop_length=hop_length, window=window,
+                      center=center, preemphasis=preemphasis)
+    S, log_energy, lengths = engine.batch(ys, energy=True,
+                                          magnitude=not get_phase)
+    ends = np.cumsum(lengths)
+    segments = list(zip(ends - lengths, ends))
+    power = int(power)
+    fmin, fmax = spectra_frequency_range(sr, fmin, fmax)
+    # ====== basic spectrogram ====== #
+    phase = None
+    if get_phase:
+        phase = [phase_spectrogram(S[start:end]) for start, end in segments]
+        spec = np.abs(S)
+    else:
+        spec = S
+    del S
+    if power > 1:
+        spec = np.power(spec, power)
+    # ====== mel-filter banks and cepstrum ====== #
+    mel_spec = None
+    log_mel_spec = None
+    mfcc = None
+    if nb_melfilters is not None or nb_ceps is not None:
+        mel_spec = mel_spectrogram(spec, sr, n_fft,
+            nb_melfilters=24 if nb_melfilters is None else nb_melfilters,
+            fmin=fmin, fmax=fmax)
+        # the clipping of `power2db` depends on each utterance
+        if log or nb_ceps is not None:
+            log_mel_spec = np.empty_like(mel_spec)
+            for start, end in segments:
+                log_mel_spec[start:end] = power2db(mel_spec[start:end],
+                                                   top_db=top_db)
+        if nb_ceps is not None:
+            mfcc = dct_cepstrum(log_mel_spec, nb_ceps).astype('float32')
+        mel_spec = (log_mel_spec if log else mel_spec).astype('float32')
+    # ====== split the results ====== #
+    results = []
+    for i, (start, end) in enumerate(segments):
+        s = spec[start:end]
+        if log:
+            s = power2db(s, top_db=top_db)
+        results.append({
+            'spec': s.astype('float32'),
+            'phase': None if phase is None else phase[i],
+            'energy': log_energy[start:end],
+            'mspec': None if mel_spec is None else mel_spec[start:end],
+            'mfcc': None if mfcc is None else mfcc[start:end]})
+    return results
+
+
+def speech_features_batch(signals, sr=None, **kwargs):
+    """ Batched version of `speech_features` for multiple utterances,
+    the STFT, mel filter banks, MFCCs and energy of all utterances with
+    the same sample rate are computed at once, then split back for each
+    utterance. The output is identical to calling `speech_features` on
+    each utterance.
+
+    Parameters
+    ----------
+    signals: list of (np.ndarray, str, or Data)
+        raw signal, or path to audio file of each utterance
+    sr: int, list of int, or None
+        the sample rate of all utterances, or of each utterance
+    **kwargs:
+        the arguments of `speech_features`
+
+    Return
+    ------
+    list of OrderedDict, features of each utterance (see `speech_features`)
+
+    Note
+    ----
+    The STFT is not batched for 'sptk' backend or if `cache` is given.
+    """
+    spec = inspect.getargspec(speech_features)
+    params = OrderedDict(zip(spec.args[-len(spec.defaults):], spec.defaults))
+    del params['sr']
+    for name, value in six.iteritems(kwargs):
+        if name not in params:
+            raise ValueError("Unknown argument for `speech_features`: %s" %
+                             name)
+        params[name] = value
+    sr_new = params.pop('sr_new')
+    if not isinstance(sr, (tuple, list)):
+        sr = [sr] * len(signals)
+    if len(sr) != len(signals):
+        raise ValueError("Given %d signals but %d sample rates" %
+                         (len(signals), len(sr)))
+    signals = [_load_signal(s, sr_, sr_new) for s, sr_ in zip(signals, sr)]
+    feats = [None] * len(signals)
+    # ====== batched spectra for the same sample rate ====== #
+    if str(params['backend']) == 'odin' and params['cache'] is None:
+        groups = defaultdict(list)
+        for i, (s, sr_) in enumerate(signals):
+            groups[sr_].append(i)
+        for sr_, ids in six.iteritems(groups):
+            fmin, fmax, n_fft, hop_length = _frame_config(sr_,
+                params['win'], params['hop'], params['fmin'], params['fmax'])
+            results = _batch_spectra([signals[i][0] for i in ids], sr=sr_,
+                n_fft=n_fft, hop_length=hop_length, window=params['window'],
+                nb_melfilters=params['nb_melfilters'],
+                nb_ceps=params['nb_ceps'], fmin=fmin, fmax=fmax,
+                power=params['power'], log=params['log'],
+                center=params['center'], preemphasis=params['preemphasis'],
+                get_phase=params['get_phase'])
+            for i, f in zip(ids, results):
+                feats[i] = f
+    return [_speech_features(s, sr_, f, **params)
+            for (s, sr_), f in zip(signals, feats)]
+
+
+# ===========================================================================
+# Streaming
+# ===========================================================================
+class SpeechFeatureStream(object):
+    """ Stateful feature extractor for long or live audio, the signal is
+    consumed in chunks (of any size), the overlap of the frames is carried
+    between chunks, and the feature frames are returned as soon as they
+    are available, hence, the memory does not grow with the duration.
+
+    The frames of 'spec', 'mspec', 'mfcc', 'energy' and their deltas are
+    the same as `speech_features`, except:
+
+     * the clipping of the log-power spectrogram (`top_db`) is relative to
+       the running maximum instead of the maximum of the whole utterance.
+     * the deltas are computed along the time axis (as
+       `_append_energy_and_deltas`) by `StreamingDelta`, hence, the frames
+       are delayed by `latency` frames.
+     * the voice activities are detected by `OnlineVAD`, and smoothed by
+       a centered window (`vad_smooth`), there is no 'vadids'.
+     * 'phase', 'qspec', 'pitch' and 'f0' are not supported.
+
+    Parameters
+    ----------
+    sr: int
+        sample rate of the audio (no resampling is performed)
+    vad_init: float (in second)
+        duration of audio for initializing the online VAD
+    vad_forget: float `(0, 1)`
+        forgetting factor of the online VAD statistics
+    top_db: float, or None
+        threshold the output at `top_db` below the running maximum
+    (the other arguments are the same as `speech_features`)
+
+    Example
+    -------
+    >>> stream = SpeechFeatureStream(sr=16000, nb_melfilters=40, nb_ceps=13,
+    ...                              get_delta=2)
+    >>> for chunk in chunks:
+    ...     feat = stream.process(chunk) # OrderedDict of the new frames
+    >>> feat = stream.flush() # the last frames, then reset the stream
+    """
+
+    def __init__(self, sr, win=0.02, hop=0.01, window='hann',
+                 nb_melfilters=None, nb_ceps=None,
+                 get_spec=True, get_vad=True, get_energy=False,
+                 get_delta=False, fmin=64, fmax=None, vad_smooth=3,
+                 vad_init=0.5, vad_forget=0.995, preemphasis=None,
+                 center=True, power=2, log=True, top_db=80.0):
+        super(SpeechFeatureStream, self).__init__()
+        self.sr = sr
+        fmin, fmax, n_fft, hop_length = _frame_config(sr, win, hop,
+                                                      fmin, fmax)
+        self.fmin, self.fmax = spectra_frequency_range(sr, fmin, fmax)
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.center = bool(center)
+        self.engine = get_stft(n_fft=n_fft, hop_length=hop_length,
+                               window=window, center=center,
+                               preemphasis=preemphasis)
+        self.nb_melfilters = nb_melfilters
+        self.nb_ceps = nb_ceps
+        self.get_spec = bool(get_spec)
+        self.get_vad = bool(get_vad)
+        self.get_energy = bool(get_energy)
+        self.get_delta = int(get_delta) if get_delta else 0
+        self.power = int(power)
+        self.log = bool(log)
+        self.top_db = top_db
+        if vad_smooth:
+            vad_smooth = 3 if int(vad_smooth) == 1 else int(vad_smooth)
+        self.vad_smooth = int(vad_smooth) if vad_smooth else 0
+        self.vad_init = max(int(vad_init * sr / hop_length), 2)
+        self.vad_forget = vad_forget
+        if len(self.feature_names) == 0:
+            raise ValueError("No features is extracted.")
+        self.reset()
+
+    @property
+    def feature_names(self):
+        names = []
+        if self.get_spec:
+            names.append('spec')
+        if self.get_energy:
+            names.append('energy')
+        if self.nb_melfilters is not None:
+            names.append('mspec')
+        if self.nb_ceps is not None:
+            names.append('mfcc')
+        if self.get_vad:
+            names.append('vad')
+        return names
+
+    @property
+    def latency(self):
+        """ Maximum number of frames between the frame and its output
+        (excluding the initialization of the VAD) """
+        delay = 0
+        if self.get_delta:
+            delay = StreamingDelta(order=self.get_delta).delay
+        if self.get_vad:
+            delay = max(delay, self.vad_smooth // 2)
+        return delay
+
+    def reset(self):
+        """ Discard all the state, and start a new utterance """
+        self.nb_samples = 0 # number of consumed samples
+        self.nb_frames = 0 # number of emitted frames
+        self._signal = np.empty((0,), dtype='float32') # not framed samples
+        self._tail = np.empty((0,), dtype='float32') # for the end padding
+        self._last_sample = None # for pre-emphasis
+        self._started = not self.center # the begin padding is added
+        self._max_db = {'spec': -np.inf, 'mspec': -np.inf}
+        self._deltas = {name: StreamingDelta(width=9, order=self.get_delta)
+                        for name in ('energy', 'mspec', 'mfcc')} \
+            if self.get_delta else {}
+        self._vad = OnlineVAD(nb_init=self.vad_init,
+                              forget=self.vad_forget) \
+            if self.get_vad else None
+        self._vad_context = None # labels of the VAD smoothing window
+        self._queues = OrderedDict([(name, [])
+                                    for name in self.feature_names])
+
+    # ==================== helpers ==================== #
+    def _power2db(self, x, name):
+        log_spec = power2db(x, top_db=None)
+        if self.top_db is not None and len(log_spec) > 0:
+            self._max_db[name] = max(self._max_db[name], log_spec.max())
+            log_spec = np.maximum(log_spec, self._max_db[name] - self.top_db)
+        return log_spec
+
+    def _smooth_vad(self, vad, final):
+        if self.vad_smooth == 0:
+            return vad
+        win = self.vad_smooth
+        if self._vad_context is None:
+            if len(vad) == 0:
+                return vad
+            # repeat the first label
+            self._vad_context = np.repeat(vad[:1], win // 2)
+        labels = np.concatenate([self._vad_context, vad])
+        if final and len(labels) > 0:
+            labels = np.concatenate(
+                [labels, np.repeat(labels[-1:], win - 1 - win // 2)])
+        if len(labels) < win:
+            self._vad_context = labels
+            return np.empty((0,), dtype='uint8')
+        # at least 2 voice frames
+        vad = np.convolve(labels.astype('int32'), np.ones(win, 'int32'),
+                          mode='valid') >= 2
+        self._vad_context = labels[len(labels) - win + 1:]
+        return vad.astype('uint8')
+
+    def _push(self, name, x, final=False):
+        if name in self._deltas:
+            delta = self._deltas[name]
+            x = delta.process(x)
+            if final:
+                x_ = delta.flush()
+                if x_ is not None:
+                    x = np.concatenate([x, x_], axis=0)
+        if name in self._queues:
+            self._queues[name].append(x)
+
+    def _pop(self):
+        queues = [np.concatenate(q, axis=0) if len(q) > 0 else None
+                  for q in self._queues.values()]
+        n = min(0 if q is None else q.shape[0] for q in queues)
+        results = OrderedDict()
+        for name, q in zip(self._queues.keys(), queues):
+            if q is None:
+                self._queues[name] = []
+                results[name] = None
+            else:
+                self._queues[name] = [q[n:]]
+                results[name] = q[:n]
+        self.nb_frames += n
+        return results
+
+    def _extract(self, final):
+        # ====== framing ====== #
+        n = self._signal.shape[0]
+        nb_frames = 0 if n < self.n_fft else \
+            1 + (n - self.n_fft) // self.hop_length
+        if nb_frames > 0:
+            frames = segment_axis(
+                self._signal[:self.n_fft + (nb_frames - 1) * self.hop_length],
+                frame_length=self.n_fft, hop_length=self.hop_length,
+                end='cut')
+            self._signal = self._signal[nb_frames * self.hop_length:]
+        else:
+            frames = np.empty((0, self.n_fft), dtype='float32')
+        # ====== spectra ====== #
+        spec, log_energy = self.engine.transform(frames, energy=True,
+                                                 magnitude=True)
+        if self.power > 1:
+            spec = np.power(spec, self.power)
+        mel_spec = None
+        log_mel_spec = None
+        if self.nb_melfilters is not None or self.nb_ceps is not None:
+            mel_spec = mel_spectrogram(spec, self.sr, self.n_fft,
+                nb_melfilters=24 if self.nb_melfilters is None
+                else self.nb_melfilters,
+                fmin=self.fmin, fmax=self.fmax)
+            if self.log or self.nb_ceps is not None:
+                log_mel_spec = self._power2db(mel_spec, 'mspec')
+        if self.nb_ceps is not None:
+            self._push('mfcc', dct_cepstrum(log_mel_spec, self.nb_ceps
+                                            ).astype('float32'), final)
+        if self.nb_melfilters is not None:
+            self._push('mspec', (log_mel_spec if self.log else mel_spec
+                                 ).astype('float32'), final)
+        if self.get_spec:
+            if self.log:
+                spec = self._power2db(spec, 'spec')
+            self._push('spec', spec.astype('float32'))
+        if self.get_energy:
+            self._push('energy', log_energy[:, None], final)
+        # ====== voice activities ====== #
+        if self._vad is not None:
+            vad = self._vad.process(log_energy)
+            if final:
+                vad = np.concatenate([vad, self._vad.flush()])
+            self._push('vad', self._smooth_vad(vad, final))
+        return self._pop()
+
+    # ==================== main methods ==================== #
+    def process(self, s):
+        """ Feed a chunk of the signal, return OrderedDict of the new
+        frames of each feature (all features have the same number of
+        frames) """
+        s = np.asarray(s).ravel().astype('float32')
+        self.nb_samples += s.shape[0]
+        if s.shape[0] > 0:
+            # pre-emphasis, the first sample is kept
+            coeff = self.engine.preemphasis
+            if coeff is not None:
+                if self._last_sample is None:
+                    s_ = pre_emphasis(s, coeff=coeff)
+                else:
+                    s_ = s - coeff * np.append(self._last_sample, s[:-1])
+                self._last_sample = s[-1]
+                s = s_
+            half = self.n_fft // 2
+            self._tail = np.concatenate([self._tail, s])[-(half + 1):]
+            self._signal = np.concatenate([self._signal, s])
+            # padding the begin of the signal by reflection
+            if not self._started and self._signal.shape[0] > half:
+                self._signal = np.concatenate(
+                    [self._signal[half:0:-1], self._signal])
+                self._started = True
+        return self._extract(final=False)
+
+    def flush(self):
+        """ Return the last frames of the utterance (the end of the signal
+        is padded), then reset the stream """
+        half = self.n_fft // 2
+        if not self._started: # short signal
+            if self._signal.shape[0] > 0:
+                self._signal = np.pad(self._signal, half, mode='reflect')
+        elif self.center:
+            self._signal = np.concatenate(
+                [self._signal, self._tail[-2::-1][:half]])
+        results = self._extract(final=True)
+        self.reset()
+        return results
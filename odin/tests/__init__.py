@@ -8,6 +8,7 @@ def run(device='gpu'):
         # 'utils_test',
         # 'signal_test',
         # 'fuel_test',
+        # 'ml_test',
         # 'backend_test',
         # 'save_test',
         'nnet_test',
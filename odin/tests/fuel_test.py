@@ -4,6 +4,8 @@
 from __future__ import print_function, division
 
 import os
+import wave
+import shutil
 import unittest
 from six.moves import zip, range
 
@@ -75,6 +77,32 @@ test_speech_features = {
 }
 
 
+def _write_wav_corpus(path, nb_files=8, sr=8000, seed=1208):
+    """ Write `nb_files` random 16-bit wav files of 0.3 to 1.2 second """
+    if not os.path.exists(path):
+        os.mkdir(path)
+    rng = np.random.RandomState(seed)
+    files = []
+    for i in range(nb_files):
+        x = (rng.randn(int(sr * rng.uniform(0.3, 1.2))) * 3000).astype('int16')
+        files.append(os.path.join(path, 'utt%02d.wav' % i))
+        f = wave.open(files[-1], 'wb')
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(x.tostring())
+        f.close()
+    return files
+
+
+def _speech_processor(segments, output_path, **kwargs):
+    kwargs_ = dict(audio_ext='wav', win=0.02, hop=0.01, nb_melfilters=24,
+                   nb_ceps=13, get_spec=True, get_energy=True, get_vad=False,
+                   get_delta=1, dtype='float32', ncpu=1)
+    kwargs_.update(kwargs)
+    return F.SpeechProcessor(segments, output_path, **kwargs_)
+
+
 class FuelTest(unittest.TestCase):
 
     def setUp(self):
@@ -146,6 +174,197 @@ class FuelTest(unittest.TestCase):
                     is_equal(np.sum(ds[i].components_),
                      test_speech_features[i]))
 
+    def test_dataset_archive(self):
+        with utils.TemporaryDirectory() as temppath:
+            path = os.path.join(temppath, 'ds')
+            X = np.random.rand(120, 256).astype('float32')
+            for fmt in ('zip', 'odar'):
+                # the shards are stored inside and outside the dataset
+                shard_paths = [path, os.path.join(temppath, 'disk')]
+                os.mkdir(path)
+                os.mkdir(shard_paths[1])
+                ds = F.Dataset(path, shard_paths=shard_paths)
+                ds['X'] = X
+                ds[('S', 'sharded')] = X[:60]
+                ds['S'].append(X[60:])
+                self.assertTrue(all(n > 0 for p, n in ds['S'].shards))
+                ds['indices'] = {'name%d' % i: (i, i + 1) for i in range(12)}
+                ds['labels'] = ['a', 'b', 'c']
+                # small chunks, the memmap is split into many chunks
+                archive_path = os.path.abspath(
+                    ds.archive(fmt=fmt, ncpu=2, chunk_size=0.01))
+                self.assertTrue(os.path.isfile(archive_path))
+                ds.close()
+                shutil.rmtree(path)
+                shutil.rmtree(shard_paths[1])
+                # extract the archive
+                ds = F.Dataset(archive_path)
+                self.assertEqual(ds.path, path)
+                self.assertEqual(sorted(ds.keys()),
+                                 ['S', 'X', 'indices', 'labels'])
+                self.assertTrue(np.all(ds['X'][:] == X))
+                self.assertTrue(np.all(ds['S'][:] == X))
+                self.assertTrue(all(os.path.dirname(p) == path
+                                    for p, n in ds['S'].shards))
+                self.assertEqual(ds.verify(), {'X': [], 'S': []})
+                self.assertEqual(ds['indices']['name3'], (3, 4))
+                self.assertEqual(ds['labels'], ['a', 'b', 'c'])
+                ds.wait_extracted()
+                ds.close()
+                shutil.rmtree(path)
+                os.remove(archive_path)
+
+    def test_speech_processor_parallel(self):
+        with utils.TemporaryDirectory() as temppath:
+            files = _write_wav_corpus(os.path.join(temppath, 'wav'), 12)
+            paths = [os.path.join(temppath, 'ncpu%d' % i) for i in (1, 3)]
+            for ncpu, path in zip((1, 3), paths):
+                _speech_processor(files, path, ncpu=ncpu).run()
+            ref, ds = [F.Dataset(path, read_only=True) for path in paths]
+            # the order of segments could be different
+            self.assertEqual(sorted(ds['indices'].keys()),
+                             sorted(ref['indices'].keys()))
+            for feat_name in ('spec', 'energy', 'mfcc'):
+                self.assertEqual(ds[feat_name].shape, ref[feat_name].shape)
+                for name, (start, end) in ref['indices'].iteritems():
+                    start_, end_ = ds['indices'][name]
+                    self.assertTrue(np.all(ref[feat_name][start:end] ==
+                                           ds[feat_name][start_:end_]))
+                for stats in ('_sum1', '_sum2', '_mean', '_std'):
+                    self.assertTrue(np.allclose(ref[feat_name + stats][:],
+                                                ds[feat_name + stats][:]))
+            for feat_name in ('spec', 'mfcc'):
+                pca1, pca2 = ref[feat_name + '_pca'], ds[feat_name + '_pca']
+                self.assertEqual(pca1.n_samples_seen_, pca2.n_samples_seen_)
+                self.assertTrue(np.allclose(pca1.mean_, pca2.mean_))
+                self.assertTrue(np.allclose(pca1.explained_variance_,
+                                            pca2.explained_variance_))
+                # the leading components are well separated
+                self.assertTrue(np.allclose(np.abs(pca1.components_[:4]),
+                                            np.abs(pca2.components_[:4]),
+                                            atol=1e-5))
+            ref.close()
+            ds.close()
+
+    def test_validate_segments(self):
+        from odin.fuel.features import _checked_segments
+        indices = [('name%d' % i, i * 10, i * 10 + 10) for i in range(100)]
+        # all segments are checked
+        samples, checked = _checked_segments(indices, None, 8)
+        self.assertEqual(len(samples), 8)
+        self.assertEqual(checked, list(range(100)))
+        # only the sampled and the corrupted segments
+        samples, checked = _checked_segments(indices, [(15, 21), (995, 996)], 3)
+        self.assertEqual(checked, sorted(set(samples) | set([1, 2, 99])))
+        samples, checked = _checked_segments(indices, [], 200)
+        self.assertEqual(checked, list(range(100)))
+
+    def test_speech_processor_rerun(self):
+        with utils.TemporaryDirectory() as temppath:
+            files = _write_wav_corpus(os.path.join(temppath, 'wav'), 6)
+            path = os.path.join(temppath, 'feat')
+            # segment of the "sr" dict left by a crashed run is not merged
+            os.mkdir(path)
+            seg = F.MmapDictSegment(os.path.join(path, 'sr'))
+            seg['stale'] = 1
+            seg.close()
+            # run again into an existing dataset, plain and incremental
+            for incremental in (False, False, True, True):
+                _speech_processor(files, path).run(incremental=incremental)
+                ds = F.Dataset(path, read_only=True)
+                self.assertEqual(len(ds['indices']), 6)
+                self.assertFalse('stale' in ds['sr'])
+                end = max(end for start, end in ds['indices'].values())
+                self.assertTrue(end <= len(ds['mfcc']))
+                ds.close()
+
+    def test_speech_processor_incremental_stats(self):
+        def check_statistics(path, nb_segments):
+            ds = F.Dataset(path, read_only=True)
+            self.assertEqual(len(ds['indices']), nb_segments)
+            for name in ('spec', 'mfcc'):
+                x = np.concatenate([ds[name][start:end]
+                    for start, end in ds['indices'].values()]).astype('float64')
+                self.assertTrue(np.allclose(ds[name + '_sum1'][:], x.sum(0),
+                                            rtol=1e-4))
+                self.assertTrue(np.allclose(ds[name + '_mean'][:], x.mean(0),
+                                            rtol=1e-4, atol=1e-4))
+                self.assertTrue(np.allclose(ds[name + '_std'][:], x.std(0),
+                                            rtol=1e-4, atol=1e-4))
+                self.assertTrue(np.allclose(ds[name + '_pca'].mean_,
+                                            x.mean(0), rtol=1e-4, atol=1e-4))
+            ds.close()
+
+        with utils.TemporaryDirectory() as temppath:
+            files = _write_wav_corpus(os.path.join(temppath, 'wav'), 6)
+            path = os.path.join(temppath, 'feat')
+            # broken file is ignored, and processed again after fixed
+            with open(files[3], 'rb') as f:
+                wav = f.read()
+            with open(files[3], 'wb') as f:
+                f.write('broken')
+            _speech_processor(files[:4], path,
+                              ignore_error=True).run(incremental=True)
+            check_statistics(path, 3)
+            with open(files[3], 'wb') as f:
+                f.write(wav)
+            _speech_processor(files[:4], path).run(incremental=True)
+            check_statistics(path, 4)
+            # added files
+            _speech_processor(files, path).run(incremental=True)
+            check_statistics(path, 6)
+            # modified source
+            os.remove(files[0])
+            _write_wav_corpus(os.path.join(temppath, 'new'), 1, seed=12)
+            shutil.move(os.path.join(temppath, 'new', 'utt00.wav'), files[0])
+            mtime = os.path.getmtime(files[0]) + 10
+            os.utime(files[0], (mtime, mtime))
+            _speech_processor(files, path).run(incremental=True)
+            check_statistics(path, 6)
+
+    def test_speech_processor_direct_write(self):
+        with utils.TemporaryDirectory() as temppath:
+            files = _write_wav_corpus(os.path.join(temppath, 'wav'), 6)
+            ref_path = os.path.join(temppath, 'ref')
+            path = os.path.join(temppath, 'feat')
+            _speech_processor(files, ref_path).run()
+            feat = _speech_processor(files, path)
+            feat.run(direct_write=True, incremental=True)
+            # the last jobs are interrupted, their preallocated rows are reused
+            ds = F.Dataset(path)
+            nb_rows = len(ds['mfcc'])
+            progress = feat._load_progress()
+            stats = (progress['sum1'], progress['sum2'], progress['count'],
+                     progress['pca_stats'])
+            for f in files[-2:]:
+                mtime, ranges = progress['sources'].pop(f)
+                feat._update_statistics(ds, ranges, stats, sign=-1)
+                for name in ranges:
+                    del ds['indices'][name]
+            ds['indices'].flush(save_indices=True)
+            feat._save_progress(progress)
+            ds.close()
+            _speech_processor(files, path).run(direct_write=True,
+                                               incremental=True)
+            # same features as processed normally
+            ref = F.Dataset(ref_path, read_only=True)
+            ds = F.Dataset(path, read_only=True)
+            self.assertEqual(len(ds['mfcc']), nb_rows)
+            self.assertEqual(len(ds['indices']), len(ref['indices']))
+            self.assertEqual(ds.verify(full=True).values(),
+                             [[]] * len(ds.verify(full=True)))
+            for name, (start, end) in ref['indices'].iteritems():
+                start_, end_ = ds['indices'][name]
+                for feat_name in ('spec', 'energy', 'mfcc'):
+                    self.assertTrue(np.allclose(ref[feat_name][start:end],
+                                                ds[feat_name][start_:end_]))
+            for feat_name in ('spec', 'mfcc'):
+                self.assertTrue(np.allclose(ref[feat_name + '_mean'][:],
+                                            ds[feat_name + '_mean'][:],
+                                            rtol=1e-4, atol=1e-4))
+            ref.close()
+            ds.close()
+
     def test_feeders(self):
         with utils.TemporaryDirectory() as temppath:
             np.random.seed(1208251813)
@@ -237,8 +456,248 @@ class FuelTest(unittest.TestCase):
             self.assertEqual(X, REF)
             self.assertEqual(n, ds['X'].shape[0])
 
+    def test_data_gather(self):
+        with utils.TemporaryDirectory() as temppath:
+            X = np.arange(0, 3000).reshape(-1, 3).astype('float32')
+            x = F.MmapData(os.path.join(temppath, 'X'), dtype='float32',
+                           shape=X.shape)
+            x.prepend(X)
+            indices = np.random.RandomState(1208).randint(-1000, 1000, 250)
+            for data in (F.NdarrayData(X), x):
+                self.assertTrue(np.all(data.gather(indices) == X[indices]))
+                self.assertTrue(np.all(
+                    data.gather(indices, max_gap=8, ncpu=2) == X[indices]))
+                self.assertTrue(np.all(data[indices] == X[indices]))
+                # list of bool is a mask, not the row indices 0 and 1
+                mask = (X[:, 0] % 2 == 0).tolist()
+                self.assertTrue(np.all(data[mask] == X[np.array(mask)]))
+                self.assertTrue(np.all(data[[long(1), 3]] == X[[1, 3]]))
+            x.close()
+
+    def test_data_attach(self):
+        from odin.fuel import data as D
+        with utils.TemporaryDirectory() as temppath:
+            X = np.arange(0, 300).reshape(-1, 3).astype('float32')
+            x = F.MmapData(os.path.join(temppath, 'X'), dtype='float32',
+                           shape=X.shape)
+            x.prepend(X)
+            y = x.shared()
+            self.assertTrue(isinstance(y, F.AttachedMmapData))
+            self.assertTrue(np.all(y[:] == X))
+            self.assertTrue(x.path in D._SHARED_MMAP)
+            # the hints and the checksums act on the shared memmap
+            self.assertTrue(y.advise('random') is y)
+            y.warm(20, 80).get()
+            self.assertEqual(y.verify(full=True), [])
+            self.assertRaises(RuntimeError, y.resize, (200, 3))
+            self.assertTrue(F.MmapData.attach(x.path)._data is y._data)
+            # evicted on close, the attached handle is still valid
+            x.close()
+            self.assertFalse(x.path in D._SHARED_MMAP)
+            self.assertTrue(np.all(y[:] == X))
+
+    def test_feeder_advise(self):
+        with utils.TemporaryDirectory() as temppath:
+            X = np.arange(0, 600).reshape(-1, 3).astype('float32')
+            x = F.MmapData(os.path.join(temppath, 'X'), dtype='float32',
+                           shape=X.shape)
+            x.prepend(X)
+            indices = [('name%d' % i, i * 20, i * 20 + 20) for i in range(10)]
+            feeder = F.Feeder(x, indices, ncpu=2, buffer_size=2)
+            # the hints are given in the workers, recorded to a file
+            record = os.path.join(temppath, 'advise')
+            advise = F.AttachedMmapData.advise
+
+            def recorder(self, pattern, start=None, end=None):
+                with open(record, 'a') as f:
+                    f.write('%s %s %s\n' % (pattern, start, end))
+                return advise(self, pattern, start, end)
+            F.AttachedMmapData.advise = recorder
+            try:
+                for seed, pattern in ((None, 'sequential'), (12, 'random')):
+                    if os.path.exists(record):
+                        os.remove(record)
+                    y = np.concatenate(list(feeder.set_batch(
+                        16, seed=seed, shuffle_level=0)))
+                    self.assertEqual(sorted(y.ravel().tolist()),
+                                     X.ravel().tolist())
+                    with open(record, 'r') as f:
+                        calls = [line.split() for line in f]
+                    self.assertEqual(calls[0], [pattern, 'None', 'None'])
+                    self.assertEqual(
+                        sorted((int(i[1]), int(i[2])) for i in calls[1:]),
+                        [(start, end) for name, start, end in indices])
+            finally:
+                F.AttachedMmapData.advise = advise
+            x.close()
+
+    def test_data_checksum(self):
+        with utils.TemporaryDirectory() as temppath:
+            path = os.path.join(temppath, 'X')
+            X = np.random.rand(2000, 1024).astype('float32')
+            x = F.MmapData(path, dtype='float32', shape=(1, 1024))
+            x.append(X)
+            self.assertEqual(x.verify(), [])
+            x.close()
+            # corrupt one row on disk
+            x = F.MmapData(path)
+            x._data[1500, 12] += 1.
+            x._data.flush()
+            self.assertEqual(x.verify(), []) # verified chunks are skipped
+            start, end = x.verify(full=True, ncpu=2)[0]
+            self.assertTrue(start <= 1500 < end)
+            x.close()
+            # read-only handle never writes the checksum file
+            os.remove(x.checksum_path)
+            x = F.MmapData(path, read_only=True)
+            self.assertEqual(x.verify(), [])
+            self.assertFalse(os.path.exists(x.checksum_path))
+            x.close()
+
+    def test_lazy_data(self):
+        with utils.TemporaryDirectory() as temppath:
+            X = np.random.rand(1200, 3).astype('float32')
+            x = F.MmapData(os.path.join(temppath, 'X'), dtype='float32',
+                           shape=X.shape)
+            x.prepend(X)
+            mean, std = X.mean(0), X.std(0)
+            y = (x - mean) / std
+            self.assertTrue(isinstance(y, F.LazyData))
+            self.assertTrue(isinstance(mean - x, F.LazyData))
+            self.assertTrue(np.allclose(np.sqrt(x), np.sqrt(X)))
+            self.assertTrue(np.allclose(x.apply(np.sqrt)[:], np.sqrt(X)))
+            self.assertEqual(y.shape, X.shape)
+            self.assertTrue(np.allclose(y[:], (X - mean) / std))
+            self.assertTrue(np.allclose(y.mean(0), 0., atol=1e-4))
+            self.assertTrue(np.allclose(
+                np.concatenate(list(y.set_batch(100, seed=None))),
+                (X - mean) / std))
+            x.close()
+
+    def test_sharded_data(self):
+        with utils.TemporaryDirectory() as temppath:
+            shard_paths = [os.path.join(temppath, 'disk%d' % i) for i in range(3)]
+            for p in shard_paths:
+                os.mkdir(p)
+            X = np.random.rand(1200, 3).astype('float32')
+            path = os.path.join(temppath, 'X')
+            x = F.ShardedData(path, shard_paths=shard_paths, dtype='float32',
+                              shape=(None, 3), policy='round_robin')
+            x.append(X[:500], X[500:501], X[501:])
+            self.assertEqual(x.shape, X.shape)
+            self.assertTrue(all(n > 0 for p, n in x.shards))
+            x.close()
+            # reopen from the descriptor
+            x = F.ShardedData(path, read_only=True)
+            indices = np.random.RandomState(1208).randint(-1200, 1200, 250)
+            self.assertTrue(np.all(x[:] == X))
+            self.assertTrue(np.all(x[3:1100:7] == X[3:1100:7]))
+            self.assertTrue(np.all(x[indices] == X[indices]))
+            self.assertTrue(np.all(
+                np.concatenate(list(x.set_batch(128, seed=None))) == X))
+            x.close()
+            # the thread pool is created for each number of threads
+            from odin.fuel.data import _shard_pool
+            for ncpu in (2, 3):
+                x = F.ShardedData(path, read_only=True, ncpu=ncpu)
+                self.assertTrue(np.all(x[indices] == X[indices]))
+                self.assertEqual(_shard_pool(ncpu)._processes, ncpu)
+                x.close()
+
+    def test_data_iterator(self):
+        X1 = F.NdarrayData(np.zeros(shape=(500, 2), dtype='float32'))
+        X2 = F.NdarrayData(np.ones(shape=(100, 2), dtype='float32'))
+        it = F.DataIterator([X1, X2]).set_mode(distribution=[1., 3.])
+        it.set_batch(batch_size=80, seed=1208, shuffle_level=2)
+        n = 0
+        for x in it:
+            # exact proportion in every batch: 500 zeros / 300 ones
+            self.assertEqual(np.sum(x[:, 0] == 1) * 5, np.sum(x[:, 0] == 0) * 3)
+            n += x.shape[0]
+        self.assertEqual(n, len(it))
+        self.assertEqual(n, 800)
+        # shuffle_level=0: the order of sources and the rows inside each
+        # batch are kept, only the order of batches is shuffled
+        X1 = F.NdarrayData(np.arange(0, 500).reshape(-1, 1).astype('float32'))
+        X2 = F.NdarrayData(np.arange(500, 600).reshape(-1, 1).astype('float32'))
+        it = F.DataIterator([X1, X2]).set_mode(sequential=True)
+        it.set_batch(batch_size=50, seed=1208, shuffle_level=0)
+        batches = [x.ravel() for x in it]
+        self.assertTrue(all(np.all(np.diff(x) == 1) for x in batches))
+        x = np.concatenate(batches)
+        self.assertTrue(np.all(x[:500] < 500) and np.all(x[500:] >= 500))
+        self.assertEqual(sorted(x.tolist()), list(range(600)))
+        self.assertFalse(np.all(np.diff(x) == 1)) # batches are shuffled
+
+    def test_mmapdict(self):
+        with utils.TemporaryDirectory() as temppath:
+            path = os.path.join(temppath, 'dict')
+            REF = {'key%d' % i: [i, i * 2] for i in range(5000)}
+            d = F.MmapDict(path, cache_size=1200)
+            d.update(REF)
+            d.close()
+            # re-open from the binary index
+            d = F.MmapDict(path, read_only=True)
+            self.assertEqual(len(d), len(REF))
+            self.assertEqual(dict(d.items()), REF)
+            keys = ['key4999', 'key0', 'none', 'key12']
+            self.assertEqual(d.get_many(keys, missing='default'),
+                             [REF['key4999'], REF['key0'], None, REF['key12']])
+            self.assertEqual(d.get_many(keys, missing='skip'),
+                             [REF['key4999'], REF['key0'], REF['key12']])
+            self.assertRaises(KeyError, d.get_many, keys)
+            # LRU read cache
+            d.set_read_cache_size(0.01)
+            for i in range(3):
+                self.assertEqual(d['key12'], REF['key12'])
+            self.assertEqual(d.read_cache_stats['hits'], 2)
+            self.assertEqual(d.read_cache_stats['misses'], 1)
+            self.assertRaises(RuntimeError, d.put_many, {'key0': 0})
+            d.close()
+            # ndarray values are stored as raw buffer
+            X = np.random.rand(25, 8).astype('float32')
+            d = F.MmapDict(path)
+            d['X'] = X
+            d.flush()
+            self.assertTrue(np.all(d['X'] == X))
+            self.assertEqual(d['X'].dtype, X.dtype)
+            d.close()
+
     def test_dataset(self):
-        pass
+        with utils.TemporaryDirectory() as temppath:
+            path = os.path.join(temppath, 'ds')
+            X = np.random.rand(120, 8).astype('float32')
+            Y = np.arange(300).reshape(-1, 3).astype('int32')
+            ds = F.Dataset(path)
+            ds['X'] = X
+            ds[('Y', 'hdf5')] = Y
+            ds['indices'] = {'name%d' % i: (i, i + 1) for i in range(12)}
+            ds['labels'] = ['a', 'b', 'c']
+            ds.flush()
+            ds.close()
+            # re-open from the manifest
+            ds = F.Dataset(path, read_only=True)
+            self.assertTrue(os.path.exists(ds.manifest_path))
+            self.assertEqual(sorted(ds.keys()),
+                             ['X', 'Y', 'indices', 'labels'])
+            self.assertTrue(np.all(ds['X'][:] == X))
+            self.assertTrue(np.all(ds['Y'][:] == Y))
+            self.assertEqual(ds['indices']['name3'], (3, 4))
+            self.assertEqual(len(ds['indices']), 12)
+            self.assertEqual(ds['labels'], ['a', 'b', 'c'])
+            ds.close()
+            # the handle is shared and closed by other code
+            ds = F.Dataset(path)
+            ds['X'].append(X)
+            indices = ds['indices']
+            self.assertTrue(indices is F.MmapDict(indices.path))
+            indices.close()
+            ds.flush()
+            ds.close()
+            ds = F.Dataset(path, read_only=True)
+            self.assertEqual(ds['X'].shape, (240, 8))
+            self.assertEqual(len(ds['indices']), 12)
+            ds.close()
 
 
 if __name__ == '__main__':
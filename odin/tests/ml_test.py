@@ -0,0 +1,89 @@
+# ======================================================================
+# Author: TrungNT
+# ======================================================================
+from __future__ import print_function, division
+
+import unittest
+
+import numpy as np
+
+from odin import fuel as F
+from odin.ml import MiniBatchPCA
+
+
+def _same_components(pca1, pca2):
+    # the sign of each component is fixed by `svd_flip`
+    return np.allclose(np.abs(pca1.components_), np.abs(pca2.components_),
+                       atol=1e-6)
+
+
+class MLTest(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(1208)
+        # correlated features with non-zero mean
+        self.X = (np.dot(np.random.randn(2000, 8), np.random.randn(8, 8)) +
+                  np.arange(8)).astype('float64')
+
+    def test_pca_compute_statistics(self):
+        X = self.X
+        n, sum1, scatter = MiniBatchPCA.compute_statistics(X)
+        self.assertEqual(n, X.shape[0])
+        self.assertTrue(np.allclose(sum1, X.sum(0)))
+        self.assertTrue(np.allclose(scatter, np.dot(X.T, X)))
+        # also accept Data
+        for i, j in zip(MiniBatchPCA.compute_statistics(F.NdarrayData(X)),
+                        (n, sum1, scatter)):
+            self.assertTrue(np.allclose(i, j))
+        # the statistics of batches are summed
+        stats = [MiniBatchPCA.compute_statistics(x)
+                 for x in np.split(X, [300, 1100])]
+        self.assertEqual(sum(s[0] for s in stats), n)
+        self.assertTrue(np.allclose(sum(s[1] for s in stats), sum1))
+        self.assertTrue(np.allclose(sum(s[2] for s in stats), scatter))
+
+    def test_pca_fit_statistics(self):
+        X = self.X
+        pca1 = MiniBatchPCA()
+        for x in np.split(X, 4):
+            pca1.partial_fit(x)
+        pca2 = MiniBatchPCA().fit_statistics(
+            *MiniBatchPCA.compute_statistics(X))
+        self.assertTrue(pca2.is_fitted)
+        self.assertEqual(pca1.n_samples_seen_, pca2.n_samples_seen_)
+        self.assertTrue(np.allclose(pca1.mean_, pca2.mean_))
+        self.assertTrue(np.allclose(pca1.var_, pca2.var_))
+        self.assertTrue(np.allclose(pca1.explained_variance_,
+                                    pca2.explained_variance_))
+        self.assertTrue(_same_components(pca1, pca2))
+
+    def test_pca_statistics_and_merge(self):
+        X = self.X
+        stats = MiniBatchPCA.compute_statistics(X)
+        # exact statistics of a model fitted by `partial_fit`, all
+        # components are kept
+        pca1 = MiniBatchPCA()
+        for x in np.split(X, 4):
+            pca1.partial_fit(x)
+        for i, j in zip(pca1.statistics, stats):
+            self.assertTrue(np.allclose(i, j))
+        # merge a model, or the statistics computed by another process
+        pca2 = MiniBatchPCA().partial_fit(X[:1000])
+        pca2.merge(MiniBatchPCA().partial_fit(X[1000:]))
+        pca3 = MiniBatchPCA().fit_statistics(
+            *MiniBatchPCA.compute_statistics(X[:500]))
+        pca3.merge(MiniBatchPCA.compute_statistics(X[500:]))
+        for pca in (pca2, pca3):
+            self.assertEqual(pca.n_samples_seen_, X.shape[0])
+            self.assertTrue(np.allclose(pca.mean_, pca1.mean_))
+            self.assertTrue(np.allclose(pca.explained_variance_,
+                                        pca1.explained_variance_))
+            self.assertTrue(_same_components(pca, pca1))
+        # samples cached by `partial_fit` (less samples than features)
+        pca4 = MiniBatchPCA().partial_fit(X[:1000])
+        pca4.partial_fit(X[1000:1004])
+        self.assertEqual(pca4.statistics[0], 1004)
+        self.assertTrue(np.allclose(pca4.statistics[1], X[:1004].sum(0)))
+
+if __name__ == '__main__':
+    print(' odin.tests.run() to run these tests ')
@@ -4,7 +4,9 @@
 from __future__ import print_function, division
 
 import os
+import shutil
 import unittest
+from tempfile import mkdtemp
 from six.moves import zip, range, cPickle
 
 import numpy as np
@@ -39,3 +41,175 @@ class SignalTest(unittest.TestCase):
             self.assertTrue(np.allclose(y1, y2))
         except ImportError:
             print("test_stft_istft require librosa.")
+
+    def test_stft_engine(self):
+        from scipy import fftpack
+        from scipy.signal import get_window
+
+        def stft_ref(y, n_fft, hop_length, window, center, preemphasis):
+            # full complex FFT of each windowed frame
+            if preemphasis is not None:
+                y = np.append(y[0], y[1:] - preemphasis * y[:-1])
+            if center:
+                y = np.pad(y, n_fft // 2, mode='reflect')
+            nb_frames = 1 + (len(y) - n_fft) // hop_length
+            frames = np.array([y[i * hop_length:i * hop_length + n_fft]
+                               for i in range(nb_frames)])
+            frames = frames * get_window(window, n_fft, fftbins=True)
+            energy = np.log((frames**2).sum(axis=1)).astype('float32')
+            D = fftpack.fft(frames, axis=1)[:, :1 + n_fft // 2].conj()
+            return D.astype('complex64'), energy
+
+        np.random.seed(12082518)
+        y = np.random.randn(8000 * 3).astype('float32')
+        for n_fft, hop_length, window, center, preemphasis in [
+                (256, 80, 'hann', True, None),
+                (512, 160, 'hamming', False, 0.97),
+                (400, 100, ('kaiser', 4.), True, None)]:
+            D, E = signal.stft(y, n_fft=n_fft, hop_length=hop_length,
+                               window=window, center=center,
+                               preemphasis=preemphasis, energy=True)
+            D_, E_ = stft_ref(y, n_fft, hop_length, window, center,
+                              preemphasis)
+            self.assertEqual(D.dtype, np.complex64)
+            self.assertEqual(D.shape, D_.shape)
+            self.assertTrue(np.allclose(D, D_, rtol=1e-4, atol=1e-4))
+            self.assertTrue(np.allclose(E, E_))
+            # magnitude and multi-threading
+            M = signal.stft(y, n_fft=n_fft, hop_length=hop_length,
+                            window=window, center=center,
+                            preemphasis=preemphasis, magnitude=True)
+            self.assertEqual(M.dtype, np.float32)
+            self.assertTrue(np.array_equal(M, np.abs(D)))
+            engine = signal.STFT(n_fft=n_fft, hop_length=hop_length,
+                                 window=window, center=center,
+                                 preemphasis=preemphasis)
+            engine.block_size = 7 # force multiple blocks
+            self.assertTrue(np.array_equal(engine(y, nthreads=3), D))
+
+    def test_filter_banks(self):
+        np.random.seed(12082518)
+        for sr, n_fft, n_mels, fmin, fmax in [(8000, 256, 24, 64, None),
+                                              (16000, 512, 40, 20, 7600),
+                                              (16000, 512, 80, 0, None)]:
+            weights = signal.mel_filters(sr, n_fft, n_mels, fmin, fmax)
+            banded = signal.get_mel_filters(sr, n_fft, n_mels, fmin, fmax)
+            self.assertTrue(banded is
+                signal.get_mel_filters(sr, n_fft, n_mels, fmin, fmax))
+            self.assertTrue(np.array_equal(banded.toarray(), weights))
+            spec = np.random.rand(2500, 1 + n_fft // 2).astype('float32')
+            self.assertTrue(np.allclose(banded.dot(spec),
+                                        np.dot(weights, spec.T).T))
+        dct = signal.get_dct_filters(14, 40)
+        self.assertTrue(dct is signal.get_dct_filters(14, 40))
+        self.assertTrue(np.array_equal(dct, signal.dct_filters(14, 40)))
+        # bounded registry
+        for n_mels in range(10, 100):
+            signal.get_dct_filters(13, n_mels)
+        self.assertTrue(len(signal._cached_filters) <=
+                        signal._MAX_CACHED_PLANS)
+
+    def test_speech_features_batch(self):
+        np.random.seed(12082518)
+        signals = [np.random.randn(n).astype('float32')
+                   for n in np.random.randint(800, 24000, size=25)]
+        signals.append(np.random.randn(8000 * 60).astype('float32'))
+        for kwargs in [dict(nb_melfilters=40, nb_ceps=13, get_energy=True,
+                            get_delta=2),
+                       dict(nb_ceps=20, get_phase=True, power=1,
+                            preemphasis=0.97),
+                       dict(nb_melfilters=24, get_spec=False, log=False)]:
+            kwargs.update(sr=8000, get_vad=False)
+            batch = speech.speech_features_batch(signals, **kwargs)
+            self.assertEqual(len(batch), len(signals))
+            for s, feat in zip(signals, batch):
+                ref = speech.speech_features(s, **kwargs)
+                for name, x in ref.items():
+                    if x is None:
+                        self.assertTrue(feat[name] is None)
+                    else:
+                        self.assertEqual(x.dtype, feat[name].dtype)
+                        self.assertTrue(np.array_equal(x, feat[name]))
+
+    def test_feature_cache(self):
+        np.random.seed(12082518)
+        y = np.random.randn(8000 * 2).astype('float32')
+        kwargs = dict(sr=8000, nb_melfilters=24, nb_ceps=13, get_phase=True,
+                      get_vad=False, get_energy=True, get_delta=1)
+        path = mkdtemp()
+        try:
+            cache = speech.FeatureCache(path)
+            ref = speech.speech_features(y, **kwargs)
+            for i in range(2):
+                feat = speech.speech_features(y, cache=cache, **kwargs)
+                for name, x in ref.items():
+                    if x is None:
+                        self.assertTrue(feat[name] is None)
+                    else:
+                        self.assertTrue(np.array_equal(x, feat[name]))
+            self.assertEqual(cache.misses, 4) # stft, energy, phase, mspec
+            self.assertEqual(cache.hits, 4)
+            # only the MFCC changed, reuse the mel-spectrogram
+            kwargs.update(nb_ceps=20, get_spec=False, get_phase=False)
+            ref = speech.speech_features(y, **kwargs)
+            feat = speech.speech_features(y, cache=cache, **kwargs)
+            self.assertTrue(np.array_equal(ref['mfcc'], feat['mfcc']))
+            self.assertEqual(cache.misses, 4)
+        finally:
+            shutil.rmtree(path)
+
+    def test_speech_feature_stream(self):
+        np.random.seed(12082518)
+        y = np.random.randn(8000 * 3).astype('float32')
+        y[(np.arange(len(y)) // 2000) % 2 == 1] *= 0.01 # 0.25s of silence
+        kwargs = dict(sr=8000, nb_melfilters=24, nb_ceps=13, get_spec=True,
+                      get_energy=True, preemphasis=0.97, log=False)
+        ref = speech.speech_features(y, get_vad=False, **kwargs)
+        stream = speech.SpeechFeatureStream(get_vad=True, get_delta=2,
+                                            **kwargs)
+        feats = []
+        i = 0
+        while i < len(y):
+            n = np.random.randint(1, 1200)
+            feats.append(stream.process(y[i:i + n]))
+            i += n
+        feats.append(stream.flush())
+        for f in feats: # all features have the same number of frames
+            self.assertEqual(len(set(x.shape[0] for x in f.values())), 1)
+        for name, dim in (('spec', None), ('energy', 1),
+                          ('mspec', 24), ('mfcc', 13)):
+            x = np.concatenate([f[name] for f in feats], axis=0)
+            r = ref[name]
+            if dim is not None: # deltas along the time axis
+                r = np.concatenate(
+                    [r] + signal.compute_delta(r, order=2, axis=0), axis=1)
+            self.assertEqual(x.shape, r.shape)
+            self.assertTrue(np.allclose(x, r, atol=1e-5))
+        vad = np.concatenate([f['vad'] for f in feats])
+        self.assertEqual(vad.shape, (ref['spec'].shape[0],))
+        labels = (np.arange(len(vad)) // 25) % 2 == 0
+        self.assertTrue(np.mean(vad == labels) > 0.9)
+        # the stream is reset after flush
+        feat = stream.flush()
+        self.assertEqual(feat['spec'].shape[0], 0)
+
+    def test_stack_deltas(self):
+        np.random.seed(12082518)
+        x = np.random.rand(120, 13).astype('float32')
+        for order in (1, 2, 3):
+            ref = np.concatenate(
+                [x] + signal.compute_delta(x, order=order, axis=0), axis=1)
+            y = signal.stack_deltas(x, order=order)
+            self.assertEqual(y.shape, (120, 13 * (order + 1)))
+            self.assertTrue(np.allclose(y, ref, atol=1e-6))
+            # batch of utterances
+            y = signal.stack_deltas(np.stack([x, x[::-1]]), order=order)
+            self.assertTrue(np.allclose(y[0], ref, atol=1e-6))
+            self.assertTrue(np.allclose(
+                y[1], signal.stack_deltas(x[::-1], order=order), atol=1e-6))
+            # same axis for the deltas and the stack, only the deltas
+            ref = np.concatenate(
+                signal.compute_delta(x, order=order, axis=-1), axis=-1)
+            y = signal.stack_deltas(x, order=order, axis=-1,
+                                    keep_original=False)
+            self.assertTrue(np.allclose(y, ref, atol=1e-6))